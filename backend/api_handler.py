@@ -4,6 +4,14 @@ from datetime import datetime, timedelta
 import os
 import logging
 from boto3.dynamodb.conditions import Key
+from archive import get_archive
+from metrics import metrics
+from profiling import profiled
+from bar_aggregator import BASE_TIMEFRAME, TIMEFRAMES, bar_key
+from packed_market_data import MARKET_DATA_LAYOUT, candle_rows, read_range, read_recent
+from pattern_cache import expand_cache_item, fetch_predictions, from_dynamodb
+from request_coalescing import DynamoDBInFlightRegistry, LocalInFlightRegistry
+from symbol_registry import load_registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,12 +25,34 @@ PATTERN_CACHE_TABLE = os.environ['PATTERN_CACHE_TABLE']
 MARKET_DATA_TABLE = os.environ['MARKET_DATA_TABLE']
 PREDICTIONS_TABLE = os.environ['PREDICTIONS_TABLE']
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+INFLIGHT_TABLE = os.environ.get('INFLIGHT_TABLE')
+COALESCE_WINDOW_SECONDS = int(os.environ.get('COALESCE_WINDOW_SECONDS', 60))
+# Largest page of a start/end /market-data query (keeps responses under the 6MB Lambda limit)
+MARKET_DATA_RANGE_LIMIT = int(os.environ.get('MARKET_DATA_RANGE_LIMIT', 5000))
+# Route metric dimension values; anything else is reported as 'other' to bound cardinality
+METRIC_ROUTES = {'/predictions', '/patterns', '/market-data', '/analyze-chart'}
+
+# Shared across warm invocations; without INFLIGHT_TABLE only this container is deduplicated
+if INFLIGHT_TABLE:
+    inflight_registry = DynamoDBInFlightRegistry(dynamodb.Table(INFLIGHT_TABLE), COALESCE_WINDOW_SECONDS)
+else:
+    inflight_registry = LocalInFlightRegistry(COALESCE_WINDOW_SECONDS)
+
+# Lambda client reused across warm invocations; created on first use
+lambda_client = None
+
+def get_lambda_client():
+    global lambda_client
+    if lambda_client is None:
+        lambda_client = boto3.client('lambda')
+    return lambda_client
 
 class APIHandler:
     def __init__(self):
         self.pattern_cache_table = dynamodb.Table(PATTERN_CACHE_TABLE)
         self.market_data_table = dynamodb.Table(MARKET_DATA_TABLE)
         self.predictions_table = dynamodb.Table(PREDICTIONS_TABLE)
+        self.inflight_registry = inflight_registry
     
     def get_predictions(self, symbol=None, limit=10):
         """Get recent predictions"""
@@ -44,23 +74,43 @@ class APIHandler:
             return []
     
     def create_prediction_request(self, symbol):
-        """Trigger pattern analysis for a symbol"""
+        """Trigger pattern analysis for a symbol, attaching to an in-flight run if one exists
+        
+        The returned request_id is the run_id, which the analysis Lambda uses
+        as the prediction_id of the prediction it writes.
+        """
         try:
-            import boto3
-            lambda_client = boto3.client('lambda')
+            run_id, coalesced = self.inflight_registry.acquire(symbol)
+            
+            if coalesced:
+                logger.info(f"Coalesced analysis request for {symbol} into run {run_id}")
+                return {
+                    'message': f'Pattern analysis already in progress for {symbol}',
+                    'request_id': run_id,
+                    'coalesced': True,
+                    'coalescing_stats': dict(self.inflight_registry.stats)
+                }
             
             # Invoke pattern analysis Lambda
             function_name = f"cryptoai-analytics-pattern-analysis-{ENVIRONMENT}"
             
-            response = lambda_client.invoke(
-                FunctionName=function_name,
-                InvocationType='Event',  # Asynchronous
-                Payload=json.dumps({'symbol': symbol})
-            )
+            try:
+                response = get_lambda_client().invoke(
+                    FunctionName=function_name,
+                    InvocationType='Event',  # Asynchronous
+                    Payload=json.dumps({'symbol': symbol, 'run_id': run_id})
+                )
+            except Exception:
+                # Don't let later requests attach to a run that never started
+                self.inflight_registry.release(symbol, run_id)
+                raise
             
             return {
                 'message': f'Pattern analysis triggered for {symbol}',
-                'request_id': response['ResponseMetadata']['RequestId']
+                'request_id': run_id,
+                'invoke_request_id': response['ResponseMetadata']['RequestId'],
+                'coalesced': False,
+                'coalescing_stats': dict(self.inflight_registry.stats)
             }
             
         except Exception as e:
@@ -78,8 +128,13 @@ class APIHandler:
                                      Key('timestamp').gte(since_timestamp),
                 ScanIndexForward=False
             )
+            items = response.get('Items', [])
             
-            return response.get('Items', [])
+            # Schema 2 items reference their prediction; resolve them in batches
+            prediction_ids = [item['prediction_id'] for item in items if 'prediction_id' in item]
+            predictions = fetch_predictions(dynamodb, PREDICTIONS_TABLE, prediction_ids) if prediction_ids else {}
+            
+            return [expand_cache_item(item, predictions) for item in items]
             
         except Exception as e:
             logger.error(f"Error getting patterns: {e}")
@@ -88,6 +143,10 @@ class APIHandler:
     def get_market_data(self, symbol, limit=100):
         """Get recent market data"""
         try:
+            if MARKET_DATA_LAYOUT == 'packed':
+                # Newest first, like the row query
+                return candle_rows(symbol, read_recent(self.market_data_table, symbol, limit))[::-1]
+            
             response = self.market_data_table.query(
                 KeyConditionExpression=Key('symbol').eq(symbol),
                 ScanIndexForward=False,
@@ -99,6 +158,44 @@ class APIHandler:
         except Exception as e:
             logger.error(f"Error getting market data: {e}")
             return []
+    
+    def get_market_data_range(self, symbol, start, end, limit=MARKET_DATA_RANGE_LIMIT):
+        """Market data between start and end, oldest first, from the Parquet archive plus DynamoDB
+        
+        Archived days are read from Parquet; DynamoDB is only queried for what
+        comes after the last archived row (at most the 7 days it still holds).
+        Rows are capped at limit.
+        """
+        rows = []
+        try:
+            archive = get_archive()
+            if archive is not None:
+                rows = archive.read('market_data', symbol, start, end)
+        except Exception as e:
+            logger.error(f"Error reading market data archive: {e}")
+        
+        since = rows[-1]['timestamp'] + 1 if rows else start
+        # Bar series (SYMBOL#tf) are stored one item per bar in either layout
+        if since <= end and MARKET_DATA_LAYOUT == 'packed' and '#' not in symbol:
+            rows.extend(candle_rows(symbol, read_range(self.market_data_table, symbol, since, end)))
+        elif since <= end and len(rows) <= limit:
+            kwargs = {
+                'KeyConditionExpression': Key('symbol').eq(symbol) & Key('timestamp').between(since, end)
+            }
+            while len(rows) <= limit:
+                response = self.market_data_table.query(**kwargs)
+                for item in response.get('Items', []):
+                    # Whole numbers (timestamp, trades) stay ints, like the archive rows
+                    rows.append(from_dynamodb({k: v for k, v in item.items() if k != 'ttl'}))
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        return rows[:limit], len(rows) > limit
+
+def parse_timestamp(value):
+    """Epoch seconds from an epoch or ISO 8601 query parameter"""
+    return int(value) if value.isdigit() else int(datetime.fromisoformat(value).timestamp())
 
 def cors_headers():
     """Return CORS headers"""
@@ -108,6 +205,8 @@ def cors_headers():
         'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS'
     }
 
+@metrics.instrument('api')
+@profiled('api')
 def lambda_handler(event, context):
     """Lambda handler for API requests"""
     try:
@@ -119,7 +218,9 @@ def lambda_handler(event, context):
         query_params = event.get('queryStringParameters') or {}
         body = event.get('body')
         
-        logger.info(f"Processing {http_method} {path}")
+        # Latency and errors are reported per route; the request log is debug-only
+        metrics.set_dimension('Route', f"{http_method} {path}" if path in METRIC_ROUTES else 'other')
+        logger.debug(f"Processing {http_method} {path}")
         
         # Handle OPTIONS for CORS
         if http_method == 'OPTIONS':
@@ -147,7 +248,15 @@ def lambda_handler(event, context):
         elif path == '/predictions' and http_method == 'POST':
             try:
                 request_body = json.loads(body) if body else {}
-                symbol = request_body.get('symbol', 'BTCUSDT')
+                registry = load_registry(dynamodb)
+                symbol = request_body.get('symbol') or registry.default_symbol()
+                
+                if not registry.get(symbol):
+                    return {
+                        'statusCode': 400,
+                        'headers': cors_headers(),
+                        'body': json.dumps({'error': f'Unknown symbol: {symbol}'})
+                    }
                 
                 result = handler.create_prediction_request(symbol)
                 
@@ -195,6 +304,41 @@ def lambda_handler(event, context):
                     'body': json.dumps({'error': 'Symbol parameter is required'})
                 }
             
+            # start/end select a long range served from the archive; interval picks a bar series
+            if 'start' in query_params:
+                interval = query_params.get('interval', BASE_TIMEFRAME)
+                try:
+                    start = parse_timestamp(query_params['start'])
+                    end = parse_timestamp(query_params['end']) if 'end' in query_params else int(datetime.now().timestamp())
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': cors_headers(),
+                        'body': json.dumps({'error': 'start and end must be epoch seconds or ISO 8601 dates'})
+                    }
+                if interval not in TIMEFRAMES or start > end:
+                    return {
+                        'statusCode': 400,
+                        'headers': cors_headers(),
+                        'body': json.dumps({'error': f'Invalid interval or range (intervals: {", ".join(TIMEFRAMES)})'})
+                    }
+                
+                limit = min(int(query_params.get('limit', MARKET_DATA_RANGE_LIMIT)), MARKET_DATA_RANGE_LIMIT)
+                market_data, truncated = handler.get_market_data_range(bar_key(symbol, interval), start, end, limit)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': cors_headers(),
+                    'body': json.dumps({
+                        'symbol': symbol,
+                        'interval': interval,
+                        'market_data': market_data,
+                        'count': len(market_data),
+                        # Resume from here to page through a truncated range
+                        'next_start': market_data[-1]['timestamp'] + 1 if truncated else None
+                    }, default=str)
+                }
+            
             limit = int(query_params.get('limit', 100))
             market_data = handler.get_market_data(symbol, limit)
             
@@ -211,7 +355,15 @@ def lambda_handler(event, context):
         elif path == '/analyze-chart' and http_method == 'POST':
             try:
                 request_body = json.loads(body) if body else {}
-                symbol = request_body.get('symbol', 'BTCUSDT')
+                registry = load_registry(dynamodb)
+                symbol = request_body.get('symbol') or registry.default_symbol()
+                
+                if not registry.get(symbol):
+                    return {
+                        'statusCode': 400,
+                        'headers': cors_headers(),
+                        'body': json.dumps({'error': f'Unknown symbol: {symbol}'})
+                    }
                 
                 # Trigger vision-based pattern analysis
                 result = handler.create_prediction_request(symbol)
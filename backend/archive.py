@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Cold archive tier
+=================
+
+market_data rows expire from DynamoDB after 7 days (1m klines and price
+snapshots) and predictions after 30, so a daily compaction job copies
+every complete UTC day into zstd-compressed Parquet files before that
+happens:
+
+    <root>/<dataset>/symbol=<SYMBOL>/date=<YYYY-MM-DD>/part-0.parquet
+
+The root is a local directory or an s3:// URI (default: the archive/
+prefix of the charts bucket). Partitions are written once per day and
+rewritten only with --overwrite, so reruns are cheap and idempotent.
+
+Each dataset has a fixed column schema so files from different days can
+be scanned as one dataset; nested prediction fields are stored as JSON
+strings. Reads prune partitions by symbol and date and push the time
+range down to the row-group statistics of the remaining files.
+
+Requires pyarrow; the API falls back to DynamoDB-only reads without it.
+
+Usage:
+    python archive.py compact --root ./archive --days 6
+    python archive.py read --root ./archive --symbol BTCUSDT --start 2024-01-01 --end 2024-02-01
+"""
+
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from urllib.parse import quote
+
+from boto3.dynamodb.conditions import Key
+
+from bar_aggregator import TIMEFRAMES, bar_key
+from packed_market_data import MARKET_DATA_LAYOUT, candle_rows, read_range
+
+logger = logging.getLogger(__name__)
+
+CHARTS_BUCKET = os.environ.get('CHARTS_BUCKET')
+ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT') or (
+    f"s3://{CHARTS_BUCKET}/archive" if CHARTS_BUCKET
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+)
+# Complete days still in DynamoDB that each compaction run (re)checks: 1m rows live 7 days
+ARCHIVE_LOOKBACK_DAYS = int(os.environ.get('ARCHIVE_LOOKBACK_DAYS', 6))
+ARCHIVE_COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+ROW_GROUP_SIZE = 10_000
+
+# Archive is reused across warm invocations
+_archive = None
+
+# Per dataset: time column and (column, arrow type name); 'symbol' is the partition key
+DATASETS = {
+    'market_data': {
+        'time_column': 'timestamp',
+        'columns': [('timestamp', 'int64'), ('price', 'float64'), ('open', 'float64'), ('high', 'float64'),
+                    ('low', 'float64'), ('close', 'float64'), ('volume', 'float64'), ('trades', 'int64')],
+    },
+    'predictions': {
+        'time_column': 'created_at',
+        'columns': [('created_at', 'int64'), ('prediction_id', 'string'), ('direction', 'string'),
+                    ('prediction_score', 'float64'), ('confidence', 'float64'),
+                    ('price_change_24h', 'float64'), ('model_version', 'string'),
+                    ('patterns_detected', 'json'), ('sentiment', 'json')],
+    },
+}
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("The Parquet archive requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+def archive_available():
+    """Whether pyarrow is importable, i.e. the archive can be read or written here"""
+    try:
+        _pyarrow()
+        return True
+    except RuntimeError:
+        return False
+
+def get_archive():
+    """The ParquetArchive at ARCHIVE_ROOT, or None when pyarrow isn't installed"""
+    global _archive
+    if _archive is None and archive_available():
+        _archive = ParquetArchive()
+    return _archive
+
+def day_bounds(day):
+    """[start, end) epoch seconds of a UTC date"""
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return int(start.timestamp()), int((start + timedelta(days=1)).timestamp())
+
+def utc_date(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+
+def compaction_days(now=None, lookback=ARCHIVE_LOOKBACK_DAYS):
+    """The complete UTC days, oldest first, that are still in DynamoDB"""
+    today = utc_date(now if now is not None else datetime.now(timezone.utc).timestamp())
+    return [today - timedelta(days=n) for n in range(lookback, 0, -1)]
+
+def archive_symbols(registry):
+    """Partition keys to compact: each symbol's 1m rows plus its coarser bar series"""
+    return [bar_key(symbol, timeframe) for symbol in registry.symbols() for timeframe in TIMEFRAMES]
+
+def _json_default(value):
+    return float(value) if isinstance(value, Decimal) else str(value)
+
+def _column_values(items, name, kind):
+    values = [item.get(name) for item in items]
+    if kind == 'json':
+        return [json.dumps(v, default=_json_default) if v is not None else None for v in values]
+    if kind == 'float64':
+        return [float(v) if v is not None else None for v in values]
+    if kind == 'int64':
+        return [int(v) if v is not None else None for v in values]
+    return [str(v) if v is not None else None for v in values]
+
+def items_to_table(dataset, items):
+    """Arrow table of DynamoDB items in the dataset's fixed schema, sorted by time
+
+    Decimals become float64; attributes outside the schema (symbol, ttl)
+    are dropped.
+    """
+    pa = _pyarrow()
+    spec = DATASETS[dataset]
+    items = sorted(items, key=lambda item: int(item[spec['time_column']]))
+    schema = dataset_schema(dataset)
+    arrays = [
+        pa.array(_column_values(items, name, kind), type=schema.field(name).type)
+        for name, kind in spec['columns']
+    ]
+    return pa.Table.from_arrays(arrays, names=[name for name, _ in spec['columns']])
+
+def dataset_schema(dataset):
+    """Arrow schema of a dataset's files plus its symbol/date partition fields"""
+    pa = _pyarrow()
+    fields = [pa.field(name, pa.string() if kind == 'json' else getattr(pa, kind)())
+              for name, kind in DATASETS[dataset]['columns']]
+    return pa.schema(fields + [pa.field('symbol', pa.string()), pa.field('date', pa.string())])
+
+class ParquetArchive:
+    """Symbol/date-partitioned Parquet files under a local directory or an s3:// prefix"""
+
+    def __init__(self, root=ARCHIVE_ROOT, compression=ARCHIVE_COMPRESSION):
+        pa = _pyarrow()
+        if '://' not in root:
+            root = os.path.abspath(root)
+            os.makedirs(root, exist_ok=True)
+        self.filesystem, self.base = pa.fs.FileSystem.from_uri(root)
+        self.root = root
+        self.compression = compression
+
+    def partition_dir(self, dataset, symbol, day):
+        # Hive partition values are URI-encoded (bar keys contain '#')
+        return f"{self.base}/{dataset}/symbol={quote(symbol, safe='')}/date={day.isoformat()}"
+
+    def has_partition(self, dataset, symbol, day):
+        pa = _pyarrow()
+        info = self.filesystem.get_file_info(f"{self.partition_dir(dataset, symbol, day)}/part-0.parquet")
+        return info.type != pa.fs.FileType.NotFound
+
+    def write_partition(self, dataset, symbol, day, items):
+        """Replace one symbol/day partition with items; returns (rows, bytes written)"""
+        pa = _pyarrow()
+        table = items_to_table(dataset, items)
+        directory = self.partition_dir(dataset, symbol, day)
+        self.filesystem.create_dir(directory, recursive=True)
+        path = f"{directory}/part-0.parquet"
+        pa.parquet.write_table(
+            table, path, filesystem=self.filesystem,
+            compression=self.compression, row_group_size=ROW_GROUP_SIZE
+        )
+        return table.num_rows, self.filesystem.get_file_info(path).size
+
+    def read(self, dataset, symbol, start, end, columns=None):
+        """Rows of symbol with start <= time <= end, oldest first, as dicts without nulls"""
+        pa = _pyarrow()
+        ds = pa.dataset
+        spec = DATASETS[dataset]
+        time_column = spec['time_column']
+
+        root = f"{self.base}/{dataset}"
+        if self.filesystem.get_file_info(root).type == pa.fs.FileType.NotFound:
+            return []
+
+        partitioning = ds.partitioning(
+            pa.schema([('symbol', pa.string()), ('date', pa.string())]), flavor='hive'
+        )
+        data = ds.dataset(root, schema=dataset_schema(dataset), format='parquet',
+                          filesystem=self.filesystem, partitioning=partitioning)
+
+        # Partition pruning on symbol/date, row-group statistics on the time column
+        expression = (
+            (ds.field('symbol') == symbol)
+            & (ds.field('date') >= utc_date(start).isoformat())
+            & (ds.field('date') <= utc_date(end).isoformat())
+            & (ds.field(time_column) >= start)
+            & (ds.field(time_column) <= end)
+        )
+        columns = columns or [name for name, _ in spec['columns']]
+        table = data.to_table(columns=columns, filter=expression).sort_by(time_column)
+
+        json_columns = {name for name, kind in spec['columns'] if kind == 'json'}
+        rows = []
+        for row in table.to_pylist():
+            row = {k: (json.loads(v) if k in json_columns else v) for k, v in row.items() if v is not None}
+            rows.append({'symbol': symbol, **row})
+        return rows
+
+def fetch_day(table, dataset, symbol, day):
+    """All DynamoDB items of symbol within a UTC day (predictions via the symbol GSI, packed candles decoded)"""
+    start, end = day_bounds(day)
+    if dataset == 'market_data' and MARKET_DATA_LAYOUT == 'packed' and '#' not in symbol:
+        return candle_rows(symbol, read_range(table, symbol, start, end - 1))
+    if dataset == 'predictions':
+        kwargs = {
+            'IndexName': 'symbol-created_at-index',
+            'KeyConditionExpression': Key('symbol').eq(symbol) & Key('created_at').between(start, end - 1),
+        }
+    else:
+        kwargs = {'KeyConditionExpression': Key('symbol').eq(symbol) & Key('timestamp').between(start, end - 1)}
+
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def compact(archive, tables, symbols, days, overwrite=False):
+    """Copy each dataset/symbol/day not yet archived from DynamoDB into Parquet
+
+    tables maps dataset name -> DynamoDB table. Returns per-dataset counts
+    of partitions written and skipped, rows, and Parquet bytes.
+    """
+    summary = {}
+    for dataset, table in tables.items():
+        # Predictions are keyed by plain symbols only
+        dataset_symbols = symbols if dataset == 'market_data' else [s for s in symbols if '#' not in s]
+        stats = {'partitions': 0, 'skipped': 0, 'rows': 0, 'bytes': 0}
+
+        for symbol in dataset_symbols:
+            for day in days:
+                if not overwrite and archive.has_partition(dataset, symbol, day):
+                    stats['skipped'] += 1
+                    continue
+                items = fetch_day(table, dataset, symbol, day)
+                if not items:
+                    continue
+                rows, size = archive.write_partition(dataset, symbol, day, items)
+                stats['partitions'] += 1
+                stats['rows'] += rows
+                stats['bytes'] += size
+
+        logger.info(f"Archived {dataset}: {stats['partitions']} partitions, {stats['rows']} rows, "
+                    f"{stats['bytes']} bytes ({stats['skipped']} already archived)")
+        summary[dataset] = stats
+    return summary
+
+def lambda_handler(event, context):
+    """Daily compaction of the complete days still in DynamoDB"""
+    import boto3
+    from symbol_registry import load_registry
+
+    try:
+        dynamodb = boto3.resource('dynamodb')
+        tables = {
+            'market_data': dynamodb.Table(os.environ['MARKET_DATA_TABLE']),
+            'predictions': dynamodb.Table(os.environ['PREDICTIONS_TABLE']),
+        }
+        symbols = archive_symbols(load_registry(dynamodb))
+        days = compaction_days(lookback=int(event.get('lookback_days', ARCHIVE_LOOKBACK_DAYS)))
+
+        summary = compact(ParquetArchive(), tables, symbols, days, overwrite=event.get('overwrite', False))
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'root': ARCHIVE_ROOT,
+                'days': [day.isoformat() for day in days],
+                'datasets': summary
+            })
+        }
+
+    except Exception as e:
+        logger.error(f"Archive compaction error: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
+
+def _timestamp_arg(value):
+    return int(value) if value.isdigit() else int(datetime.fromisoformat(value).timestamp())
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact expiring DynamoDB rows into the Parquet archive')
+    parser.add_argument('command', choices=['compact', 'read'])
+    parser.add_argument('--root', default=ARCHIVE_ROOT, help='Local directory or s3:// URI (default: $ARCHIVE_ROOT)')
+    parser.add_argument('--days', type=int, default=ARCHIVE_LOOKBACK_DAYS, help='Complete days to compact')
+    parser.add_argument('--overwrite', action='store_true', help='Rewrite partitions that already exist')
+    parser.add_argument('--dataset', default='market_data', choices=list(DATASETS), help='Dataset to read')
+    parser.add_argument('--symbol', help='Symbol to read')
+    parser.add_argument('--start', type=_timestamp_arg, help='First timestamp to read')
+    parser.add_argument('--end', type=_timestamp_arg, help='Last timestamp to read')
+    args = parser.parse_args()
+
+    print("🗄️  Market Data Archive")
+    print("=" * 60)
+    archive = ParquetArchive(args.root)
+
+    if args.command == 'read':
+        if not (args.symbol and args.start and args.end):
+            parser.error("read needs --symbol, --start and --end")
+        rows = archive.read(args.dataset, args.symbol, args.start, args.end)
+        print(f"{len(rows)} {args.dataset} rows for {args.symbol}")
+        for row in rows[:5]:
+            print(row)
+        return rows
+
+    import boto3
+    from symbol_registry import load_registry
+
+    dynamodb = boto3.resource('dynamodb')
+    tables = {
+        'market_data': dynamodb.Table(os.environ['MARKET_DATA_TABLE']),
+        'predictions': dynamodb.Table(os.environ['PREDICTIONS_TABLE']),
+    }
+    days = compaction_days(lookback=args.days)
+    print(f"Root: {args.root} | Days: {days[0]} to {days[-1]}")
+    summary = compact(archive, tables, archive_symbols(load_registry(dynamodb)), days, args.overwrite)
+    for dataset, stats in summary.items():
+        print(f"✅ {dataset}: {stats['partitions']} partitions, {stats['rows']} rows, "
+              f"{stats['bytes'] / 1024:.1f} KiB ({stats['skipped']} skipped)")
+    return summary
+
+if __name__ == "__main__":
+    main()
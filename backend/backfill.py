@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+Historical market data backfill
+===============================
+
+Loads historical klines into the market_data table. Rows are read in
+chunks from a source, converted to DynamoDB items column-wise, and written
+by a pool of threads, each using its own batch_writer (25 items per
+BatchWriteItem request).
+
+Sources:
+
+* file: <SYMBOL>.csv or <SYMBOL>.parquet dumps in --data-dir, either with
+  a timestamp/open/high/low/close/volume[/trades] header or in the Binance
+  kline dump column order (parquet needs pyarrow)
+* binance: the public /api/v3/klines REST endpoint, paged by start time
+* module:Class: any class with symbols() and iter_chunks(symbol, since)
+  yielding dicts of NumPy arrays, constructed with the parsed arguments
+
+Progress is recorded per symbol in a JSON checkpoint file once every
+earlier batch has been written, so an interrupted run resumes after the
+last fully written timestamp. Sources must yield each symbol's rows in
+ascending time order.
+
+With --layout packed (or MARKET_DATA_LAYOUT=packed) candles are written as
+one binary item per symbol-hour (see packed_market_data.py), which cuts
+items and write units by about 20x. Complete hours are written whole; the
+current, still-open hour is merged into whatever the live ingestion has
+already stored for it.
+
+Usage:
+    python backfill.py --data-dir dumps/ --table crypto-market-data-dev --writers 8
+    python backfill.py --source binance --symbols BTCUSDT --start 2023-01-01 --end 2024-01-01
+    python backfill.py --benchmark --rows 200000 --writers 1,4,16 --latency-ms 5 --layout packed
+
+--benchmark also replays live 1m candles to compare the write cost of
+the row layout with the packed layout's live writers.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from http_fetch import HTTPFetcher
+from packed_market_data import (BUCKET_SECONDS, MARKET_DATA_LAYOUT, SLOTS_PER_BUCKET, LiveBucketWriter,
+                                bucket_start, packed_items, write_candles)
+
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_WRITE_BATCH_ROWS = 500
+BINANCE_KLINES_URL = 'https://api.binance.com/api/v3/klines'
+BINANCE_PAGE_LIMIT = 1000
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+# Binance kline dump / REST column order
+BINANCE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+                   'quote_volume', 'trades', 'taker_base_volume', 'taker_quote_volume', 'ignore']
+
+def normalize_chunk(frame):
+    """Columns of a source chunk as arrays: int64 timestamps in seconds, sorted and de-duplicated"""
+    timestamps = np.asarray(frame['timestamp'], dtype=np.int64)
+    if len(timestamps) and timestamps.max() > 10**11:
+        timestamps = timestamps // 1000  # Milliseconds, as in the kline payloads
+
+    # Keep the last occurrence of each timestamp, in ascending order
+    _, first_in_reversed = np.unique(timestamps[::-1], return_index=True)
+    order = len(timestamps) - 1 - first_in_reversed
+
+    chunk = {'timestamp': timestamps[order]}
+    for field in PRICE_FIELDS:
+        chunk[field] = np.asarray(frame[field], dtype=np.float64)[order]
+    if 'trades' in frame:
+        chunk['trades'] = np.asarray(frame['trades'], dtype=np.int64)[order]
+    return chunk
+
+def _since_filter(chunk, since):
+    if since is None:
+        return chunk
+    keep = chunk['timestamp'] > since
+    return {field: values[keep] for field, values in chunk.items()}
+
+class FileSource:
+    """Kline dumps on disk: <data_dir>/<SYMBOL>.csv or .parquet, read in chunks"""
+
+    def __init__(self, data_dir, chunk_rows=DEFAULT_CHUNK_ROWS, **kwargs):
+        self.data_dir = data_dir
+        self.chunk_rows = chunk_rows
+
+    def _files(self):
+        return {
+            os.path.splitext(name)[0]: os.path.join(self.data_dir, name)
+            for name in sorted(os.listdir(self.data_dir)) if name.endswith(('.csv', '.parquet'))
+        }
+
+    def symbols(self):
+        return list(self._files())
+
+    def iter_chunks(self, symbol, since=None):
+        path = self._files()[symbol]
+        frames = self._parquet_frames(path) if path.endswith('.parquet') else self._csv_frames(path)
+        for frame in frames:
+            chunk = _since_filter(normalize_chunk(frame), since)
+            if len(chunk['timestamp']):
+                yield chunk
+
+    def _csv_frames(self, path):
+        import pandas as pd
+
+        with open(path) as f:
+            first_row = f.readline().split(',')
+        has_header = not first_row[0].strip().replace('.', '', 1).isdigit()
+        options = {'chunksize': self.chunk_rows}
+        if not has_header:
+            options.update(header=None, names=BINANCE_COLUMNS[:len(first_row)])
+        for frame in pd.read_csv(path, **options):
+            yield {column: frame[column].to_numpy() for column in frame.columns}
+
+    def _parquet_frames(self, path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet dumps requires pyarrow (pip install pyarrow)")
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=self.chunk_rows):
+            yield {name: batch.column(i).to_numpy() for i, name in enumerate(batch.schema.names)}
+
+class BinanceKlineSource:
+    """Historical klines from the Binance REST API, one page of 1000 candles per request"""
+
+    def __init__(self, symbols=None, interval='1m', start=None, end=None, fetcher=None, **kwargs):
+        self.fetcher = fetcher or HTTPFetcher()
+        self._symbols = symbols or []
+        self.interval = interval
+        self.start = start or 0
+        self.end = end or int(time.time())
+
+    def symbols(self):
+        return self._symbols
+
+    def iter_chunks(self, symbol, since=None):
+        start_ms = max(self.start, (since or 0) + 1) * 1000
+        end_ms = self.end * 1000
+
+        while start_ms <= end_ms:
+            rows = self.fetcher.get_json(BINANCE_KLINES_URL, params={
+                'symbol': symbol, 'interval': self.interval,
+                'startTime': start_ms, 'endTime': end_ms, 'limit': BINANCE_PAGE_LIMIT
+            })
+            if not rows:
+                break
+
+            columns = list(zip(*rows))
+            frame = {name: np.array(columns[i], dtype=np.float64) for i, name in enumerate(BINANCE_COLUMNS)}
+            yield _since_filter(normalize_chunk(frame), since)
+            start_ms = int(rows[-1][0]) + 1
+
+SOURCES = {
+    'file': FileSource,
+    'binance': BinanceKlineSource,
+}
+
+def load_source(name):
+    """Source class from SOURCES or a 'module:Class' path"""
+    if name in SOURCES:
+        return SOURCES[name]
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+def to_items(symbol, chunk, ttl=None):
+    """Convert a chunk of arrays into market_data items, one column at a time
+
+    Each float column is formatted to strings in a single NumPy call, so
+    Decimal sees the shortest round-tripping representation, matching what
+    the ingestion path stores.
+    """
+    n = len(chunk['timestamp'])
+    columns = {
+        'symbol': [symbol] * n,
+        'timestamp': chunk['timestamp'].tolist(),
+    }
+    for field in PRICE_FIELDS:
+        columns[field] = list(map(Decimal, chunk[field].astype(str)))
+    if 'trades' in chunk:
+        columns['trades'] = chunk['trades'].tolist()
+    if ttl is not None:
+        columns['ttl'] = [ttl] * n
+
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+class BackfillCheckpoint:
+    """Per-symbol last fully written timestamp, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def since(self, symbol):
+        entry = self.state.get(symbol)
+        return entry['last_timestamp'] if entry else None
+
+    def advance(self, symbol, last_timestamp, rows):
+        with self._lock:
+            entry = self.state.setdefault(symbol, {'last_timestamp': None, 'rows': 0})
+            entry['last_timestamp'] = int(last_timestamp)
+            entry['rows'] += rows
+            entry['updated_at'] = datetime.now().isoformat()
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class ParallelBatchWriter:
+    """Writes item batches from a thread pool; each thread gets its own Table handle
+
+    boto3 resources are not thread-safe, so table_factory is called once per
+    worker thread. At most max_pending batches are queued at a time.
+    """
+
+    def __init__(self, table_factory, workers=8, max_pending=None):
+        self.table_factory = table_factory
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill-writer')
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._local = threading.local()
+
+    def _table(self):
+        if not hasattr(self._local, 'table'):
+            self._local.table = self.table_factory()
+        return self._local.table
+
+    def _write(self, items):
+        try:
+            with self._table().batch_writer(overwrite_by_pkeys=['symbol', 'timestamp']) as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+            return len(items)
+        finally:
+            self.slots.release()
+
+    def submit(self, items):
+        self.slots.acquire()
+        return self.pool.submit(self._write, items)
+
+    def _merge(self, symbol, candles):
+        try:
+            write_candles(self._table(), symbol, candles, merge=True)
+            return len(candles['timestamp'])
+        finally:
+            self.slots.release()
+
+    def submit_merge(self, symbol, candles):
+        """Merge packed candles into their buckets instead of replacing them"""
+        self.slots.acquire()
+        return self.pool.submit(self._merge, symbol, candles)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+def bucket_aligned(chunks):
+    """Re-cut ascending chunks at hour-bucket boundaries so no bucket spans two chunks"""
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = {field: np.concatenate([carry[field], chunk[field]]) for field in chunk}
+        if not len(chunk['timestamp']):
+            continue
+        split = np.searchsorted(chunk['timestamp'], bucket_start(chunk['timestamp'][-1]))
+        carry = {field: values[split:] for field, values in chunk.items()}
+        if split:
+            yield {field: values[:split] for field, values in chunk.items()}
+    if carry is not None and len(carry['timestamp']):
+        yield carry
+
+def write_batches(symbol, chunk, ttl=None, write_batch_rows=DEFAULT_WRITE_BATCH_ROWS, layout=MARKET_DATA_LAYOUT):
+    """(items, last timestamp, rows) write batches of about write_batch_rows candles each"""
+    if layout == 'packed':
+        # Backfilled history is kept unless a ttl is given, as in the row layout
+        items = packed_items(symbol, chunk, ttl if ttl is not None else False)
+        timestamps = chunk['timestamp']
+        buckets_per_batch = max(1, write_batch_rows // SLOTS_PER_BUCKET)
+        for start in range(0, len(items), buckets_per_batch):
+            batch = items[start:start + buckets_per_batch]
+            first = np.searchsorted(timestamps, batch[0]['timestamp'])
+            end = np.searchsorted(timestamps, batch[-1]['timestamp'] + BUCKET_SECONDS)
+            yield batch, int(timestamps[end - 1]), int(end - first)
+    else:
+        items = to_items(symbol, chunk, ttl)
+        for start in range(0, len(items), write_batch_rows):
+            batch = items[start:start + write_batch_rows]
+            yield batch, batch[-1]['timestamp'], len(batch)
+
+def backfill_symbol(source, symbol, writer, checkpoint, ttl=None, write_batch_rows=DEFAULT_WRITE_BATCH_ROWS,
+                    layout=MARKET_DATA_LAYOUT, now=None):
+    """Stream one symbol from source into the writer; returns rows written
+
+    With the packed layout, items are whole hour buckets: chunks are re-cut
+    at bucket boundaries and a resumed run restarts at the beginning of
+    the checkpoint's bucket so that bucket is rewritten complete. Candles
+    of the hour containing now are still arriving from the live stream,
+    so they are merged into the stored bucket rather than replacing it.
+    """
+    pending = deque()  # (future, last_timestamp, rows) in source order
+    written = 0
+
+    def settle(block):
+        nonlocal written
+        while pending and (block or pending[0][0].done()):
+            future, last_timestamp, rows = pending.popleft()
+            future.result()  # Re-raise write errors before moving the checkpoint
+            written += rows
+            checkpoint.advance(symbol, last_timestamp, rows)
+
+    since = checkpoint.since(symbol)
+    if layout == 'packed' and since is not None:
+        since = bucket_start(since) - 1
+    chunks = source.iter_chunks(symbol, since=since)
+    if layout == 'packed':
+        chunks = bucket_aligned(chunks)
+    open_hour = bucket_start(time.time() if now is None else now)
+
+    for chunk in chunks:
+        if layout == 'packed' and chunk['timestamp'][-1] >= open_hour:
+            split = np.searchsorted(chunk['timestamp'], open_hour)
+            live = {field: values[split:] for field, values in chunk.items()}
+            chunk = {field: values[:split] for field, values in chunk.items()}
+        else:
+            live = None
+
+        if len(chunk['timestamp']):
+            for batch, last_timestamp, rows in write_batches(symbol, chunk, ttl, write_batch_rows, layout):
+                pending.append((writer.submit(batch), last_timestamp, rows))
+        if live is not None:
+            pending.append((writer.submit_merge(symbol, live), int(live['timestamp'][-1]), len(live['timestamp'])))
+        settle(block=False)
+
+    settle(block=True)
+    return written
+
+def run_backfill(source, symbols, table_factory, checkpoint, writers=8, ttl=None,
+                 write_batch_rows=DEFAULT_WRITE_BATCH_ROWS, layout=MARKET_DATA_LAYOUT):
+    """Backfill each symbol in turn; returns per-symbol row counts and rows/sec"""
+    writer = ParallelBatchWriter(table_factory, writers)
+    results = {}
+    try:
+        for symbol in symbols:
+            start_time = time.perf_counter()
+            rows = backfill_symbol(source, symbol, writer, checkpoint, ttl, write_batch_rows, layout)
+            elapsed = time.perf_counter() - start_time
+            results[symbol] = {
+                'rows': rows,
+                'elapsed_sec': elapsed,
+                'rows_per_sec': rows / elapsed if elapsed > 0 else None,
+            }
+            print(f"  {symbol:<12}{rows:>10,} rows {elapsed:8.1f}s "
+                  f"{results[symbol]['rows_per_sec'] or 0:>10,.0f} rows/sec")
+    finally:
+        writer.close()
+    return results
+
+class SyntheticSource:
+    """Random-walk 1m klines for benchmarking"""
+
+    def __init__(self, rows, chunk_rows=DEFAULT_CHUNK_ROWS, **kwargs):
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+
+    def symbols(self):
+        return ['BTCUSDT']
+
+    def iter_chunks(self, symbol, since=None):
+        rng = np.random.default_rng(7)
+        close = np.round(60000 + np.cumsum(rng.normal(0, 50, self.rows)), 2)
+        spread = np.round(rng.uniform(0, 40, self.rows), 2)
+        frame = {
+            'timestamp': 1_600_000_000 + np.arange(self.rows, dtype=np.int64) * 60,
+            'open': close, 'high': close + spread, 'low': close - spread, 'close': close,
+            'volume': np.round(rng.uniform(1, 100, self.rows), 4),
+            'trades': rng.integers(10, 1000, self.rows),
+        }
+        for start in range(0, self.rows, self.chunk_rows):
+            yield _since_filter(normalize_chunk({k: v[start:start + self.chunk_rows] for k, v in frame.items()}), since)
+
+def run_benchmark(rows, writer_counts, latency_ms, layout=MARKET_DATA_LAYOUT):
+    """Rows/sec for conversion alone and for full backfills into the in-memory table"""
+    from local_aws import InMemoryDynamoDB
+
+    source = SyntheticSource(rows)
+    chunks = list(source.iter_chunks('BTCUSDT'))
+    start_time = time.perf_counter()
+    for chunk in chunks:
+        for _ in write_batches('BTCUSDT', chunk, layout=layout):
+            pass
+    convert_rate = rows / (time.perf_counter() - start_time)
+    print(f"  conversion        {convert_rate:>12,.0f} rows/sec ({layout} layout)")
+
+    results = {'rows': rows, 'latency_ms': latency_ms, 'layout': layout,
+               'conversion_rows_per_sec': convert_rate, 'writers': []}
+    for writers in writer_counts:
+        db = InMemoryDynamoDB(latency_ms=latency_ms)
+        table = db.Table('market_data')
+        start_time = time.perf_counter()
+        written = backfill_symbol(source, 'BTCUSDT', ParallelBatchWriter(lambda: table, writers),
+                                  BackfillCheckpoint(None), layout=layout)
+        elapsed = time.perf_counter() - start_time
+        assert written == rows
+        results['writers'].append({
+            'writers': writers,
+            'rows_per_sec': rows / elapsed,
+            'requests': table.request_count,
+            'items': len(table.items),
+            'write_units': table.write_units,
+        })
+        print(f"  writers={writers:<3}       {rows / elapsed:>12,.0f} rows/sec ({table.request_count:,} requests, "
+              f"{table.write_units:,} WCU)")
+    return results
+
+def run_live_benchmark(symbols=20, hours=6):
+    """Requests and capacity units per live candle for each way of storing closed 1m candles
+
+    Replays symbols x hours of closed candles one minute at a time, as the
+    stream delivers them, against a fresh in-memory table per strategy.
+    """
+    from local_aws import InMemoryDynamoDB
+
+    chunk = next(SyntheticSource(hours * SLOTS_PER_BUCKET, chunk_rows=hours * SLOTS_PER_BUCKET).iter_chunks('BTCUSDT'))
+    names = [f"SYM{i:03d}USDT" for i in range(symbols)]
+    minutes = [{field: values[i:i + 1] for field, values in chunk.items()} for i in range(len(chunk['timestamp']))]
+
+    def rows(table, clock):
+        for candle in minutes:
+            clock[0] = int(candle['timestamp'][0]) + 60
+            for name in names:
+                for item in to_items(name, candle):
+                    table.put_item(Item=item)
+
+    def per_candle(table, clock):
+        for candle in minutes:
+            clock[0] = int(candle['timestamp'][0]) + 60
+            for name in names:
+                write_candles(table, name, candle)
+
+    def buffered(flush_seconds):
+        def run(table, clock):
+            writer = LiveBucketWriter(table, flush_seconds, clock=lambda: clock[0])
+            for candle in minutes:
+                clock[0] = int(candle['timestamp'][0]) + 60
+                for name in names:
+                    writer.add(name, candle)
+                writer.flush_due()
+            writer.flush()
+        return run
+
+    strategies = [
+        ('rows: put per candle', rows),
+        ('packed: merge per candle', per_candle),
+        ('packed: hourly buffer', buffered(0)),
+        ('packed: buffer, 1m flush', buffered(60)),
+        ('packed: buffer, 5m flush', buffered(300)),
+    ]
+    candles = symbols * len(minutes)
+    results = {'symbols': symbols, 'hours': hours, 'strategies': []}
+    for label, run in strategies:
+        table = InMemoryDynamoDB().Table('market_data')
+        run(table, [0])
+        results['strategies'].append({
+            'strategy': label,
+            'requests_per_candle': table.request_count / candles,
+            'wcu_per_candle': table.write_units / candles,
+            'rcu_per_candle': table.read_units / candles,
+            'items': len(table.items),
+        })
+        print(f"  {label:<26}{table.request_count / candles:>6.3f} req {table.write_units / candles:>6.3f} WCU "
+              f"{table.read_units / candles:>6.3f} RCU per candle")
+    return results
+
+def _timestamp_arg(value):
+    """Accept epoch seconds or an ISO date"""
+    return int(value) if value.isdigit() else int(datetime.fromisoformat(value).timestamp())
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill historical klines into the market_data table')
+    parser.add_argument('--source', default='file', help="'file', 'binance' or a module:Class source")
+    parser.add_argument('--data-dir', help='Directory of <SYMBOL>.csv / .parquet dumps (file source)')
+    parser.add_argument('--symbols', help='Comma-separated symbols (default: all the source offers)')
+    parser.add_argument('--start', type=_timestamp_arg, help='First timestamp (binance source)')
+    parser.add_argument('--end', type=_timestamp_arg, help='Last timestamp (binance source)')
+    parser.add_argument('--interval', default='1m', help='Kline interval (binance source)')
+    parser.add_argument('--table', default=os.environ.get('MARKET_DATA_TABLE'), help='Target table (default: $MARKET_DATA_TABLE)')
+    parser.add_argument('--checkpoint', default='backfill_checkpoint.json', help='Resume file')
+    parser.add_argument('--writers', type=_int_list, default=[8], help='Writer threads (comma list with --benchmark)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--write-batch-rows', type=int, default=DEFAULT_WRITE_BATCH_ROWS)
+    parser.add_argument('--ttl-days', type=int, help='Expire backfilled rows after N days (default: keep)')
+    parser.add_argument('--layout', default=MARKET_DATA_LAYOUT, choices=['rows', 'packed'],
+                        help='Item per candle or per symbol-hour (default: $MARKET_DATA_LAYOUT)')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark against an in-memory table')
+    parser.add_argument('--rows', type=int, default=200_000, help='Synthetic rows for --benchmark')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Simulated request latency for --benchmark')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    print("📥 Market Data Backfill")
+    print("=" * 60)
+
+    if args.benchmark:
+        report = run_benchmark(args.rows, args.writers, args.latency_ms, args.layout)
+        print("\n⏱️  Live ingestion writes")
+        report['live'] = run_live_benchmark()
+    else:
+        if not args.table:
+            parser.error("--table or MARKET_DATA_TABLE is required")
+        import boto3
+
+        source = load_source(args.source)(
+            data_dir=args.data_dir, symbols=args.symbols.split(',') if args.symbols else None,
+            start=args.start, end=args.end, interval=args.interval, chunk_rows=args.chunk_rows
+        )
+        symbols = args.symbols.split(',') if args.symbols else source.symbols()
+        ttl = int((datetime.now() + timedelta(days=args.ttl_days)).timestamp()) if args.ttl_days else None
+
+        print(f"Source: {args.source} | Table: {args.table} | Symbols: {len(symbols)} | Writers: {args.writers[0]}")
+        report = run_backfill(
+            source, symbols,
+            lambda: boto3.session.Session().resource('dynamodb').Table(args.table),
+            BackfillCheckpoint(args.checkpoint), args.writers[0], ttl, args.write_batch_rows, args.layout
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Prediction backtester
+=====================
+
+Replays the vision pattern pipeline over historical OHLCV data and scores
+its bullish/bearish calls against forward returns at several horizons.
+
+Two modes:
+
+* Offline pipeline (--model): slides the production 100-candle window over
+  each symbol's history, renders and classifies the windows in batches,
+  and combines pattern, price trend and indicator scores exactly as
+  generate_prediction does. Indicators are computed once over the whole
+  series and indexed per window, and symbols run in parallel processes.
+* Stored predictions (--predictions): evaluates prediction items exported
+  from the predictions table (one JSON object per line) against the same
+  OHLCV history.
+
+Results are reported per horizon as hit rates and mean signed returns,
+overall and broken down by pattern type, direction and confidence bucket,
+per symbol and across all symbols.
+
+OHLCV files live in --data-dir as <SYMBOL>.csv or <SYMBOL>.npz. CSVs either
+have a header naming timestamp/open/high/low/close/volume columns or use
+the Binance kline dump column order; millisecond timestamps are converted
+to seconds like the ingestion path does.
+
+Usage:
+    python backtest.py --data-dir history/ --symbols BTCUSDT,ETHUSDT \\
+        --model models/crypto_pattern_model_v14.onnx --stride 60 --workers 4 --output backtest.json
+    python backtest.py --data-dir history/ --symbols BTCUSDT --predictions predictions.jsonl
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# pattern_analysis_vision reads its table and bucket names at import time;
+# the backtester never touches AWS, so give it placeholders
+for _name in ('PATTERN_CACHE_TABLE', 'PREDICTIONS_TABLE', 'CHARTS_BUCKET'):
+    os.environ.setdefault(_name, 'backtest-offline')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from indicators import compute_indicators, indicator_score
+from onnx_session import create_inference_session, session_config_from_env
+from pattern_analysis_vision import (
+    PATTERN_CLASSES, PATTERN_WEIGHT, PRICE_WEIGHT, SENTIMENT_WEIGHT, PRICE_CHANGE_SCALE,
+    PRICE_TREND_LOOKBACK, DIRECTION_THRESHOLD, SCAN_BATCH_SIZE, pattern_direction,
+    render_price_chart,
+)
+from preprocessing import batch_buffer, preprocess_images
+
+DEFAULT_HORIZONS = [5, 15, 60, 240]   # candles ahead
+DEFAULT_WINDOW = 100                  # candles per chart, as in lambda_handler
+DEFAULT_STRIDE = 60
+CONFIDENCE_EDGES = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
+PATTERN_LABELS = PATTERN_CLASSES + ['none']
+DIRECTION_CODES = {'bullish': 1, 'bearish': -1, 'neutral': 0}
+PATTERN_DIRECTION_CODES = np.array([DIRECTION_CODES[pattern_direction(p)] for p in PATTERN_CLASSES], dtype=np.int8)
+
+OHLCV_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+# Per-process inference session, created by _init_worker
+_session = None
+
+def load_ohlcv(path):
+    """Load an OHLCV file into timestamp-sorted arrays (timestamps in seconds)"""
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            arrays = {field: data[field] for field in OHLCV_FIELDS}
+    else:
+        with open(path) as f:
+            header = f.readline().strip().split(',')
+        has_header = not header[0].replace('.', '', 1).isdigit()
+        if has_header:
+            columns = [header.index(field) for field in OHLCV_FIELDS]
+        else:
+            columns = list(range(6))  # Binance kline dump: open_time, open, high, low, close, volume, ...
+        raw = np.loadtxt(path, delimiter=',', skiprows=int(has_header), usecols=columns, ndmin=2)
+        arrays = {field: raw[:, i] for i, field in enumerate(OHLCV_FIELDS)}
+
+    timestamps = np.asarray(arrays['timestamp'], dtype=np.int64)
+    if len(timestamps) and timestamps.max() > 10**11:
+        timestamps = timestamps // 1000
+    order = np.argsort(timestamps, kind='stable')
+
+    ohlcv = {'timestamp': timestamps[order]}
+    for field in OHLCV_FIELDS[1:]:
+        ohlcv[field] = np.asarray(arrays[field], dtype=np.float64)[order]
+    return ohlcv
+
+def slice_range(ohlcv, start=None, end=None):
+    """Restrict OHLCV arrays to start <= timestamp <= end"""
+    ts = ohlcv['timestamp']
+    lo = np.searchsorted(ts, start, side='left') if start is not None else 0
+    hi = np.searchsorted(ts, end, side='right') if end is not None else len(ts)
+    return {field: values[lo:hi] for field, values in ohlcv.items()}
+
+def forward_returns(close, index, horizons):
+    """Simple returns from close[index] to close[index + h], one column per horizon (NaN past the end)"""
+    close = np.asarray(close, dtype=np.float64)
+    index = np.asarray(index, dtype=np.int64)
+    out = np.full((len(index), len(horizons)), np.nan)
+    for j, h in enumerate(horizons):
+        target = index + h
+        valid = target < len(close)
+        out[valid, j] = close[target[valid]] / close[index[valid]] - 1.0
+    return out
+
+def _group_stats(codes, labels, direction, returns):
+    """Signals, hits, hit rate and mean signed return per group, for one horizon"""
+    valid = (direction != 0) & ~np.isnan(returns)
+    signed = np.where(valid, direction * np.nan_to_num(returns), 0.0)
+    hits = valid & (signed > 0)
+
+    n_groups = len(labels)
+    counts = np.bincount(codes, weights=valid, minlength=n_groups)
+    hit_counts = np.bincount(codes, weights=hits, minlength=n_groups)
+    signed_sums = np.bincount(codes, weights=signed, minlength=n_groups)
+
+    stats = {}
+    for g, label in enumerate(labels):
+        if counts[g] == 0:
+            continue
+        stats[label] = {
+            'signals': int(counts[g]),
+            'hits': int(hit_counts[g]),
+            'hit_rate': float(hit_counts[g] / counts[g]),
+            'mean_signed_return': float(signed_sums[g] / counts[g]),
+        }
+    return stats
+
+def summarize(signals, horizons, confidence_edges=CONFIDENCE_EDGES):
+    """Hit rates per horizon: overall and by pattern type, direction and confidence bucket
+
+    signals holds equal-length arrays: direction (+1/-1/0), confidence,
+    pattern (index into PATTERN_LABELS) and returns (n x len(horizons)).
+    Neutral calls are counted but not scored.
+    """
+    direction = np.asarray(signals['direction'], dtype=np.int8)
+    confidence = np.asarray(signals['confidence'], dtype=np.float64)
+    pattern = np.asarray(signals['pattern'], dtype=np.int64)
+    returns = np.asarray(signals['returns'], dtype=np.float64).reshape(len(direction), len(horizons))
+
+    edges = np.asarray(confidence_edges, dtype=np.float64)
+    bucket = np.clip(np.searchsorted(edges, confidence, side='right') - 1, 0, len(edges) - 2)
+    bucket_labels = [f"{edges[i]:.1f}-{edges[i + 1]:.1f}" for i in range(len(edges) - 1)]
+    direction_code = np.where(direction > 0, 0, np.where(direction < 0, 1, 2))
+    zeros = np.zeros(len(direction), dtype=np.int64)
+
+    summary = {
+        'predictions': int(len(direction)),
+        'neutral': int(np.sum(direction == 0)),
+        'horizons': {}
+    }
+    for j, h in enumerate(horizons):
+        r = returns[:, j]
+        summary['horizons'][str(h)] = {
+            'overall': _group_stats(zeros, ['all'], direction, r).get('all', {'signals': 0}),
+            'by_pattern': _group_stats(pattern, PATTERN_LABELS, direction, r),
+            'by_direction': _group_stats(direction_code, ['bullish', 'bearish', 'neutral'], direction, r),
+            'by_confidence': _group_stats(bucket, bucket_labels, direction, r),
+        }
+    return summary
+
+def _concat_signals(parts):
+    return {
+        key: np.concatenate([np.asarray(p[key]) for p in parts]) if parts else np.empty(0)
+        for key in ('direction', 'confidence', 'pattern', 'returns')
+    }
+
+def signals_from_predictions(ohlcv, predictions, horizons):
+    """Align stored prediction items with the candle at or before their created_at"""
+    timestamps = ohlcv['timestamp']
+    created = np.array([int(p['created_at']) for p in predictions], dtype=np.int64)
+    index = np.searchsorted(timestamps, created, side='right') - 1
+    known = index >= 0
+
+    pattern_codes = {name: i for i, name in enumerate(PATTERN_LABELS)}
+    pattern = np.array([
+        pattern_codes.get((p.get('patterns_detected') or [{}])[0].get('type'), len(PATTERN_CLASSES))
+        for p in predictions
+    ], dtype=np.int64)
+    direction = np.array([DIRECTION_CODES.get(p.get('direction'), 0) for p in predictions], dtype=np.int8)
+    confidence = np.array([float(p.get('confidence', 0)) for p in predictions])
+
+    return {
+        'direction': direction[known],
+        'confidence': confidence[known],
+        'pattern': pattern[known],
+        'returns': forward_returns(ohlcv['close'], index[known], horizons),
+    }
+
+def classify_windows(session, close, ends, window, batch_size=SCAN_BATCH_SIZE):
+    """Render the window ending at each index and return the model logits (len(ends) x classes)"""
+    input_info = session.get_inputs()[0]
+    batch_dim = input_info.shape[0]
+    chunk = batch_dim if isinstance(batch_dim, int) else batch_size
+
+    outputs = []
+    for start in range(0, len(ends), chunk):
+        batch_ends = ends[start:start + chunk]
+        batch = preprocess_images(
+            [render_price_chart(close[end - window + 1:end + 1]) for end in batch_ends],
+            out=batch_buffer(len(batch_ends))
+        )
+        outputs.append(session.run(None, {input_info.name: batch})[0])
+    return np.concatenate(outputs) if outputs else np.empty((0, len(PATTERN_CLASSES)), dtype=np.float32)
+
+def pipeline_signals(session, ohlcv, horizons, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE,
+                     batch_size=SCAN_BATCH_SIZE):
+    """Run the pattern + price trend + indicator pipeline at every stride-th candle
+
+    Mirrors generate_prediction with a single detected pattern, so the
+    pattern contributes its direction at full weight.
+    """
+    close = ohlcv['close']
+    ends = np.arange(window - 1, len(close), stride, dtype=np.int64)
+
+    logits = classify_windows(session, close, ends, window, batch_size).astype(np.float64)
+    pattern = np.argmax(logits, axis=1)
+    pattern_score = PATTERN_DIRECTION_CODES[pattern].astype(np.float64)
+
+    older = close[np.maximum(ends - (PRICE_TREND_LOOKBACK - 1), ends - window + 1)]
+    price_change = close[ends] / older - 1.0
+
+    # Indicators over the whole series, then the value at each window end:
+    # the same values the streaming state holds when the Lambda runs
+    features, _ = compute_indicators(ohlcv)
+    sentiment = indicator_score({name: values[ends] for name, values in features.items()}, close[ends])
+
+    final_score = (
+        pattern_score * PATTERN_WEIGHT
+        + price_change * PRICE_CHANGE_SCALE * PRICE_WEIGHT
+        + sentiment * SENTIMENT_WEIGHT
+    )
+    direction = np.where(final_score > DIRECTION_THRESHOLD, 1,
+                         np.where(final_score < -DIRECTION_THRESHOLD, -1, 0)).astype(np.int8)
+
+    return {
+        'direction': direction,
+        'confidence': np.minimum(np.abs(final_score), 1.0),
+        'pattern': pattern,
+        'returns': forward_returns(close, ends, horizons),
+    }
+
+def _init_worker(model_path, intra_op_threads):
+    global _session
+    config = session_config_from_env()
+    config['intra_op_threads'] = intra_op_threads
+    _session = create_inference_session(model_path, config)
+
+def backtest_symbol(task):
+    """Worker entry point: load one symbol's history and produce its signals"""
+    symbol, path, options = task
+    start_time = time.perf_counter()
+    ohlcv = slice_range(load_ohlcv(path), options['start'], options['end'])
+
+    if options['predictions'] is not None:
+        predictions = [p for p in options['predictions'] if p.get('symbol', symbol) == symbol]
+        signals = signals_from_predictions(ohlcv, predictions, options['horizons'])
+    else:
+        signals = pipeline_signals(_session, ohlcv, options['horizons'], options['window'],
+                                   options['stride'], options['batch_size'])
+
+    return symbol, len(ohlcv['close']), signals, time.perf_counter() - start_time
+
+def run_backtest(symbol_paths, options, workers=1, model_path=None):
+    """Backtest each (symbol, path) and return per-symbol and aggregate summaries"""
+    tasks = [(symbol, path, options) for symbol, path in symbol_paths]
+    threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+    if workers > 1 and len(tasks) > 1:
+        init = {'initializer': _init_worker, 'initargs': (model_path, threads)} if model_path else {}
+        with ProcessPoolExecutor(max_workers=workers, **init) as pool:
+            results = list(pool.map(backtest_symbol, tasks))
+    else:
+        if model_path:
+            _init_worker(model_path, os.cpu_count() or 1)
+        results = [backtest_symbol(task) for task in tasks]
+
+    symbols = {}
+    for symbol, candles, signals, elapsed in results:
+        symbols[symbol] = {
+            'candles': candles,
+            'elapsed_sec': elapsed,
+            'predictions_per_sec': len(signals['direction']) / elapsed if elapsed > 0 else None,
+            **summarize(signals, options['horizons']),
+        }
+        print(f"  {symbol:<12}{candles:>10,} candles {len(signals['direction']):>8,} predictions "
+              f"{elapsed:8.1f}s")
+
+    return {
+        'symbols': symbols,
+        'aggregate': summarize(_concat_signals([r[2] for r in results]), options['horizons']),
+    }
+
+def _timestamp_arg(value):
+    """Accept epoch seconds or an ISO date"""
+    return int(value) if value.isdigit() else int(datetime.fromisoformat(value).timestamp())
+
+def _load_predictions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest pattern predictions against forward returns')
+    parser.add_argument('--data-dir', required=True, help='Directory of <SYMBOL>.csv / <SYMBOL>.npz OHLCV files')
+    parser.add_argument('--symbols', help='Comma-separated symbols (default: every file in --data-dir)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--model', help='ONNX model to run the offline pipeline with')
+    source.add_argument('--predictions', help='JSON-lines export of stored predictions to evaluate')
+    parser.add_argument('--horizons', type=lambda v: [int(x) for x in v.split(',') if x], default=DEFAULT_HORIZONS,
+                        help='Forward return horizons in candles')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW)
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE)
+    parser.add_argument('--batch-size', type=int, default=SCAN_BATCH_SIZE)
+    parser.add_argument('--start', type=_timestamp_arg, help='First timestamp (epoch seconds or ISO date)')
+    parser.add_argument('--end', type=_timestamp_arg, help='Last timestamp (epoch seconds or ISO date)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes; symbols are distributed across them')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    files = {
+        os.path.splitext(name)[0]: os.path.join(args.data_dir, name)
+        for name in sorted(os.listdir(args.data_dir)) if name.endswith(('.csv', '.npz'))
+    }
+    symbols = args.symbols.split(',') if args.symbols else list(files)
+    missing = [s for s in symbols if s not in files]
+    if missing:
+        parser.error(f"No OHLCV file for: {', '.join(missing)}")
+
+    options = {
+        'horizons': args.horizons,
+        'window': args.window,
+        'stride': args.stride,
+        'batch_size': args.batch_size,
+        'start': args.start,
+        'end': args.end,
+        'predictions': _load_predictions(args.predictions) if args.predictions else None,
+    }
+
+    print("📊 Prediction Backtest")
+    print("=" * 60)
+    print(f"Mode: {'offline pipeline' if args.model else 'stored predictions'} | Symbols: {len(symbols)} | "
+          f"Horizons: {args.horizons} | Workers: {args.workers}")
+
+    start_time = time.perf_counter()
+    report = run_backtest([(s, files[s]) for s in symbols], options, args.workers, args.model)
+    elapsed = time.perf_counter() - start_time
+
+    report['config'] = {k: v for k, v in options.items() if k != 'predictions'}
+    report['config'].update({'model': args.model, 'predictions_file': args.predictions, 'workers': args.workers})
+    report['elapsed_sec'] = elapsed
+
+    print(f"\n✅ Done in {elapsed:.1f}s")
+    for h, stats in report['aggregate']['horizons'].items():
+        overall = stats['overall']
+        if overall['signals']:
+            print(f"  +{h:<5} candles: hit rate {overall['hit_rate']:.3f} over {overall['signals']:,} calls, "
+                  f"mean signed return {overall['mean_signed_return'] * 100:+.3f}%")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+
+    return report
+
+if __name__ == "__main__":
+    main()
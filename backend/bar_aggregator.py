@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+# Timeframe label -> bar length in seconds
+TIMEFRAMES = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600}
+BASE_TIMEFRAME = '1m'
+
+# 1m bars expire like ingested klines; coarser bars are cheap to keep longer
+TTL_DAYS = {'1m': 7, '5m': 30, '15m': 30, '1h': 90}
+
+class Bar:
+    """OHLCV accumulator for one symbol and timeframe period"""
+
+    __slots__ = ('symbol', 'timeframe', 'open_time', 'open', 'high', 'low', 'close', 'volume', 'trades')
+
+    def __init__(self, symbol, timeframe, open_time, price, quantity):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.open_time = open_time
+        self.open = self.high = self.low = self.close = price
+        self.volume = quantity
+        self.trades = 1
+
+    def add(self, price, quantity):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += quantity
+        self.trades += 1
+
+class BarAggregator:
+    """Builds OHLCV bars for several timeframes at once from a stream of ticks
+
+    Each tick updates the open bar of every timeframe for its symbol. A bar
+    is closed when a tick (or close_due) reaches the next period of its
+    timeframe; closed bars are queued and handed to on_flush in batches of
+    flush_size. Periods with no ticks produce no bar, and ticks for a
+    period that is already closed or older than the open bar are dropped
+    and counted in late_ticks.
+    """
+
+    def __init__(self, timeframes=None, flush_size=25, on_flush=None):
+        self.timeframes = dict(sorted(
+            ((tf, TIMEFRAMES[tf]) for tf in (timeframes or TIMEFRAMES)), key=lambda item: item[1]
+        ))
+        self.flush_size = flush_size
+        self.on_flush = on_flush
+        self.open_bars = {}  # symbol -> {timeframe: Bar}
+        self.closed_until = {}  # symbol -> {timeframe: open_time of the last closed bar}
+        self.closed = []
+        self.late_ticks = 0
+
+    def add_tick(self, symbol, timestamp, price, quantity=0.0):
+        """Fold one trade/ticker tick (timestamp in seconds) into every timeframe"""
+        bars = self.open_bars.setdefault(symbol, {})
+        closed_until = self.closed_until.setdefault(symbol, {})
+
+        # Timeframes are checked finest first: a tick that is in order for
+        # 1m is in order for every coarser timeframe, so bars stay consistent
+        for timeframe, seconds in self.timeframes.items():
+            open_time = int(timestamp // seconds) * seconds
+            bar = bars.get(timeframe)
+
+            if open_time <= closed_until.get(timeframe, -1) or (bar is not None and open_time < bar.open_time):
+                self.late_ticks += 1
+                return
+            if bar is not None and open_time == bar.open_time:
+                bar.add(price, quantity)
+                continue
+            if bar is not None:
+                self._close(bar)
+            bars[timeframe] = Bar(symbol, timeframe, open_time, price, quantity)
+
+        if len(self.closed) >= self.flush_size:
+            self.flush()
+
+    def close_due(self, now):
+        """Close open bars whose period ended before now, for symbols with no recent ticks"""
+        for bars in self.open_bars.values():
+            for timeframe, bar in list(bars.items()):
+                if bar.open_time + self.timeframes[timeframe] <= now:
+                    self._close(bar)
+                    del bars[timeframe]
+
+        if len(self.closed) >= self.flush_size:
+            self.flush()
+
+    def _close(self, bar):
+        self.closed.append(bar)
+        self.closed_until[bar.symbol][bar.timeframe] = bar.open_time
+
+    def flush(self):
+        """Hand all closed bars to on_flush (oldest first) and return them"""
+        bars, self.closed = self.closed, []
+        if bars and self.on_flush:
+            self.on_flush(bars)
+        return bars
+
+def bar_key(symbol, timeframe):
+    """market_data partition key: 1m bars share the kline rows, others get SYMBOL#tf"""
+    return symbol if timeframe == BASE_TIMEFRAME else f"{symbol}#{timeframe}"
+
+def bar_items(bars):
+    """market_data items for closed bars, shaped like the ingested kline rows"""
+    now = datetime.now()
+    return [
+        {
+            'symbol': bar_key(bar.symbol, bar.timeframe),
+            'timestamp': bar.open_time,
+            'open': Decimal(str(bar.open)),
+            'high': Decimal(str(bar.high)),
+            'low': Decimal(str(bar.low)),
+            'close': Decimal(str(bar.close)),
+            'volume': Decimal(str(bar.volume)),
+            'trades': bar.trades,
+            'ttl': int((now + timedelta(days=TTL_DAYS.get(bar.timeframe, 7))).timestamp())
+        }
+        for bar in bars
+    ]
+
+def write_bars(table, bars):
+    """Write closed bars with one batch_writer (25 items per request)"""
+    with table.batch_writer(overwrite_by_pkeys=['symbol', 'timestamp']) as batch:
+        for item in bar_items(bars):
+            batch.put_item(Item=item)
+    logger.info(f"Flushed {len(bars)} bars")
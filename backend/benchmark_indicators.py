@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Technical indicator benchmark
+=============================
+
+Times each indicator in indicators.py over synthetic OHLCV series of
+10k to 1M candles, plus the incremental path (state carried over a
+one-candle update), and compares the vectorized EMA with a plain Python
+loop on the smallest size.
+
+Usage:
+    python benchmark_indicators.py
+    python benchmark_indicators.py --sizes 10000,100000 --repeats 3 --output bench_indicators.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import indicators
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+def synthetic_ohlcv(n, seed=42):
+    """Random-walk OHLCV arrays with realistic BTC-like magnitudes"""
+    rng = np.random.default_rng(seed)
+    close = 60000 + np.cumsum(rng.normal(0, 50, n))
+    spread = rng.uniform(0, 40, n)
+    return {
+        'timestamp': np.arange(n, dtype=np.int64) * 60,
+        'open': close - rng.normal(0, 10, n),
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.uniform(1, 100, n),
+    }
+
+def time_call(fn, repeats):
+    """Best-of-N wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def python_ema(values, span):
+    """Reference scalar loop, for comparison only"""
+    alpha = 2.0 / (span + 1)
+    out = [values[0]]
+    for x in values[1:]:
+        out.append(alpha * x + (1 - alpha) * out[-1])
+    return out
+
+def run(sizes, repeats):
+    results = []
+
+    for n in sizes:
+        o = synthetic_ohlcv(n)
+        cases = {
+            'ema_26': lambda: indicators.ema(o['close'], 26),
+            'rsi_14': lambda: indicators.rsi(o['close'], 14),
+            'macd': lambda: indicators.macd(o['close']),
+            'atr_14': lambda: indicators.atr(o['high'], o['low'], o['close'], 14),
+            'bollinger_20': lambda: indicators.bollinger(o['close'], 20),
+            'vwap': lambda: indicators.vwap(o['high'], o['low'], o['close'], o['volume']),
+            'volatility_20': lambda: indicators.rolling_volatility(o['close'], 20),
+            'compute_indicators': lambda: indicators.compute_indicators(o),
+        }
+
+        _, state = indicators.compute_indicators({k: v[:-1] for k, v in o.items()})
+        last = {k: v[-1:] for k, v in o.items()}
+        cases['incremental_1_candle'] = lambda: indicators.compute_indicators(last, state=state)
+
+        print(f"\n📈 {n:,} candles")
+        for name, fn in cases.items():
+            ms = time_call(fn, repeats)
+            candles = 1 if name == 'incremental_1_candle' else n
+            results.append({
+                'indicator': name,
+                'candles': candles,
+                'history': n,
+                'time_ms': ms,
+                'candles_per_sec': candles * 1000 / ms if ms > 0 else None,
+            })
+            print(f"  {name:<22}{ms:10.2f} ms")
+
+    n = sizes[0]
+    closes = synthetic_ohlcv(n)['close']
+    loop_ms = time_call(lambda: python_ema(closes.tolist(), 26), repeats)
+    vector_ms = time_call(lambda: indicators.ema(closes, 26), repeats)
+    print(f"\n🐍 Python loop EMA on {n:,} candles: {loop_ms:.2f} ms "
+          f"({loop_ms / vector_ms:.1f}x slower than vectorized)")
+
+    return {
+        'results': results,
+        'python_loop_ema': {'candles': n, 'time_ms': loop_ms, 'vectorized_ms': vector_ms},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vectorized technical indicators')
+    parser.add_argument('--sizes', type=lambda v: [int(x) for x in v.split(',') if x], default=DEFAULT_SIZES)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    print("⏱️  Technical Indicator Benchmark")
+    print("=" * 60)
+    report = run(args.sizes, args.repeats)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+ONNX model inference benchmark
+==============================
+
+Measures latency percentiles and throughput of one or more ONNX model
+variants (fp32 / optimized / quantized) across batch sizes and intra-op
+thread counts, and writes machine-readable JSON so results can be compared
+between model versions.
+
+Session options other than the intra-op thread count come from the same
+ONNX_* environment variables as the pattern analysis Lambda (see
+onnx_session.py), so alternative settings can be compared by re-running
+with different variables.
+
+Usage:
+    python benchmark_model.py models/crypto_pattern_model_v14.onnx
+    python benchmark_model.py fp32=model.onnx int8=model_quantized.onnx \\
+        --batch-sizes 1,8,32 --threads 1,2,4 --output bench_v15.json
+    ONNX_ENABLE_MEM_PATTERN=0 python benchmark_model.py model.onnx --threads 2
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+import numpy as np
+import onnxruntime as ort
+
+from onnx_session import build_session_options, session_config_from_env
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+DEFAULT_THREADS = [1, 2, os.cpu_count() or 1]
+
+ONNX_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16,
+    'tensor(double)': np.float64,
+}
+
+def parse_model_arg(arg):
+    """Parse 'name=path' or 'path' into (name, path)"""
+    if '=' in arg:
+        name, path = arg.split('=', 1)
+    else:
+        path = arg
+        name = os.path.splitext(os.path.basename(path))[0]
+    return name, path
+
+def create_session(model_path, intra_op_threads):
+    """Create a CPU inference session with env session options and a fixed intra-op thread count"""
+    config = session_config_from_env()
+    config['intra_op_threads'] = intra_op_threads
+    options = build_session_options(config)
+    return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+def make_input(input_info, batch_size):
+    """Build a random input tensor matching the model input, with the given batch size"""
+    batch_dim = input_info.shape[0]
+    if isinstance(batch_dim, int) and batch_dim != batch_size:
+        return None  # Static batch dimension
+
+    shape = [batch_size] + [dim if isinstance(dim, int) else 1 for dim in input_info.shape[1:]]
+    dtype = ONNX_DTYPES.get(input_info.type, np.float32)
+    return np.random.randn(*shape).astype(dtype)
+
+def benchmark_session(session, input_array, warmup, iterations):
+    """Time session.run and return latency percentiles and throughput"""
+    feed = {session.get_inputs()[0].name: input_array}
+
+    for _ in range(warmup):
+        session.run(None, feed)
+
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        session.run(None, feed)
+        latencies[i] = (time.perf_counter() - start) * 1000
+
+    batch_size = input_array.shape[0]
+    return {
+        'latency_mean_ms': float(latencies.mean()),
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'throughput_samples_per_sec': float(batch_size * 1000 / latencies.mean()),
+    }
+
+def run_benchmarks(models, batch_sizes, thread_counts, warmup, iterations):
+    """Benchmark every model x thread count x batch size combination"""
+    results = []
+
+    for name, path in models:
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"\n📦 {name}: {path} ({size_mb:.1f} MB)")
+
+        for threads in thread_counts:
+            load_start = time.perf_counter()
+            session = create_session(path, threads)
+            load_ms = (time.perf_counter() - load_start) * 1000
+            input_info = session.get_inputs()[0]
+
+            for batch_size in batch_sizes:
+                input_array = make_input(input_info, batch_size)
+                if input_array is None:
+                    print(f"  ⏭️  threads={threads} batch={batch_size}: static batch dim {input_info.shape[0]}")
+                    continue
+
+                stats = benchmark_session(session, input_array, warmup, iterations)
+                results.append({
+                    'model': name,
+                    'path': path,
+                    'size_mb': size_mb,
+                    'session_load_ms': load_ms,
+                    'intra_op_threads': threads,
+                    'batch_size': batch_size,
+                    **stats
+                })
+
+                print(f"  threads={threads:<3} batch={batch_size:<3} "
+                      f"p50={stats['latency_p50_ms']:8.2f}ms "
+                      f"p95={stats['latency_p95_ms']:8.2f}ms "
+                      f"p99={stats['latency_p99_ms']:8.2f}ms "
+                      f"{stats['throughput_samples_per_sec']:9.1f} samples/sec")
+
+    return results
+
+def compare_variants(results):
+    """Speedup of each variant vs the first model, per (threads, batch) point"""
+    if not results:
+        return []
+
+    baseline_name = results[0]['model']
+    baseline = {
+        (r['intra_op_threads'], r['batch_size']): r
+        for r in results if r['model'] == baseline_name
+    }
+
+    comparisons = []
+    for r in results:
+        base = baseline.get((r['intra_op_threads'], r['batch_size']))
+        if r['model'] == baseline_name or base is None:
+            continue
+        comparisons.append({
+            'model': r['model'],
+            'baseline': baseline_name,
+            'intra_op_threads': r['intra_op_threads'],
+            'batch_size': r['batch_size'],
+            'p50_speedup': base['latency_p50_ms'] / r['latency_p50_ms'],
+            'throughput_ratio': r['throughput_samples_per_sec'] / base['throughput_samples_per_sec'],
+            'size_ratio': r['size_mb'] / base['size_mb'],
+        })
+
+    return comparisons
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ONNX model inference latency and throughput')
+    parser.add_argument('models', nargs='+', help="Model files as 'path' or 'name=path'; the first is the baseline")
+    parser.add_argument('--batch-sizes', type=parse_int_list, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--threads', type=parse_int_list, default=sorted(set(DEFAULT_THREADS)),
+                        help='Comma-separated intra-op thread counts')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout only)')
+    args = parser.parse_args()
+
+    models = [parse_model_arg(arg) for arg in args.models]
+    for _, path in models:
+        if not os.path.exists(path):
+            parser.error(f"Model file not found: {path}")
+
+    print("⏱️  ONNX Inference Benchmark")
+    print("=" * 60)
+    print(f"onnxruntime {ort.__version__} | {platform.processor() or platform.machine()} | "
+          f"{os.cpu_count()} CPUs")
+    print(f"Batch sizes: {args.batch_sizes} | Threads: {args.threads} | "
+          f"Warmup: {args.warmup} | Iterations: {args.iterations}")
+
+    results = run_benchmarks(models, args.batch_sizes, args.threads, args.warmup, args.iterations)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'session_config': session_config_from_env(),
+            'onnxruntime_version': ort.__version__,
+            'python_version': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'batch_sizes': args.batch_sizes,
+            'threads': args.threads,
+            'warmup': args.warmup,
+            'iterations': args.iterations,
+        },
+        'results': results,
+        'comparisons': compare_variants(results),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    return report
+
+if __name__ == "__main__":
+    main()
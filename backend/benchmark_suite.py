@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+Hot-path micro-benchmark suite
+==============================
+
+Times the per-request hot paths in isolation, on fixed synthetic inputs:
+chart rendering and upload for both analyzers, vision preprocessing
+(single chart and scan-sized batches), ONNX inference at several batch
+sizes, prediction building, Decimal/float conversion of DynamoDB items,
+JSON encoding of API responses and every ChartPatternGenerator.generate_*
+method used to build training data.
+
+Each benchmark is run in loops of at least --min-time seconds, repeated
+--repeats times. The best per-call time (least disturbed by other load,
+as in benchmark_indicators.py) is compared with the stored baseline
+(benchmark_baseline.json) and anything slower than its tolerance
+(--threshold unless the benchmark sets its own) fails the run; on shared
+runners raise --repeats to ride out bursts of noise. With --runs the
+suite is repeated and each benchmark keeps the median of its per-run
+best times; baselines are recorded that way. A gating benchmark that
+regresses is measured again (--confirm times) and only fails the run if
+it regressed every time. Benchmarks registered with gating=False (the
+matplotlib renders, which take a whole sample per call) are reported but
+never fail the run.
+
+AWS calls go to the in-memory stand-ins in local_aws.py. Without
+--model, inference uses a small patch-embedding ONNX graph built on the
+fly (needs the onnx package), so inference numbers track onnxruntime and
+preprocessing cost rather than the real model's.
+
+Usage:
+    python benchmark_suite.py                      # compare with the baseline
+    python benchmark_suite.py --filter json,dynamodb
+    python benchmark_suite.py --save-baseline --runs 3     # after an intended change
+    python benchmark_suite.py --save-baseline --runs 3 --filter json.response.new_case
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+TRAINING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'training')
+DEFAULT_THRESHOLD = float(os.environ.get('BENCHMARK_THRESHOLD', 0.25))
+INFERENCE_BATCH_SIZES = [1, 8, 32]
+
+# name -> setup(context) returning the zero-argument callable to time
+BENCHMARKS = {}
+# name -> {'gating', 'tolerance', 'min_time'} as registered
+BENCHMARK_SETTINGS = {}
+
+def benchmark(name, gating=True, tolerance=None, min_time=None):
+    """Register a benchmark setup
+
+    gating=False reports the benchmark without failing the run on it;
+    tolerance overrides --threshold and min_time raises --min-time for
+    benchmarks noisier than the rest.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        BENCHMARK_SETTINGS[name] = {'gating': gating, 'tolerance': tolerance, 'min_time': min_time}
+        return setup
+    return register
+
+def synthetic_market_data(n=100, symbol='BTCUSDT', seed=11):
+    """market_data items as DynamoDB returns them (Decimal numbers)"""
+    rng = np.random.default_rng(seed)
+    close = 60000 + np.cumsum(rng.normal(0, 50, n))
+    spread = rng.uniform(0, 40, n)
+    return [
+        {
+            'symbol': symbol,
+            'timestamp': Decimal(1_700_000_000 + 60 * i),
+            'open': Decimal(str(round(close[i] - rng.normal(0, 10), 2))),
+            'high': Decimal(str(round(close[i] + spread[i], 2))),
+            'low': Decimal(str(round(close[i] - spread[i], 2))),
+            'close': Decimal(str(round(close[i], 2))),
+            'volume': Decimal(str(round(rng.uniform(1, 100), 4))),
+            'trades': Decimal(int(rng.integers(10, 500))),
+            'ttl': Decimal(1_700_604_800),
+        }
+        for i in range(n)
+    ]
+
+def synthetic_onnx_model(path, n_classes, seed=5):
+    """Write a ViT-style patch embedding + pooled classifier with a dynamic batch dimension"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    weights = [
+        numpy_helper.from_array(rng.normal(0, 0.02, (192, 3, 16, 16)).astype(np.float32), 'patch_w'),
+        numpy_helper.from_array(np.zeros(192, dtype=np.float32), 'patch_b'),
+        numpy_helper.from_array(rng.normal(0, 0.02, (192, n_classes)).astype(np.float32), 'head_w'),
+        numpy_helper.from_array(np.zeros(n_classes, dtype=np.float32), 'head_b'),
+    ]
+    nodes = [
+        helper.make_node('Conv', ['pixel_values', 'patch_w', 'patch_b'], ['patches'], kernel_shape=[16, 16], strides=[16, 16]),
+        helper.make_node('Relu', ['patches'], ['activated']),
+        helper.make_node('ReduceMean', ['activated'], ['pooled'], axes=[2, 3], keepdims=0),
+        helper.make_node('Gemm', ['pooled', 'head_w', 'head_b'], ['logits']),
+    ]
+    graph = helper.make_graph(
+        nodes, 'synthetic_vision_model',
+        [helper.make_tensor_value_info('pixel_values', TensorProto.FLOAT, ['batch', 3, 224, 224])],
+        [helper.make_tensor_value_info('logits', TensorProto.FLOAT, ['batch', n_classes])],
+        initializer=weights,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+class Context:
+    """Handler modules wired to in-memory stand-ins, imported once for all benchmarks"""
+
+    def __init__(self, model=None):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('CHARTS_BUCKET', 'benchmark-charts')
+        for name in ('MARKET_DATA_TABLE', 'PREDICTIONS_TABLE', 'PATTERN_CACHE_TABLE'):
+            os.environ.setdefault(name, f"benchmark-{name.lower().replace('_', '-')}")
+
+        self.model_kind = 'file' if model else 'synthetic'
+        if not model:
+            try:
+                # Class count must match the analyzer, which isn't imported yet
+                model = synthetic_onnx_model(os.path.join(tempfile.mkdtemp(prefix='benchmark-model-'), 'model.onnx'), 10)
+            except ImportError:
+                print("⚠️  onnx not installed and no --model given; inference benchmarks will be skipped")
+                self.model_kind = None
+        if model:
+            os.environ['MODEL_PATH'] = model
+
+        import local_aws
+        import pattern_analysis
+        import pattern_analysis_vision
+
+        self.dynamodb = local_aws.InMemoryDynamoDB(key_schemas={os.environ['PREDICTIONS_TABLE']: ('prediction_id', None)})
+        self.s3 = local_aws.InMemoryS3()
+        for module in (pattern_analysis, pattern_analysis_vision):
+            module.dynamodb = self.dynamodb
+            module.s3 = self.s3
+
+        self.vision = pattern_analysis_vision.VisionPatternAnalyzer()
+        self.legacy = pattern_analysis.PatternAnalyzer()
+        self.market_data = synthetic_market_data()
+
+    def chart_array(self):
+        _, chart_array = self.vision.render_chart(self.market_data)
+        return chart_array
+
+    def patterns(self):
+        return self.vision.detect_patterns_with_vision(self.chart_array())
+
+    def sentiment(self):
+        return self.vision.analyze_sentiment('BTCUSDT', self.market_data)
+
+    def prediction(self):
+        return self.vision.build_prediction('BTCUSDT', self.market_data, self.patterns(), self.sentiment())
+
+@benchmark('chart.vision.generate_chart_image')
+def bench_vision_chart(ctx):
+    return lambda: ctx.vision.generate_chart_image(ctx.market_data, 'BTCUSDT')
+
+# pandas + matplotlib, hundreds of ms per call: too few calls per sample to gate on
+@benchmark('chart.legacy.generate_chart_image', gating=False, min_time=0.5)
+def bench_legacy_chart(ctx):
+    from pattern_cache import from_dynamodb
+    # pd.to_datetime rejects Decimal timestamps, so render from plain numbers
+    rows = [from_dynamodb(item) for item in ctx.market_data]
+    return lambda: ctx.legacy.generate_chart_image(rows, 'BTCUSDT')
+
+@benchmark('preprocess.preprocess_chart_for_vision', tolerance=0.4)
+def bench_preprocess(ctx):
+    chart_array = ctx.chart_array()
+    return lambda: ctx.vision.preprocess_chart_for_vision(chart_array)
+
+@benchmark('preprocess.preprocess_images.batch_32')
+def bench_preprocess_batch(ctx):
+    from pattern_analysis_vision import render_price_chart
+    from preprocessing import batch_buffer, preprocess_images
+    closes = np.array([float(item['close']) for item in ctx.market_data])
+    charts = [render_price_chart(closes[i:i + 50]) for i in range(32)]
+    return lambda: preprocess_images(charts, out=batch_buffer(len(charts)))
+
+def _inference_setup(batch_size):
+    def setup(ctx):
+        model = ctx.vision.model
+        if model is None:
+            raise ImportError('no ONNX model loaded')
+        image = ctx.vision.preprocess_chart_for_vision(ctx.chart_array())
+        batch = np.repeat(image, batch_size, axis=0)
+        input_name = model.get_inputs()[0].name
+        return lambda: model.run(None, {input_name: batch})
+    return setup
+
+for _batch_size in INFERENCE_BATCH_SIZES:
+    # Larger batches go through onnxruntime's thread pool, which schedules less evenly
+    benchmark(f"inference.onnx.batch_{_batch_size}",
+              tolerance=0.5 if _batch_size >= 32 else None)(_inference_setup(_batch_size))
+
+# Sub-millisecond pure-Python paths move more with interpreter and cache state
+@benchmark('prediction.vision.generate_prediction', tolerance=0.4)
+def bench_vision_prediction(ctx):
+    patterns, sentiment = ctx.patterns(), ctx.sentiment()
+    return lambda: ctx.vision.generate_prediction('BTCUSDT', ctx.market_data, patterns, sentiment)
+
+@benchmark('prediction.legacy.generate_prediction', tolerance=0.4)
+def bench_legacy_prediction(ctx):
+    patterns, sentiment = ctx.legacy.detect_patterns(None), ctx.legacy.analyze_sentiment('BTCUSDT')
+    return lambda: ctx.legacy.generate_prediction('BTCUSDT', ctx.market_data, patterns, sentiment)
+
+@benchmark('dynamodb.to_dynamodb.prediction', tolerance=0.4)
+def bench_to_dynamodb(ctx):
+    from pattern_cache import to_dynamodb
+    prediction = ctx.prediction()
+    return lambda: to_dynamodb(prediction)
+
+@benchmark('dynamodb.from_dynamodb.market_data_100', tolerance=0.4)
+def bench_from_dynamodb(ctx):
+    from pattern_cache import from_dynamodb
+    return lambda: [from_dynamodb(item) for item in ctx.market_data]
+
+@benchmark('json.response.predictions_10', tolerance=0.4)
+def bench_json_predictions(ctx):
+    from pattern_cache import summarize_patterns, to_dynamodb
+    prediction = ctx.prediction()
+    stored = {**to_dynamodb(prediction), 'patterns_detected': summarize_patterns(prediction['patterns_detected'])}
+    predictions = [dict(stored, prediction_id=str(i)) for i in range(10)]
+    return lambda: json.dumps({'predictions': predictions, 'count': len(predictions)}, default=str)
+
+@benchmark('json.response.market_data_100', tolerance=0.4)
+def bench_json_market_data(ctx):
+    return lambda: json.dumps({'symbol': 'BTCUSDT', 'market_data': ctx.market_data,
+                               'count': len(ctx.market_data)}, default=str)
+
+@benchmark('json.response.market_data_range_5000')
+def bench_json_market_data_range(ctx):
+    from pattern_cache import from_dynamodb
+    rows = [from_dynamodb(item) for item in synthetic_market_data(5000)]
+    return lambda: json.dumps({'symbol': 'BTCUSDT', 'interval': '1m', 'market_data': rows,
+                               'count': len(rows), 'next_start': None}, default=str)
+
+def _generator_setup(method):
+    def setup(ctx):
+        if TRAINING_DIR not in sys.path:
+            sys.path.append(TRAINING_DIR)
+        import matplotlib.pyplot as plt
+        from train_vision_transformer import ChartPatternGenerator
+        generator = ChartPatternGenerator(image_size=(224, 224))
+
+        def run():
+            image = getattr(generator, method)()
+            plt.close('all')
+            return image
+        return run
+    return setup
+
+for _method in ['head_and_shoulders', 'double_top', 'double_bottom', 'ascending_triangle',
+                'descending_triangle', 'cup_and_handle', 'bullish_flag', 'bearish_flag',
+                'support_resistance', 'breakout']:
+    # One matplotlib figure per call; tracked for training data generation, not gated
+    benchmark(f"training.generate_{_method}", gating=False, min_time=0.5)(_generator_setup(f"generate_{_method}"))
+
+def measure(fn, repeats, min_time):
+    """Median and best per-call seconds over repeats samples of at least min_time each
+
+    Like timeit, the garbage collector is off while timing so collections
+    triggered by earlier benchmarks don't land in this one.
+    """
+    fn()  # Warm caches and lazy imports
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _timed_samples(fn, repeats, min_time)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def _timed_samples(fn, repeats, min_time):
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / loops]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return statistics.median(samples), min(samples), loops
+
+def calibration_workload():
+    """Fixed mix of interpreter and numpy work that scales with the machine, not with this repo"""
+    total = 0
+    for i in range(20_000):
+        total += i * i
+    matrix = np.arange(4096, dtype=np.float64).reshape(64, 64)
+    return total + float((matrix @ matrix).sum())
+
+def machine_info():
+    import onnxruntime
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'onnxruntime': onnxruntime.__version__,
+        'cpus': os.cpu_count(),
+    }
+
+def run_suite(names, repeats, min_time, model=None):
+    ctx = Context(model)
+    results, skipped = {}, {}
+    calibrations = [measure(calibration_workload, repeats, min_time)[1]]
+    for name in names:
+        # Same inputs every run: generators and noise draw from the global RNGs
+        np.random.seed(0)
+        random.seed(0)
+        try:
+            fn = BENCHMARKS[name](ctx)
+        except ImportError as e:
+            skipped[name] = str(e)
+            print(f"  ⏭️  {name:<45} skipped ({e})")
+            continue
+        median, best, loops = measure(fn, repeats, max(min_time, BENCHMARK_SETTINGS[name]['min_time'] or 0))
+        results[name] = {'median_ms': round(median * 1000, 4), 'min_ms': round(best * 1000, 4), 'loops': loops}
+        print(f"  {name:<48} {median * 1000:>10.3f} ms  (best {best * 1000:.3f}, {loops} loops)")
+        # Sampled between benchmarks: shared machines change speed within a run
+        calibrations.append(measure(calibration_workload, repeats, min_time)[1])
+    # The median sample stands for the machine's speed this run; every entry records it
+    calibration = round(statistics.median(calibrations) * 1000, 4)
+    for result in results.values():
+        result['calibration_ms'] = calibration
+    return ctx, results, skipped, calibration
+
+def combine_runs(runs):
+    """One result set from several (results, calibration_ms) runs: the median of each figure
+
+    A single run can land in a burst of noise; the median of per-run best
+    times moves far less between sessions than any one run does.
+    """
+    calibration_ms = statistics.median(calibration for _, calibration in runs)
+    results = {}
+    for name in runs[0][0]:
+        per_run = [run[name] for run, _ in runs if name in run]
+        results[name] = {
+            'median_ms': round(statistics.median(r['median_ms'] for r in per_run), 4),
+            'min_ms': round(statistics.median(r['min_ms'] for r in per_run), 4),
+            'loops': max(r['loops'] for r in per_run),
+            'calibration_ms': round(statistics.median(r['calibration_ms'] for r in per_run), 4),
+            'runs': len(per_run),
+        }
+    return results, round(calibration_ms, 4)
+
+def compare(results, baseline, threshold, calibration_ms):
+    """Rows of (name, baseline ms, current ms, ratio, status) on best times; status is regressed/improved/ok/new
+
+    Ratios are divided by the change in calibration time since the
+    baseline entry was recorded, so a machine that
+    is uniformly slower this run (shared CI runners, thermal throttling)
+    doesn't read as a regression. A benchmark's own tolerance replaces
+    threshold.
+    """
+    rows = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            rows.append((name, None, result['min_ms'], None, 'new'))
+            continue
+        recorded = before.get('calibration_ms', baseline.get('calibration_ms'))
+        speed = calibration_ms / recorded if recorded else 1.0
+        tolerance = BENCHMARK_SETTINGS.get(name, {}).get('tolerance') or threshold
+        ratio = result['min_ms'] / (before['min_ms'] * speed) if before['min_ms'] else float('inf')
+        status = 'regressed' if ratio > 1 + tolerance else 'improved' if ratio < 1 - tolerance else 'ok'
+        rows.append((name, before['min_ms'], result['min_ms'], ratio, status))
+    return rows
+
+def save_baseline(path, report):
+    """Store report's results in the baseline at path, keeping entries for benchmarks not run
+
+    Every entry carries the calibration of the run that recorded it, so a
+    new benchmark can be added (--filter) without re-recording the others.
+    """
+    baseline = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baseline = json.load(f)
+    entries = baseline.get('results', {})
+    for result in entries.values():
+        result.setdefault('calibration_ms', baseline.get('calibration_ms'))
+    # Run-level fields describe the last full recording; a partial save only adds entries
+    if set(entries) <= set(report['results']):
+        baseline.update({key: value for key, value in report.items() if key not in ('results', 'skipped')})
+    for name, result in report['results'].items():
+        entries[name] = dict(result)
+    baseline['results'] = entries
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot-path micro-benchmarks with a stored baseline')
+    parser.add_argument('--filter', help='Comma-separated name prefixes to run (e.g. chart,json)')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=1, help='Run the suite this many times and keep the median')
+    parser.add_argument('--confirm', type=int, default=2,
+                        help='Re-measure regressed gating benchmarks this many times before failing')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Seconds per timed sample')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown of the best time vs the baseline (0.25 = 25%%), '
+                             'unless the benchmark sets its own')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Record these results in the baseline (only the benchmarks that ran)')
+    parser.add_argument('--model', help='ONNX model file for the inference benchmarks (default: synthetic graph)')
+    parser.add_argument('--list', action='store_true', help='List benchmark names and exit')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    prefixes = args.filter.split(',') if args.filter else None
+    names = [name for name in BENCHMARKS if not prefixes or any(name.startswith(p) for p in prefixes)]
+
+    print("⏱️  Hot-Path Benchmark Suite")
+    print("=" * 60)
+    logging.basicConfig(level=logging.WARNING)
+    runs = []
+    for run in range(args.runs):
+        if args.runs > 1:
+            print(f"\n🔁 Run {run + 1}/{args.runs}")
+        ctx, results, skipped, calibration_ms = run_suite(names, args.repeats, args.min_time, args.model)
+        runs.append((results, calibration_ms))
+    results, calibration_ms = combine_runs(runs) if args.runs > 1 else runs[0]
+    report = {
+        'machine': machine_info(),
+        'model': ctx.model_kind,
+        'calibration_ms': calibration_ms,
+        'repeats': args.repeats,
+        'runs': args.runs,
+        'min_time': args.min_time,
+        'results': results,
+        'skipped': skipped,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, report)
+        print(f"\n💾 {len(results)} baseline entries saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n⚠️  No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('machine') != report['machine'] or baseline.get('model') != report['model']:
+        print("\n⚠️  Baseline was recorded on a different machine, library versions or model; "
+              "ratios are indicative only")
+
+    rows = compare(results, baseline, args.threshold, calibration_ms)
+    if baseline.get('calibration_ms'):
+        print(f"\n📊 Calibration {calibration_ms:.3f} ms vs {baseline['calibration_ms']:.3f} ms in the baseline; "
+              f"ratios are adjusted for machine speed")
+    print(f"\n{'benchmark':<48} {'baseline':>10} {'best':>10} {'ratio':>7}")
+    icons = {'regressed': '❌', 'improved': '🚀', 'ok': '  ', 'new': '🆕'}
+    for name, before, after, ratio, status in rows:
+        before_text = f"{before:.3f}" if before is not None else '-'
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else '-'
+        icon = '⚠️ ' if status == 'regressed' and not BENCHMARK_SETTINGS[name]['gating'] else icons[status]
+        print(f"{name:<48} {before_text:>10} {after:>10.3f} {ratio_text:>7} {icon}")
+
+    slower = [row[0] for row in rows if row[4] == 'regressed']
+    regressed = [name for name in slower if BENCHMARK_SETTINGS[name]['gating']]
+    if len(slower) > len(regressed):
+        print(f"\n⚠️  {len(slower) - len(regressed)} non-gating benchmark(s) slower than baseline: "
+              f"{', '.join(name for name in slower if name not in regressed)}")
+    for attempt in range(args.confirm):
+        if not regressed:
+            break
+        print(f"\n🔁 Re-measuring {len(regressed)} regressed benchmark(s) ({attempt + 1}/{args.confirm})")
+        _, retry, _, retry_calibration = run_suite(regressed, args.repeats, args.min_time, args.model)
+        still = {row[0] for row in compare(retry, baseline, args.threshold, retry_calibration) if row[4] == 'regressed'}
+        regressed = [name for name in regressed if name in still]
+    if regressed:
+        print(f"\n❌ {len(regressed)} benchmark(s) slower than baseline beyond their tolerance: "
+              f"{', '.join(regressed)}")
+        return 1
+    print(f"\n✅ No regressions beyond tolerance ({args.threshold:.0%} unless set per benchmark)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,21 +8,34 @@ echo "Building Lambda deployment packages..."
 # Create dist directory
 mkdir -p dist
 
+# Helper modules (and the symbol registry file) imported by the handlers
+SHARED_MODULES="request_coalescing.py indicators.py streaming_indicators.py bar_aggregator.py stream_client.py backfill.py symbol_registry.py http_fetch.py archive.py packed_market_data.py pattern_cache.py pipeline.py metrics.py profiling.py preprocessing.py symbols.json"
+
 # Function to create deployment package
 create_package() {
     local function_name=$1
     local python_file=$2
+    local extra_requirements=$3
     
     echo "Creating package for $function_name..."
     
     # Create temporary directory
     temp_dir=$(mktemp -d)
     
-    # Install dependencies
-    pip3 install -r requirements_basic.txt -t $temp_dir
+    # Install dependencies as Linux wheels for the python3.11 runtime (numpy and pyarrow are
+    # native packages, so wheels built for the machine running this script won't import on Lambda)
+    pip3 install -r requirements_basic.txt $extra_requirements -t $temp_dir \
+        --platform manylinux2014_x86_64 --only-binary=:all: --python-version 3.11 --implementation cp
+    
+    # Refuse to ship extension modules built for another platform
+    if find $temp_dir -name "*.so" | grep -E "darwin|macosx|win_amd64|aarch64" > /dev/null; then
+        echo "Non-Linux x86_64 extension modules in $function_name package, aborting"
+        exit 1
+    fi
     
-    # Copy function code
+    # Copy function code and shared helper modules
     cp $python_file $temp_dir/index.py
+    cp $SHARED_MODULES $temp_dir/
     
     # Create zip package
     cd $temp_dir
@@ -39,6 +52,8 @@ create_package() {
 create_package "data-ingestion" "data_ingestion.py"
 create_package "pattern-analysis" "api_handler_simple.py"  # Reuse simple handler for now
 create_package "api-handler" "api_handler_simple.py"
+create_package "scheduler" "scheduler.py"
+create_package "archive" "archive.py" "pyarrow==14.0.2"
 
 echo "All Lambda packages created successfully!"
 echo ""
@@ -0,0 +1,196 @@
+import os
+import time
+import bisect
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', 0.5))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', 8))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+FETCH_CONCURRENCY = int(os.environ.get('FETCH_CONCURRENCY', 4))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+COINGECKO_PRICE_URL = os.environ.get('COINGECKO_PRICE_URL', 'https://api.coingecko.com/api/v3/simple/price')
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram with bucket-resolution percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms):
+        index = bisect.bisect_left(self.buckets, latency_ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.total_ms += latency_ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (None if empty)"""
+        with self._lock:
+            total = sum(self.counts)
+            if total == 0:
+                return None
+            rank = q / 100 * total
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            count = sum(self.counts)
+            buckets = {
+                ('le_inf' if bound == float('inf') else f"le_{bound}ms"): n
+                for bound, n in zip(self.buckets, self.counts)
+            }
+            mean = self.total_ms / count if count else None
+        return {
+            'count': count,
+            'mean_ms': mean,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': buckets,
+        }
+
+def _retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header (delta seconds or an HTTP date); None if malformed"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)  # "-0000" dates parse naive but are UTC
+    return when.timestamp() - time.time()
+
+class HTTPFetcher:
+    """Pooled keep-alive HTTP client with strict timeouts and retry on 429/5xx
+
+    One instance should live for the whole process (module-level in Lambda)
+    so warm invocations reuse its connections. Retries use full-jitter
+    exponential backoff, or the server's Retry-After when it sends one.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                 backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX, sleep=time.sleep):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.latency = LatencyHistogram()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        delay = _retry_after_seconds(retry_after) if retry_after else None
+        if delay is not None:
+            return min(max(delay, 0.0), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get_json(self, url, params=None):
+        """GET url and decode JSON, retrying transient failures up to max_retries times"""
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self._count('requests')
+            start = time.perf_counter()
+
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.latency.record((time.perf_counter() - start) * 1000)
+                if last_attempt:
+                    self._count('failures')
+                    raise
+                logger.warning(f"GET {url} failed ({e.__class__.__name__}), retrying")
+                self._count('retries')
+                self.sleep(self._retry_delay(attempt))
+                continue
+
+            self.latency.record((time.perf_counter() - start) * 1000)
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                logger.warning(f"GET {url} returned {response.status_code}, retrying")
+                self._count('retries')
+                self.sleep(self._retry_delay(attempt, response))
+                continue
+
+            if response.status_code >= 400:
+                self._count('failures')
+            response.raise_for_status()
+            return response.json()
+
+    def get_json_chunked(self, url, items, params_for_chunk, chunk_size, workers=FETCH_CONCURRENCY):
+        """Split items into chunks and GET them in parallel; returns [(chunk, result or exception)]
+
+        A failing chunk doesn't affect the others; callers decide what to do
+        with partial results.
+        """
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        def fetch(chunk):
+            try:
+                return chunk, self.get_json(url, params_for_chunk(chunk))
+            except Exception as e:
+                return chunk, e
+
+        if len(chunks) <= 1:
+            return [fetch(chunk) for chunk in chunks]
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            return list(pool.map(fetch, chunks))
+
+def fetch_coingecko_prices(fetcher, coin_ids, chunk_size=100, workers=FETCH_CONCURRENCY):
+    """USD prices for coin_ids via chunked parallel simple/price calls
+
+    Returns (prices, errors): prices merges every successful chunk's
+    {coin_id: {'usd': price}}; errors lists (chunk, message) for the rest.
+    """
+    results = fetcher.get_json_chunked(
+        COINGECKO_PRICE_URL, list(coin_ids),
+        lambda chunk: {'ids': ','.join(chunk), 'vs_currencies': 'usd'},
+        chunk_size, workers
+    )
+
+    prices = {}
+    errors = []
+    for chunk, result in results:
+        if isinstance(result, Exception):
+            logger.error(f"CoinGecko request for {len(chunk)} ids failed: {result}")
+            errors.append((chunk, str(result)))
+        else:
+            prices.update(result)
+    return prices, errors
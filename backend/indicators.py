@@ -0,0 +1,258 @@
+import numpy as np
+
+# Exponential smoothing is evaluated in closed form over blocks short enough
+# that decay ** block_length stays above exp(-EWM_BLOCK_LOG_RANGE), keeping
+# the cumulative sums well inside float64 range and precision
+EWM_BLOCK_LOG_RANGE = 20.0
+
+DEFAULT_PARAMS = {
+    'ema_fast': 12,
+    'ema_slow': 26,
+    'macd_signal': 9,
+    'rsi_period': 14,
+    'atr_period': 14,
+    'bollinger_period': 20,
+    'bollinger_std': 2.0,
+    'volatility_window': 20,
+}
+
+def ohlcv_arrays(market_data):
+    """Convert market_data items into float64 NumPy arrays sorted by timestamp
+
+    Rows written by the CoinGecko poll only carry 'price'; it is used for
+    open/high/low/close with zero volume so those rows don't break readers.
+    """
+    rows = sorted(market_data, key=lambda x: int(x['timestamp']))
+    n = len(rows)
+    arrays = {
+        'timestamp': np.fromiter((int(r['timestamp']) for r in rows), dtype=np.int64, count=n)
+    }
+    for field in ('open', 'high', 'low', 'close'):
+        arrays[field] = np.fromiter(
+            (float(r[field] if field in r else r['price']) for r in rows), dtype=np.float64, count=n
+        )
+    arrays['volume'] = np.fromiter((float(r.get('volume', 0)) for r in rows), dtype=np.float64, count=n)
+    return arrays
+
+def ewm(values, alpha, initial=None):
+    """Exponentially weighted mean y[t] = alpha * x[t] + (1 - alpha) * y[t-1] in O(n)
+
+    Without initial, y[0] = x[0] (pandas adjust=False); with initial, the
+    recursion continues from a previous y value, which is how incremental
+    updates resume.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(x)
+    n = len(x)
+    if n == 0:
+        return out
+
+    decay = 1.0 - alpha
+    start = 0
+    if initial is None:
+        out[0] = prev = x[0]
+        start = 1
+    else:
+        prev = float(initial)
+
+    if decay <= 0:
+        out[start:] = x[start:]
+        return out
+
+    block = max(1, int(EWM_BLOCK_LOG_RANGE / -np.log(decay)))
+    powers = decay ** np.arange(block + 1)
+
+    for b in range(start, n, block):
+        chunk = x[b:b + block]
+        m = len(chunk)
+        # y[j] = decay^(j+1) * prev + alpha * decay^j * sum_{i<=j} x[i] / decay^i
+        out[b:b + m] = powers[1:m + 1] * prev + alpha * powers[:m] * np.cumsum(chunk / powers[:m])
+        prev = out[b + m - 1]
+
+    return out
+
+def ema(values, span, initial=None):
+    """Exponential moving average with alpha = 2 / (span + 1)"""
+    return ewm(values, 2.0 / (span + 1), initial)
+
+def wilder(values, period, initial=None):
+    """Wilder's smoothing (RSI/ATR) with alpha = 1 / period"""
+    return ewm(values, 1.0 / period, initial)
+
+def rolling_sum(values, window, tail=None):
+    """Trailing-window sum in O(n); the first window-1 outputs cover the partial window
+
+    tail holds up to window-1 values preceding `values`, for incremental use.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    if tail is not None and len(tail):
+        x = np.concatenate([tail, x])
+    csum = np.concatenate([[0.0], np.cumsum(x)])
+    idx = np.arange(1, len(x) + 1)
+    sums = csum[idx] - csum[np.maximum(idx - window, 0)]
+    return sums[len(x) - len(values):]
+
+def rolling_mean_std(values, window, tail=None):
+    """Trailing-window mean and population std in O(n)"""
+    x = np.asarray(values, dtype=np.float64)
+    full = np.concatenate([tail, x]) if tail is not None and len(tail) else x
+    # Shift by a reference value so the sum of squares doesn't cancel catastrophically
+    ref = full[0] if len(full) else 0.0
+    shifted = full - ref
+    counts = np.minimum(np.arange(1, len(full) + 1), window)
+    sums = rolling_sum(shifted, window)
+    sq_sums = rolling_sum(shifted * shifted, window)
+    mean = sums / counts
+    var = np.maximum(sq_sums / counts - mean * mean, 0.0)
+    offset = len(full) - len(x)
+    return (mean + ref)[offset:], np.sqrt(var)[offset:]
+
+def rsi(close, period=14, state=None):
+    """Wilder RSI; returns (rsi, state) where state continues the series"""
+    close = np.asarray(close, dtype=np.float64)
+    prev_close = state['prev_close'] if state else close[0]
+    delta = np.diff(close, prepend=prev_close)
+    gains = np.maximum(delta, 0.0)
+    losses = np.maximum(-delta, 0.0)
+
+    avg_gain = wilder(gains, period, state['avg_gain'] if state else None)
+    avg_loss = wilder(losses, period, state['avg_loss'] if state else None)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), 100.0 - 100.0 / (1.0 + rs))
+
+    return values, {'prev_close': close[-1], 'avg_gain': avg_gain[-1], 'avg_loss': avg_loss[-1]}
+
+def macd(close, fast=12, slow=26, signal=9, state=None):
+    """MACD line, signal line and histogram; returns (macd, signal, hist, state)"""
+    fast_ema = ema(close, fast, state['ema_fast'] if state else None)
+    slow_ema = ema(close, slow, state['ema_slow'] if state else None)
+    macd_line = fast_ema - slow_ema
+    signal_line = ema(macd_line, signal, state['signal'] if state else None)
+    new_state = {'ema_fast': fast_ema[-1], 'ema_slow': slow_ema[-1], 'signal': signal_line[-1]}
+    return macd_line, signal_line, macd_line - signal_line, new_state
+
+def atr(high, low, close, period=14, state=None):
+    """Average true range (Wilder); returns (atr, state)"""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    prev_close = np.empty_like(close)
+    prev_close[1:] = close[:-1]
+    prev_close[0] = state['prev_close'] if state else close[0]
+
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    values = wilder(true_range, period, state['atr'] if state else None)
+    return values, {'prev_close': close[-1], 'atr': values[-1]}
+
+def bollinger(close, period=20, num_std=2.0, tail=None):
+    """Bollinger bands; returns (middle, upper, lower)"""
+    middle, std = rolling_mean_std(close, period, tail)
+    return middle, middle + num_std * std, middle - num_std * std
+
+def vwap(high, low, close, volume, state=None):
+    """Cumulative VWAP of the typical price; returns (vwap, state)"""
+    typical = (np.asarray(high) + np.asarray(low) + np.asarray(close)) / 3.0
+    volume = np.asarray(volume, dtype=np.float64)
+    pv = np.cumsum(typical * volume) + (state['pv'] if state else 0.0)
+    vol = np.cumsum(volume) + (state['volume'] if state else 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(vol > 0, pv / vol, typical)
+    return values, {'pv': pv[-1], 'volume': vol[-1]}
+
+def rolling_volatility(close, window=20, tail=None):
+    """Rolling std of log returns over `window` candles
+
+    tail holds the closes preceding `close` (at least one, up to window).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    full = np.concatenate([tail, close]) if tail is not None and len(tail) else close
+    log_returns = np.diff(np.log(full), prepend=np.log(full[0]))
+    _, std = rolling_mean_std(log_returns, window)
+    return std[len(full) - len(close):]
+
+def compute_indicators(ohlcv, params=None, state=None):
+    """Compute all indicators over OHLCV arrays; returns (features, state)
+
+    features maps indicator names to arrays aligned with the input. Passing
+    the returned state back with only the new candles continues every
+    indicator exactly where the previous call stopped.
+    """
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    state = state or {}
+    high, low, close, volume = ohlcv['high'], ohlcv['low'], ohlcv['close'], ohlcv['volume']
+    tail = state.get('close_tail')
+
+    ema_fast = ema(close, p['ema_fast'], state.get('ema_fast'))
+    ema_slow = ema(close, p['ema_slow'], state.get('ema_slow'))
+    macd_line = ema_fast - ema_slow
+    signal_line = ema(macd_line, p['macd_signal'], state.get('macd_signal'))
+
+    rsi_values, rsi_state = rsi(close, p['rsi_period'], state.get('rsi'))
+    atr_values, atr_state = atr(high, low, close, p['atr_period'], state.get('atr'))
+    middle, upper, lower = bollinger(
+        close, p['bollinger_period'], p['bollinger_std'],
+        tail[-(p['bollinger_period'] - 1):] if tail is not None else None
+    )
+    vwap_values, vwap_state = vwap(high, low, close, volume, state.get('vwap'))
+    volatility = rolling_volatility(
+        close, p['volatility_window'], tail[-p['volatility_window']:] if tail is not None else None
+    )
+
+    features = {
+        'ema_fast': ema_fast,
+        'ema_slow': ema_slow,
+        'rsi': rsi_values,
+        'macd': macd_line,
+        'macd_signal': signal_line,
+        'macd_hist': macd_line - signal_line,
+        'atr': atr_values,
+        'bb_middle': middle,
+        'bb_upper': upper,
+        'bb_lower': lower,
+        'vwap': vwap_values,
+        'volatility': volatility,
+    }
+
+    close = np.asarray(close, dtype=np.float64)
+    keep = max(p['bollinger_period'], p['volatility_window'])
+    full_tail = np.concatenate([tail, close]) if tail is not None else close
+
+    new_state = {
+        'ema_fast': ema_fast[-1],
+        'ema_slow': ema_slow[-1],
+        'macd_signal': signal_line[-1],
+        'rsi': rsi_state,
+        'atr': atr_state,
+        'vwap': vwap_state,
+        'close_tail': full_tail[-keep:],
+    }
+    return features, new_state
+
+def latest_features(features):
+    """Last value of each indicator as plain floats"""
+    return {name: float(values[-1]) for name, values in features.items() if len(values)}
+
+def indicator_score(latest, close):
+    """Combine the latest indicator values into a directional score in [-1, 1]
+
+    Trend (MACD histogram in ATR units) and momentum (RSI distance from 50)
+    push the score in their direction; a close stretched beyond the
+    Bollinger band pulls it back, since extended moves tend to revert.
+    Accepts scalars or equal-length arrays (one score per candle).
+    """
+    atr_value = np.asarray(latest['atr'], dtype=np.float64)
+    atr_value = np.where(atr_value != 0, atr_value, 1.0)
+    trend = np.tanh(latest['macd_hist'] / atr_value)
+    momentum = (np.asarray(latest['rsi']) - 50.0) / 50.0
+
+    half_band = np.asarray(latest['bb_upper'] - latest['bb_middle'], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        band_position = np.where(
+            half_band > 0, np.clip((close - latest['bb_middle']) / half_band, -1.0, 1.0), 0.0
+        )
+    overextension = np.sign(band_position) * np.maximum(np.abs(band_position) - 0.5, 0.0) * 2.0
+
+    score = np.clip(0.45 * trend + 0.35 * momentum - 0.2 * overextension, -1.0, 1.0)
+    return float(score) if score.ndim == 0 else score
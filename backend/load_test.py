@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Local load test
+===============
+
+Drives api_handler.lambda_handler and pattern_analysis_vision.lambda_handler
+with concurrent requests against in-memory DynamoDB/S3/Lambda stand-ins
+(local_aws.py) seeded with synthetic market data, then reports throughput
+and latency percentiles per operation. Nothing leaves the process, so runs
+are repeatable and can be compared before and after a change.
+
+Operations (weights set with --mix):
+    predictions        GET  /predictions?symbol=
+    patterns           GET  /patterns?symbol=
+    market_data        GET  /market-data?symbol=&limit=100
+    market_data_range  GET  /market-data?symbol=&start=&end= (last --range-hours)
+    create_prediction  POST /predictions (coalesced; starts an async analysis)
+    analysis           the analysis Lambda invoked directly, as the scheduler does
+    ingest             one new 1m candle for a symbol, as ingestion writes it
+
+The ONNX model is replaced by a stand-in session that sleeps
+--inference-ms per image unless --model points at a real model file.
+DynamoDB calls sleep --dynamodb-latency-ms to stay network-bound.
+
+Usage:
+    python load_test.py --requests 500 --concurrency 8
+    python load_test.py --duration 30 --mix predictions=50,analysis=50 --output load.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_MIX = 'predictions=35,patterns=20,market_data=20,market_data_range=10,create_prediction=5,analysis=5,ingest=5'
+TABLES = {
+    'MARKET_DATA_TABLE': 'load-test-market-data',
+    'PREDICTIONS_TABLE': 'load-test-predictions',
+    'PATTERN_CACHE_TABLE': 'load-test-pattern-cache',
+}
+SYNTHETIC_MODEL_PATH = 'synthetic://vision-model'
+
+def configure_environment(args):
+    """Environment the handler modules read at import time; must run before importing them"""
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('CHARTS_BUCKET', 'load-test-charts')
+    os.environ.setdefault('ENVIRONMENT', 'loadtest')
+    for name, table in TABLES.items():
+        os.environ.setdefault(name, table)
+    os.environ['MARKET_DATA_LAYOUT'] = args.layout
+    # An empty local archive keeps range reads off S3
+    os.environ['ARCHIVE_ROOT'] = args.archive_root or tempfile.mkdtemp(prefix='load-test-archive-')
+    os.environ['MODEL_PATH'] = args.model or SYNTHETIC_MODEL_PATH
+    # Each concurrent analysis stands for its own container with its own stage pool
+    os.environ.setdefault('PIPELINE_WORKERS', str(4 * args.concurrency))
+    os.environ.pop('PROFILE_MODE', None)
+
+class SyntheticSession:
+    """ONNX session stand-in: deterministic logits per input, inference_ms of sleep per image"""
+
+    class _Input:
+        name = 'pixel_values'
+        shape = ['batch', 3, 224, 224]
+
+    def __init__(self, n_classes, inference_ms):
+        self.n_classes = n_classes
+        self.inference_ms = inference_ms
+
+    def get_inputs(self):
+        return [self._Input()]
+
+    def get_outputs(self):
+        return [self._Input()]
+
+    def run(self, output_names, feeds):
+        batch = next(iter(feeds.values()))
+        time.sleep(self.inference_ms * len(batch) / 1000)
+        logits = []
+        for image in batch:
+            rng = np.random.default_rng(int(abs(float(image.mean())) * 1e6))
+            logits.append(rng.normal(0, 2, self.n_classes))
+        return [np.asarray(logits, dtype=np.float32)]
+
+def parse_mix(value):
+    """'op=weight,...' -> {op: weight}"""
+    mix = {}
+    for part in value.split(','):
+        op, _, weight = part.partition('=')
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {op!r} (operations: {', '.join(OPERATIONS)})")
+        mix[op] = float(weight or 1)
+    return mix
+
+def synthetic_candles(minutes, end, seed):
+    """A random-walk 1m candle series ending at the minute before end"""
+    rng = np.random.default_rng(seed)
+    timestamps = (end // 60 - minutes + np.arange(minutes)) * 60
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, minutes)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.0005, minutes)) * close
+    return {
+        'timestamp': timestamps.astype(np.int64),
+        'open': open_.round(4),
+        'high': (np.maximum(open_, close) + spread).round(4),
+        'low': (np.minimum(open_, close) - spread).round(4),
+        'close': close.round(4),
+        'volume': rng.uniform(1, 50, minutes).round(3),
+        'trades': rng.integers(10, 500, minutes),
+    }
+
+class LoadTest:
+    """Seeded stand-ins, the handlers under test and one method per operation"""
+
+    def __init__(self, args):
+        configure_environment(args)
+        import local_aws
+        import api_handler
+        import pattern_analysis_vision
+        from packed_market_data import write_candles
+        from symbol_registry import load_registry
+
+        self.args = args
+        self.api = api_handler
+        self.analysis = pattern_analysis_vision
+        self.write_candles = write_candles
+        self.rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+
+        self.dynamodb = local_aws.InMemoryDynamoDB(
+            latency_ms=args.dynamodb_latency_ms,
+            key_schemas={TABLES['PREDICTIONS_TABLE']: ('prediction_id', None)},
+            indexes={TABLES['PREDICTIONS_TABLE']: {'symbol-created_at-index': ('symbol', 'created_at')}},
+        )
+        self.s3 = local_aws.InMemoryS3()
+        function_name = f"cryptoai-analytics-pattern-analysis-{os.environ['ENVIRONMENT']}"
+        self.lambda_client = local_aws.InMemoryLambda({function_name: pattern_analysis_vision.lambda_handler},
+                                                      workers=args.concurrency)
+        api_handler.dynamodb = self.dynamodb
+        api_handler.lambda_client = self.lambda_client
+        pattern_analysis_vision.dynamodb = self.dynamodb
+        pattern_analysis_vision.s3 = self.s3
+        if not args.model:
+            pattern_analysis_vision._model_sessions[SYNTHETIC_MODEL_PATH] = SyntheticSession(
+                len(pattern_analysis_vision.PATTERN_CLASSES), args.inference_ms
+            )
+
+        self.symbols = load_registry().symbols()[:args.symbols]
+        self.latest = {}
+        self.seed()
+
+    def seed(self):
+        """Market data for every symbol, then one analysis each so predictions and patterns exist"""
+        from backfill import to_items
+
+        start = time.perf_counter()
+        table = self.dynamodb.Table(TABLES['MARKET_DATA_TABLE'])
+        # Seeding is not part of the measurement
+        latency, table.latency_ms = table.latency_ms, 0.0
+        end = int(time.time())
+        for i, symbol in enumerate(self.symbols):
+            candles = synthetic_candles(self.args.history_minutes, end, self.args.seed + i)
+            if self.args.layout == 'packed':
+                self.write_candles(table, symbol, candles, merge=False)
+            else:
+                with table.batch_writer() as batch:
+                    for item in to_items(symbol, candles):
+                        batch.put_item(Item=item)
+            self.latest[symbol] = int(candles['timestamp'][-1])
+        table.latency_ms = latency
+
+        for symbol in self.symbols:
+            self.analysis.lambda_handler({'symbol': symbol}, None)
+        print(f"🌱 Seeded {len(self.symbols)} symbols x {self.args.history_minutes} minutes "
+              f"({self.args.layout} layout) in {time.perf_counter() - start:.1f}s")
+
+    def symbol(self):
+        with self._lock:
+            return self.rng.choice(self.symbols)
+
+    def _get(self, path, **params):
+        return self.api.lambda_handler({'httpMethod': 'GET', 'path': path, 'queryStringParameters': params}, None)
+
+    def op_predictions(self):
+        return self._get('/predictions', symbol=self.symbol(), limit='10')
+
+    def op_patterns(self):
+        return self._get('/patterns', symbol=self.symbol(), hours='24')
+
+    def op_market_data(self):
+        return self._get('/market-data', symbol=self.symbol(), limit='100')
+
+    def op_market_data_range(self):
+        symbol = self.symbol()
+        end = self.latest[symbol]
+        return self._get('/market-data', symbol=symbol, start=str(end - self.args.range_hours * 3600), end=str(end))
+
+    def op_create_prediction(self):
+        return self.api.lambda_handler({'httpMethod': 'POST', 'path': '/predictions',
+                                        'body': json.dumps({'symbol': self.symbol()})}, None)
+
+    def op_analysis(self):
+        return self.analysis.lambda_handler({'symbol': self.symbol()}, None)
+
+    def op_ingest(self):
+        from packed_market_data import single_candle
+        from backfill import to_items
+
+        symbol = self.symbol()
+        with self._lock:
+            self.latest[symbol] += 60
+            timestamp = self.latest[symbol]
+        price = 100 + self.rng.random()
+        candle = single_candle(timestamp, price, price + 0.1, price - 0.1, price, 1.0, 1)
+        table = self.dynamodb.Table(TABLES['MARKET_DATA_TABLE'])
+        if self.args.layout == 'packed':
+            self.write_candles(table, symbol, candle)
+        else:
+            table.put_item(Item=to_items(symbol, candle)[0])
+        return {'statusCode': 200}
+
+    def warm_up(self, mix, rounds):
+        """Run each operation rounds times unmeasured, so one-off imports and caches don't skew percentiles"""
+        for _ in range(rounds):
+            for op in mix:
+                getattr(self, f"op_{op}")()
+        self.lambda_client.drain()
+        for table in self.dynamodb.tables.values():
+            table.request_count = table.read_units = table.write_units = 0
+
+    def run(self, mix, requests=None, duration=None, concurrency=1):
+        """Issue operations from concurrency threads; returns [(op, seconds, status)]"""
+        ops, weights = zip(*mix.items())
+        records = []
+        issued = [0]
+        deadline = time.perf_counter() + duration if duration else None
+
+        def next_op():
+            with self._lock:
+                if requests is not None and issued[0] >= requests:
+                    return None
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+                issued[0] += 1
+                return self.rng.choices(ops, weights)[0]
+
+        def worker():
+            local = []
+            while (op := next_op()) is not None:
+                start = time.perf_counter()
+                try:
+                    status = int(getattr(self, f"op_{op}")().get('statusCode', 200))
+                except Exception:
+                    status = 599
+                local.append((op, time.perf_counter() - start, status))
+            return local
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for result in [executor.submit(worker) for _ in range(concurrency)]:
+                records.extend(result.result())
+
+        # Analyses started by POST /predictions run asynchronously
+        for _, seconds, result in self.lambda_client.drain():
+            status = 599 if isinstance(result, Exception) else int(result.get('statusCode', 200))
+            records.append(('async_analysis', seconds, status))
+        return records
+
+OPERATIONS = [name[len('op_'):] for name in vars(LoadTest) if name.startswith('op_')]
+
+def summarize(records, wall_seconds):
+    """Per-operation count, errors, throughput and latency percentiles (ms)"""
+    by_op = {}
+    for op, seconds, status in records:
+        by_op.setdefault(op, []).append((seconds * 1000, status))
+
+    def stats(rows):
+        latencies = np.array([ms for ms, _ in rows])
+        return {
+            'count': len(rows),
+            'errors': sum(1 for _, status in rows if status >= 500),
+            'throughput_rps': round(len(rows) / wall_seconds, 2),
+            'mean_ms': round(float(latencies.mean()), 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p90_ms': round(float(np.percentile(latencies, 90)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'max_ms': round(float(latencies.max()), 2),
+        }
+
+    synchronous = [row for op, rows in by_op.items() if op != 'async_analysis' for row in rows]
+    return {
+        'wall_seconds': round(wall_seconds, 2),
+        'total': stats(synchronous) if synchronous else None,
+        'operations': {op: stats(rows) for op, rows in sorted(by_op.items())},
+    }
+
+def print_report(report, tables):
+    print(f"\n{'operation':<20} {'count':>6} {'err':>4} {'rps':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    rows = list(report['operations'].items())
+    if report['total']:
+        rows.append(('TOTAL (sync)', report['total']))
+    for op, s in rows:
+        print(f"{op:<20} {s['count']:>6} {s['errors']:>4} {s['throughput_rps']:>8.1f} "
+              f"{s['p50_ms']:>8.1f} {s['p90_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+    print("\n📊 DynamoDB during the run:")
+    for name, table in sorted(tables.items()):
+        print(f"  {name:<28} {table['requests']:>6} requests {table['read_units']:>7} RCU {table['write_units']:>6} WCU")
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test of the API and analysis Lambdas')
+    parser.add_argument('--requests', type=int, help='Total operations to issue (default 200 unless --duration)')
+    parser.add_argument('--duration', type=float, help='Run for this many seconds instead of a request count')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mix', type=parse_mix, default=None, help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--symbols', type=int, default=5, help='Registry symbols to seed and spread requests over')
+    parser.add_argument('--history-minutes', type=int, default=2 * 1440, help='Synthetic 1m candles per symbol')
+    parser.add_argument('--range-hours', type=int, default=6, help='Span of market_data_range requests')
+    parser.add_argument('--layout', choices=['rows', 'packed'], default=os.environ.get('MARKET_DATA_LAYOUT', 'rows'))
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=5.0)
+    parser.add_argument('--inference-ms', type=float, default=40.0, help='Stand-in model latency per image')
+    parser.add_argument('--model', help='Real ONNX model to use instead of the stand-in')
+    parser.add_argument('--archive-root', help='Parquet archive to serve ranges from (default: empty temp dir)')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured rounds of every operation (0 keeps cold starts)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--verbose', action='store_true', help='Keep the handlers\' INFO logs')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+    mix = args.mix or parse_mix(DEFAULT_MIX)
+    requests = args.requests if args.requests or args.duration else 200
+
+    print("🏋️  Local Load Test")
+    print("=" * 60)
+    # Configured before the handler modules' basicConfig(INFO), which then does nothing
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    load_test = LoadTest(args)
+
+    print(f"🚀 {requests or f'{args.duration:.0f}s of'} operations, concurrency {args.concurrency}, "
+          f"mix {', '.join(f'{op}={w:g}' for op, w in mix.items())}")
+    load_test.warm_up(mix, args.warmup)
+    start = time.perf_counter()
+    records = load_test.run(mix, requests=requests, duration=args.duration, concurrency=args.concurrency)
+    report = summarize(records, time.perf_counter() - start)
+    report['config'] = {k: v for k, v in vars(args).items() if k not in ('output', 'verbose')}
+    report['config']['mix'] = mix
+    report['dynamodb'] = {
+        name: {'requests': t.request_count, 'read_units': t.read_units, 'write_units': t.write_units}
+        for name, t in load_test.dynamodb.tables.items()
+    }
+    print_report(report, report['dynamodb'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main()
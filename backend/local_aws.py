@@ -0,0 +1,492 @@
+import re
+import json
+import math
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from botocore.exceptions import ClientError
+
+def item_size(item):
+    """Approximate DynamoDB item size in bytes, per the documented sizing rules
+
+    Names and strings count their UTF-8 bytes, binary its length, numbers
+    about one byte per two significant digits plus one, and lists/maps 3
+    bytes plus one per element on top of their contents.
+    """
+    return sum(len(name.encode()) + _value_size(value) for name, value in item.items())
+
+def _value_size(value):
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray)) or hasattr(value, 'value'):
+        return len(getattr(value, 'value', value))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        digits = Decimal(str(value)).normalize().as_tuple().digits
+        return (len(digits) + 1) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(k.encode()) + _value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 3 + sum(1 + _value_size(v) for v in value)
+    return len(str(value).encode())
+
+class InMemoryTable:
+    """Thread-safe in-process stand-in for a boto3 DynamoDB Table
+
+    Supports the subset of the Table API this backend uses: put/get/delete
+    items, update_item with SET/ADD/REMOVE, batch_writer, and query/scan
+    with plain key conditions (boto3.dynamodb.conditions Key objects on the
+    hash and range keys). ConditionExpression on put/update/delete is
+    evaluated atomically with the write (comparisons, attribute_exists,
+    attribute_not_exists and begins_with joined by AND/OR/NOT, as strings
+    or boto3 Attr conditions) and raises ConditionalCheckFailedException.
+    Queries with IndexName use the (hash, range) keys given in indexes.
+    latency_ms adds a per-request delay so benchmarks see network-bound
+    behaviour; a batch write of up to 25 items counts as one request.
+    write_units and read_units accumulate the capacity the same calls would
+    consume (1 KB per item written, 4 KB per strongly consistent read).
+    """
+
+    def __init__(self, name, hash_key='symbol', range_key='timestamp', latency_ms=0.0, indexes=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes or {}
+        self.latency_ms = latency_ms
+        self.items = {}
+        # hash key value -> {key: item}, so table queries only look at one partition
+        self.partitions = {}
+        self.request_count = 0
+        self.write_units = 0
+        self.read_units = 0
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return (item[self.hash_key], item.get(self.range_key)) if self.range_key else (item[self.hash_key],)
+
+    def _store(self, item):
+        # Callers hold self._lock
+        key = self._key(item)
+        self.items[key] = item
+        self.partitions.setdefault(key[0], {})[key] = item
+
+    def _remove(self, key):
+        # Callers hold self._lock
+        key = self._key(key)
+        if self.items.pop(key, None) is not None:
+            self.partitions[key[0]].pop(key, None)
+
+    def _request(self, write_units=0, read_bytes=None):
+        with self._lock:
+            self.request_count += 1
+            self.write_units += write_units
+            if read_bytes is not None:
+                self.read_units += max(1, math.ceil(read_bytes / 4096))
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _check(self, existing, kwargs, operation):
+        # Callers hold self._lock; failed conditional writes still consume a write unit
+        if 'ConditionExpression' in kwargs and not evaluate_condition(kwargs, existing or {}):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                         'Message': 'The conditional request failed'}}, operation)
+
+    def put_item(self, Item, **kwargs):
+        self._request(write_units=math.ceil(item_size(Item) / 1024))
+        with self._lock:
+            self._check(self.items.get(self._key(Item)), kwargs, 'PutItem')
+            self._store(dict(Item))
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ReturnValues='NONE', **kwargs):
+        self._request(write_units=1)
+        with self._lock:
+            existing = self.items.get(self._key(Key))
+            self._check(existing, kwargs, 'UpdateItem')
+            item = apply_update(dict(existing or Key), UpdateExpression, kwargs)
+            self._store(item)
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': dict(item)}
+        if ReturnValues == 'ALL_OLD' and existing is not None:
+            return {'Attributes': dict(existing)}
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self._lock:
+            item = self.items.get(self._key(Key))
+        self._request(read_bytes=item_size(item) if item is not None else 0)
+        return {'Item': dict(item)} if item is not None else {}
+
+    def delete_item(self, Key, **kwargs):
+        self._request(write_units=1)
+        with self._lock:
+            self._check(self.items.get(self._key(Key)), kwargs, 'DeleteItem')
+            self._remove(Key)
+        return {}
+
+    def batch_write(self, puts=(), deletes=()):
+        """One BatchWriteItem request (at most 25 operations)"""
+        if len(puts) + len(deletes) > 25:
+            raise ClientError({'Error': {'Code': 'ValidationException',
+                                         'Message': 'Too many items in batch write'}}, 'BatchWriteItem')
+        self._request(write_units=sum(math.ceil(item_size(item) / 1024) for item in puts) + len(deletes))
+        with self._lock:
+            for item in puts:
+                self._store(dict(item))
+            for key in deletes:
+                self._remove(key)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return InMemoryBatchWriter(self)
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None,
+              IndexName=None, **kwargs):
+        terms = _flatten_condition(KeyConditionExpression)
+        conditions = [_predicate(*term) for term in terms]
+        hash_key, range_key = self.indexes[IndexName] if IndexName else (self.hash_key, self.range_key)
+        # A table query names its partition; index queries scan every item
+        partition = next((args[0] for name, operator, args in terms
+                          if not IndexName and name == self.hash_key and operator == '='), None)
+        with self._lock:
+            candidates = self.items if partition is None else self.partitions.get(partition, {})
+            rows = [dict(item) for item in candidates.values() if all(c(item) for c in conditions)]
+
+        rows.sort(key=lambda item: item.get(range_key, 0), reverse=not ScanIndexForward)
+        if ExclusiveStartKey is not None:
+            last = ExclusiveStartKey[range_key]
+            rows = [r for r in rows if (r[range_key] < last if not ScanIndexForward else r[range_key] > last)]
+
+        response = {'Items': rows[:Limit] if Limit else rows}
+        if Limit and len(rows) > Limit:
+            last_item = rows[Limit - 1]
+            keys = {self.hash_key, hash_key} | ({self.range_key, range_key} - {None})
+            response['LastEvaluatedKey'] = {key: last_item[key] for key in keys}
+        response['Count'] = len(response['Items'])
+        self._request(read_bytes=sum(item_size(item) for item in response['Items']))
+        return response
+
+    def scan(self, **kwargs):
+        with self._lock:
+            rows = [dict(item) for item in self.items.values()]
+        self._request(read_bytes=sum(item_size(item) for item in rows))
+        return {'Items': rows, 'Count': len(rows)}
+
+class InMemoryBatchWriter:
+    """Buffers puts/deletes and flushes them 25 at a time, like boto3's BatchWriter"""
+
+    def __init__(self, table):
+        self.table = table
+        self._puts = []
+        self._deletes = []
+
+    def put_item(self, Item):
+        self._puts.append(Item)
+        self._flush_if_full()
+
+    def delete_item(self, Key):
+        self._deletes.append(Key)
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._puts) + len(self._deletes) >= 25:
+            self._flush()
+
+    def _flush(self):
+        while self._puts or self._deletes:
+            puts, self._puts = self._puts[:25], self._puts[25:]
+            room = 25 - len(puts)
+            deletes, self._deletes = self._deletes[:room], self._deletes[room:]
+            self.table.batch_write(puts, deletes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._flush()
+        return False
+
+class InMemoryDynamoDB:
+    """Stand-in for boto3.resource('dynamodb'); tables are created on first access
+
+    key_schemas maps table names to (hash, range) keys (default symbol,
+    timestamp) and indexes maps them to {index name: (hash, range)}.
+    """
+
+    def __init__(self, latency_ms=0.0, key_schemas=None, indexes=None):
+        self.latency_ms = latency_ms
+        self.key_schemas = key_schemas or {}
+        self.indexes = indexes or {}
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self.tables:
+                hash_key, range_key = self.key_schemas.get(name, ('symbol', 'timestamp'))
+                self.tables[name] = InMemoryTable(name, hash_key, range_key, self.latency_ms, self.indexes.get(name))
+            return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        """One BatchGetItem request (at most 100 keys); every key is processed"""
+        if sum(len(request['Keys']) for request in RequestItems.values()) > 100:
+            raise ClientError({'Error': {'Code': 'ValidationException',
+                                         'Message': 'Too many items requested for the BatchGetItem call'}},
+                              'BatchGetItem')
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            with table._lock:
+                found = [dict(table.items[table._key(key)]) for key in request['Keys']
+                         if table._key(key) in table.items]
+            table._request(read_bytes=sum(item_size(item) for item in found))
+            responses[name] = found
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+class InMemoryS3:
+    """Stand-in for boto3.client('s3') covering put_object/get_object"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode()
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': Key}}, 'GetObject')
+        return {'Body': _Body(self.objects[(Bucket, Key)])}
+
+class InMemoryLambda:
+    """Stand-in for boto3.client('lambda') dispatching invoke() to in-process handlers
+
+    functions maps function names to handlers. 'Event' invocations run on a
+    thread pool like Lambda's async queue; drain() waits for them and
+    returns their (function name, seconds, response or exception).
+    """
+
+    def __init__(self, functions, workers=4):
+        self.functions = functions
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lambda')
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def _call(self, name, event):
+        start = time.perf_counter()
+        try:
+            result = self.functions[name](event, None)
+        except Exception as e:
+            result = e
+        return name, time.perf_counter() - start, result
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'{}', **kwargs):
+        if FunctionName not in self.functions:
+            raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': FunctionName}}, 'Invoke')
+        event = json.loads(Payload)
+        metadata = {'RequestId': str(uuid.uuid4())}
+        if InvocationType == 'Event':
+            future = self.executor.submit(self._call, FunctionName, event)
+            with self._lock:
+                self.pending.append(future)
+            return {'StatusCode': 202, 'ResponseMetadata': metadata}
+
+        _, _, result = self._call(FunctionName, event)
+        if isinstance(result, Exception):
+            raise result
+        return {'StatusCode': 200, 'Payload': _Body(json.dumps(result, default=str).encode()),
+                'ResponseMetadata': metadata}
+
+    def drain(self):
+        with self._lock:
+            pending, self.pending = self.pending, []
+        return [future.result() for future in pending]
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+def _flatten_condition(condition):
+    """Turn a boto3 key condition (Key('a').eq(x) & Key('b').between(y, z)) into (name, operator, args) terms"""
+    operator = condition.expression_operator
+    values = condition.get_expression()['values']
+
+    if operator == 'AND':
+        return _flatten_condition(values[0]) + _flatten_condition(values[1])
+
+    return [(values[0].name, operator, [_comparable(v) for v in values[1:]])]
+
+def _predicate(name, operator, args):
+    tests = {
+        '=': lambda v: v == args[0],
+        '<': lambda v: v < args[0],
+        '<=': lambda v: v <= args[0],
+        '>': lambda v: v > args[0],
+        '>=': lambda v: v >= args[0],
+        'BETWEEN': lambda v: args[0] <= v <= args[1],
+        'begins_with': lambda v: str(v).startswith(args[0]),
+    }
+    test = tests[operator]
+    return lambda item: name in item and test(_comparable(item[name]))
+
+def _comparable(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+_TOKEN = re.compile(r"\s*(<>|<=|>=|[=<>(),]|[#:]?[A-Za-z_][\w.]*)")
+_COMPARISONS = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+def _expression(kwargs, key='ConditionExpression'):
+    """(expression string, names, values) of a request, rendering boto3 condition objects"""
+    expression = kwargs[key]
+    names = dict(kwargs.get('ExpressionAttributeNames', {}))
+    values = dict(kwargs.get('ExpressionAttributeValues', {}))
+    if isinstance(expression, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(expression)
+        expression = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+    return expression, names, values
+
+def _tokens(expression):
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise ValueError(f"Unsupported expression near: {expression[position:]!r}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+class _ConditionParser:
+    """Recursive-descent evaluator for DynamoDB condition expressions against one item"""
+
+    def __init__(self, expression, names, values, item):
+        self.tokens = _tokens(expression)
+        self.names = names
+        self.values = values
+        self.item = item
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and (token or '').upper() != expected:
+            raise ValueError(f"Expected {expected}, got {token}")
+        self.position += 1
+        return token
+
+    def evaluate(self):
+        result = self.disjunction()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek()}")
+        return result
+
+    def disjunction(self):
+        result = self.conjunction()
+        while (self.peek() or '').upper() == 'OR':
+            self.take()
+            result = self.conjunction() or result
+        return result
+
+    def conjunction(self):
+        result = self.negation()
+        while (self.peek() or '').upper() == 'AND':
+            self.take()
+            result = self.negation() and result
+        return result
+
+    def negation(self):
+        if (self.peek() or '').upper() == 'NOT':
+            self.take()
+            return not self.negation()
+        return self.primary()
+
+    def primary(self):
+        if self.peek() == '(':
+            self.take()
+            result = self.disjunction()
+            self.take(')')
+            return result
+
+        token = self.take()
+        if self.peek() == '(':
+            # Function call: attribute_exists(path), begins_with(path, :prefix), ...
+            self.take()
+            args = [self.take()]
+            while self.peek() == ',':
+                self.take()
+                args.append(self.take())
+            self.take(')')
+            return self.function(token, args)
+
+        left = self.operand(token)
+        operator = self.take()
+        if operator.upper() == 'BETWEEN':
+            low = self.operand(self.take())
+            self.take('AND')
+            high = self.operand(self.take())
+            return None not in (left, low, high) and low <= left <= high
+        right = self.operand(self.take())
+        if left is None or right is None:
+            return operator == '<>' and left is not right
+        return _COMPARISONS[operator](left, right)
+
+    def function(self, name, args):
+        if name == 'attribute_exists':
+            return self.attribute(args[0]) in self.item
+        if name == 'attribute_not_exists':
+            return self.attribute(args[0]) not in self.item
+        if name == 'begins_with':
+            value = self.operand(args[0])
+            return isinstance(value, str) and value.startswith(self.operand(args[1]))
+        raise ValueError(f"Unsupported condition function {name}")
+
+    def attribute(self, token):
+        return self.names[token] if token.startswith('#') else token
+
+    def operand(self, token):
+        if token.startswith(':'):
+            return _comparable(self.values[token])
+        value = self.item.get(self.attribute(token))
+        return _comparable(value) if value is not None else None
+
+def evaluate_condition(kwargs, item):
+    """Whether item (a dict, empty if absent) satisfies a request's ConditionExpression"""
+    expression, names, values = _expression(kwargs)
+    return _ConditionParser(expression, names, values, item).evaluate()
+
+def apply_update(item, update_expression, kwargs):
+    """item with an UpdateExpression's SET, ADD and REMOVE clauses applied"""
+    names = kwargs.get('ExpressionAttributeNames', {})
+    values = kwargs.get('ExpressionAttributeValues', {})
+    attribute = lambda token: names[token] if token.startswith('#') else token
+
+    clauses = re.split(r"\b(SET|ADD|REMOVE)\b", update_expression, flags=re.IGNORECASE)[1:]
+    for action, body in zip(clauses[::2], clauses[1::2]):
+        for part in filter(None, (p.strip() for p in body.split(','))):
+            action = action.upper()
+            if action == 'SET':
+                name, value = (side.strip() for side in part.split('=', 1))
+                item[attribute(name)] = values[value]
+            elif action == 'ADD':
+                name, value = part.split()
+                item[attribute(name)] = item.get(attribute(name), 0) + values[value]
+            else:
+                item.pop(attribute(part), None)
+    return item
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CryptoAI/Analytics')
+ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+# 'stdout' prints Embedded Metric Format lines, which CloudWatch Logs turns into
+# metrics; 'log' sends them to the debug log; 'off' drops them
+METRICS_SINK = os.environ.get('METRICS_SINK', 'stdout' if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') else 'off')
+# Fraction of hot-path calls (per stored item, per payload) that are timed
+HOT_PATH_SAMPLE_RATE = float(os.environ.get('METRICS_HOT_PATH_SAMPLE_RATE', 0.05))
+# Long-running loops (the WebSocket stream) flush at most this often
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 60))
+
+EMF_MAX_VALUES = 100  # Values per metric in one EMF document
+
+def _stdout_sink(doc):
+    sys.stdout.write(json.dumps(doc) + '\n')
+    sys.stdout.flush()
+
+def _log_sink(doc):
+    logger.debug(json.dumps(doc))
+
+SINKS = {'stdout': _stdout_sink, 'log': _log_sink, 'off': None}
+
+def _bucket(value):
+    """Round to two significant figures so a histogram keeps few distinct values"""
+    return float(f"{value:.2g}")
+
+class Metrics:
+    """Thread-safe counters and histograms flushed as CloudWatch EMF documents
+
+    Counters are plain sums. Histograms keep {rounded value: count} and are
+    emitted as EMF Values/Counts; a value recorded with sample_rate r counts
+    1/r times so sampled metrics still estimate totals.
+    """
+
+    def __init__(self, namespace=METRICS_NAMESPACE, sink=None, dimensions=None, rng=random.random):
+        self.namespace = namespace
+        self.sink = sink if sink is not None else SINKS.get(METRICS_SINK)
+        self.default_dimensions = dimensions if dimensions is not None else {
+            'Environment': ENVIRONMENT,
+            'Function': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local'),
+        }
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.dimensions = dict(self.default_dimensions)
+        self.counters = {}
+        self.histograms = {}
+        self.units = {}
+
+    def set_dimension(self, name, value):
+        """Add a dimension to the documents of the next flush"""
+        with self._lock:
+            self.dimensions[name] = str(value)
+
+    def sampled(self, sample_rate):
+        return sample_rate >= 1.0 or self.rng() < sample_rate
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.units[name] = 'Count'
+
+    def _add(self, name, value, unit, sample_rate):
+        bucket = _bucket(value)
+        with self._lock:
+            histogram = self.histograms.setdefault(name, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1.0 / min(sample_rate, 1.0)
+            self.units[name] = unit
+
+    def record(self, name, value, unit='Milliseconds', sample_rate=1.0):
+        """Add one observation to a histogram (skipped unless sampled)"""
+        if self.sampled(sample_rate):
+            self._add(name, value, unit, sample_rate)
+
+    @contextmanager
+    def timer(self, name, sample_rate=1.0):
+        """Time the block into the name histogram in milliseconds; unsampled calls aren't timed"""
+        if not self.sampled(sample_rate):
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, (time.perf_counter() - start) * 1000, 'Milliseconds', sample_rate)
+
+    def timed(self, name, sample_rate=1.0):
+        """Decorator form of timer"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, sample_rate):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def documents(self):
+        """EMF documents for everything recorded since the last flush, and reset"""
+        with self._lock:
+            counters, histograms, units, dimensions = self.counters, self.histograms, self.units, self.dimensions
+            self._reset()
+
+        if not counters and not histograms:
+            return []
+
+        # EMF caps each metric at 100 values, so long histograms span several documents
+        chunks = {name: sorted(values.items()) for name, values in histograms.items()}
+        n_docs = max([1] + [-(-len(values) // EMF_MAX_VALUES) for values in chunks.values()])
+        timestamp = int(time.time() * 1000)
+
+        docs = []
+        for i in range(n_docs):
+            doc = dict(dimensions)
+            if i == 0:
+                doc.update(counters)
+            for name, values in chunks.items():
+                part = values[i * EMF_MAX_VALUES:(i + 1) * EMF_MAX_VALUES]
+                if part:
+                    doc[name] = {'Values': [v for v, _ in part], 'Counts': [c for _, c in part]}
+            names = [name for name in doc if name not in dimensions]
+            doc['_aws'] = {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': units[name]} for name in names],
+                }]
+            }
+            docs.append(doc)
+        return docs
+
+    def flush(self):
+        """Send pending metrics to the sink; returns the documents"""
+        docs = self.documents()
+        self._last_flush = time.monotonic()
+        if self.sink:
+            for doc in docs:
+                try:
+                    self.sink(doc)
+                except Exception as e:
+                    logger.warning(f"Could not emit metrics: {e}")
+        return docs
+
+    def maybe_flush(self, interval=METRICS_FLUSH_SECONDS):
+        """Flush if interval seconds passed since the last flush (for long-running loops)"""
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def instrument(self, name):
+        """Decorator for Lambda handlers: times name_ms, counts name_errors, flushes at the end
+
+        A response with a 5xx statusCode counts as an error, like an exception.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    response = handler(*args, **kwargs)
+                    # Errors are emitted as 0 on success so alarms always have data points
+                    failed = isinstance(response, dict) and int(response.get('statusCode', 200)) >= 500
+                    self.increment(f"{name}_errors", int(failed))
+                    return response
+                except Exception:
+                    self.increment(f"{name}_errors")
+                    raise
+                finally:
+                    self.record(f"{name}_ms", (time.perf_counter() - start) * 1000)
+                    self.flush()
+            return wrapper
+        return decorator
+
+# Shared by the handlers of a Lambda container
+metrics = Metrics()
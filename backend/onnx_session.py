@@ -0,0 +1,71 @@
+import os
+import logging
+import onnxruntime as ort
+
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+def _env_flag(name, default):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+def session_config_from_env():
+    """Read ONNX Runtime session settings from environment variables
+
+    Defaults target the pattern analysis Lambda (3008 MB = 2 vCPUs): all
+    intra-op threads on the single ViT graph, one inter-op thread since the
+    graph is a linear chain with no parallel branches.
+    """
+    return {
+        'graph_optimization_level': os.environ.get('ONNX_GRAPH_OPTIMIZATION_LEVEL', 'all'),
+        'optimized_model_path': os.environ.get('ONNX_OPTIMIZED_MODEL_PATH', ''),
+        'intra_op_threads': int(os.environ.get('ONNX_INTRA_OP_THREADS', os.cpu_count() or 1)),
+        'inter_op_threads': int(os.environ.get('ONNX_INTER_OP_THREADS', 1)),
+        'execution_mode': os.environ.get('ONNX_EXECUTION_MODE', 'sequential'),
+        'enable_cpu_mem_arena': _env_flag('ONNX_ENABLE_CPU_MEM_ARENA', True),
+        'enable_mem_pattern': _env_flag('ONNX_ENABLE_MEM_PATTERN', True),
+    }
+
+def build_session_options(config):
+    """Build SessionOptions from a session_config_from_env()-style dict"""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[config['graph_optimization_level']]
+    options.intra_op_num_threads = config['intra_op_threads']
+    options.inter_op_num_threads = config['inter_op_threads']
+    options.execution_mode = EXECUTION_MODES[config['execution_mode']]
+    options.enable_cpu_mem_arena = config['enable_cpu_mem_arena']
+    options.enable_mem_pattern = config['enable_mem_pattern']
+    return options
+
+def create_inference_session(model_path, config=None):
+    """Create a CPU inference session, reusing a serialized optimized model when available
+
+    If config['optimized_model_path'] exists it is loaded instead of
+    model_path, skipping the graph optimization pass. Otherwise the session
+    is built from model_path and the optimized graph is serialized to that
+    path (when its directory is writable) for the next cold start.
+    """
+    config = config or session_config_from_env()
+    options = build_session_options(config)
+    optimized_path = config['optimized_model_path']
+    providers = ['CPUExecutionProvider']
+
+    if optimized_path and os.path.exists(optimized_path):
+        logger.info(f"Loading pre-optimized ONNX model from {optimized_path}")
+        return ort.InferenceSession(optimized_path, sess_options=options, providers=providers)
+
+    if optimized_path and os.access(os.path.dirname(optimized_path) or '.', os.W_OK):
+        options.optimized_model_filepath = optimized_path
+        logger.info(f"Serializing optimized ONNX model to {optimized_path}")
+
+    return ort.InferenceSession(model_path, sess_options=options, providers=providers)
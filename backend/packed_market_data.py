@@ -0,0 +1,339 @@
+"""
+Packed hour-bucket layout for market_data
+
+With MARKET_DATA_LAYOUT=packed each symbol-hour of 1m candles is one
+item holding a binary blob (see encode_bucket). Live writers buffer
+closed candles (LiveBucketWriter) and write the open hour every
+PACKED_FLUSH_SECONDS (300 by default) and once the hour ends, so
+readers of the newest candles (read_recent, the analysis Lambda,
+/market-data) can be up to PACKED_FLUSH_SECONDS plus a minute behind
+the stream. Candles still buffered when the stream process dies without
+a clean shutdown are lost; re-run backfill.py over that window. The
+CoinGecko snapshot Lambda writes through on every invocation.
+"""
+
+import os
+import time
+import struct
+import logging
+import numpy as np
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# 'rows': one market_data item per candle (default); 'packed': one item per symbol-hour
+MARKET_DATA_LAYOUT = os.environ.get('MARKET_DATA_LAYOUT', 'rows')
+
+PACKED_FORMAT_VERSION = 1
+CANDLE_SECONDS = 60
+BUCKET_SECONDS = 3600
+SLOTS_PER_BUCKET = BUCKET_SECONDS // CANDLE_SECONDS
+PACKED_TTL_DAYS = 7
+# Live writers also write the open hour this often: the bound on how stale
+# reads of the current hour are. Each write rewrites the whole growing bucket,
+# so at 60 it costs more than one row per candle (see backfill.py --benchmark)
+PACKED_FLUSH_SECONDS = int(os.environ.get('PACKED_FLUSH_SECONDS', 300))
+PACKED_WRITE_RETRIES = int(os.environ.get('PACKED_WRITE_RETRIES', 5))
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+# version, candle count, candle seconds, bucket start
+_HEADER = struct.Struct('<HHIq')
+
+def packed_key(symbol):
+    """market_data partition key of a symbol's hour buckets"""
+    return f"{symbol}#packed"
+
+def bucket_start(timestamp):
+    return int(timestamp) // BUCKET_SECONDS * BUCKET_SECONDS
+
+def encode_bucket(start, candles):
+    """Pack one hour of 1m candles into a little-endian blob
+
+    candles is a dict of equal-length arrays (timestamp, open, high, low,
+    close, volume and optionally trades) within [start, start + 1h). The
+    blob holds the header, the five price columns as float64, trades as
+    uint32 and each candle's minute slot as uint8: 2716 bytes for a full
+    hour against ~60 items of ~150 bytes as rows.
+    """
+    timestamps = np.asarray(candles['timestamp'], dtype=np.int64)
+    slots = (timestamps - start) // CANDLE_SECONDS
+    if len(slots) and (slots.min() < 0 or slots.max() >= SLOTS_PER_BUCKET):
+        raise ValueError(f"Candles outside the bucket starting at {start}")
+
+    n = len(slots)
+    prices = np.empty((len(PRICE_FIELDS), n), dtype='<f8')
+    for i, field in enumerate(PRICE_FIELDS):
+        prices[i] = candles[field]
+    trades = np.asarray(candles['trades'] if 'trades' in candles else np.zeros(n), dtype='<u4')
+
+    header = _HEADER.pack(PACKED_FORMAT_VERSION, n, CANDLE_SECONDS, start)
+    return header + prices.tobytes() + trades.tobytes() + slots.astype(np.uint8).tobytes()
+
+def decode_bucket(blob):
+    """Inverse of encode_bucket: dict of NumPy arrays (views into blob where possible)"""
+    version, n, candle_seconds, start = _HEADER.unpack_from(blob)
+    if version != PACKED_FORMAT_VERSION:
+        raise ValueError(f"Unsupported packed market data version: {version}")
+
+    offset = _HEADER.size
+    prices = np.frombuffer(blob, dtype='<f8', count=len(PRICE_FIELDS) * n, offset=offset).reshape(len(PRICE_FIELDS), n)
+    offset += prices.nbytes
+    trades = np.frombuffer(blob, dtype='<u4', count=n, offset=offset)
+    offset += trades.nbytes
+    slots = np.frombuffer(blob, dtype=np.uint8, count=n, offset=offset)
+
+    candles = {'timestamp': start + slots.astype(np.int64) * candle_seconds}
+    for i, field in enumerate(PRICE_FIELDS):
+        candles[field] = prices[i]
+    candles['trades'] = trades.astype(np.int64)
+    return candles
+
+def concat_candles(parts):
+    """Concatenate candle dicts (oldest first) into one dict of arrays; missing trades count as 0"""
+    fields = ['timestamp', *PRICE_FIELDS, 'trades']
+    if not parts:
+        return {field: np.empty(0, dtype=np.int64 if field in ('timestamp', 'trades') else np.float64)
+                for field in fields}
+    merged = {field: np.concatenate([part[field] for part in parts]) for field in fields if field != 'trades'}
+    merged['trades'] = np.concatenate([
+        np.asarray(part['trades'], dtype=np.int64) if 'trades' in part
+        else np.zeros(len(part['timestamp']), dtype=np.int64)
+        for part in parts
+    ])
+    return merged
+
+def merge_candles(existing, new):
+    """Union of two candle dicts by timestamp, new values winning, in ascending order"""
+    merged = concat_candles([existing, new])
+    # Keep the last occurrence of each timestamp, i.e. the one from new
+    _, first_in_reversed = np.unique(merged['timestamp'][::-1], return_index=True)
+    order = len(merged['timestamp']) - 1 - first_in_reversed
+    return {field: values[order] for field, values in merged.items()}
+
+def split_buckets(candles):
+    """(bucket start, candles) per hour bucket of an ascending candle dict"""
+    timestamps = np.asarray(candles['timestamp'], dtype=np.int64)
+    if not len(timestamps):
+        return []
+    buckets = timestamps // BUCKET_SECONDS * BUCKET_SECONDS
+    boundaries = np.flatnonzero(np.diff(buckets)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(timestamps)]])
+    return [
+        (int(buckets[s]), {field: np.asarray(values)[s:e] for field, values in candles.items()})
+        for s, e in zip(starts, ends)
+    ]
+
+def packed_items(symbol, candles, ttl=None):
+    """market_data items for ascending candles, one per hour bucket
+
+    Without an explicit ttl each item expires PACKED_TTL_DAYS after the end
+    of its bucket, as live data does. ttl=False writes no ttl attribute,
+    for history that is kept (backfills).
+    """
+    items = []
+    for start, bucket in split_buckets(candles):
+        item = {'symbol': packed_key(symbol), 'timestamp': start, 'candles': encode_bucket(start, bucket)}
+        if ttl is not False:
+            item['ttl'] = ttl if ttl is not None else start + BUCKET_SECONDS + PACKED_TTL_DAYS * 86400
+        items.append(item)
+    return items
+
+def single_candle(timestamp, open_, high, low, close, volume, trades=0):
+    """Candle dict for one candle, its timestamp floored to the minute"""
+    return {
+        'timestamp': np.array([int(timestamp) // CANDLE_SECONDS * CANDLE_SECONDS], dtype=np.int64),
+        'open': np.array([open_], dtype=np.float64),
+        'high': np.array([high], dtype=np.float64),
+        'low': np.array([low], dtype=np.float64),
+        'close': np.array([close], dtype=np.float64),
+        'volume': np.array([volume], dtype=np.float64),
+        'trades': np.array([trades], dtype=np.int64),
+    }
+
+def _item_candles(item):
+    # boto3 returns Binary attributes wrapped; .value holds the raw bytes
+    blob = getattr(item['candles'], 'value', item['candles'])
+    return decode_bucket(bytes(blob))
+
+# write_bucket's known argument when the bucket hasn't been read yet
+_UNREAD = object()
+
+def _bucket_condition(version):
+    """ConditionExpression kwargs for a put that expects the bucket at version
+
+    None means the bucket doesn't exist; 0 that it exists without a version
+    (written by a whole-hour backfill).
+    """
+    if version is None:
+        return {'ConditionExpression': 'attribute_not_exists(#symbol)',
+                'ExpressionAttributeNames': {'#symbol': 'symbol'}}
+    if version == 0:
+        return {'ConditionExpression': 'attribute_exists(#symbol) AND attribute_not_exists(#version)',
+                'ExpressionAttributeNames': {'#symbol': 'symbol', '#version': 'version'}}
+    return {'ConditionExpression': '#version = :version',
+            'ExpressionAttributeNames': {'#version': 'version'},
+            'ExpressionAttributeValues': {':version': version}}
+
+def write_bucket(table, symbol, start, candles, known=_UNREAD, retries=PACKED_WRITE_RETRIES):
+    """Merge candles into one hour bucket with an optimistic-concurrency put
+
+    Buckets carry a version that every merge increments, and the put is
+    conditional on the version read, so concurrent writers (the stream,
+    the CoinGecko Lambda, gap backfills) can't drop each other's candles:
+    the loser re-reads, merges and retries. known is (version, candles) as
+    this writer last stored them, (None, None) to assume the bucket is new,
+    or omitted to read it first. Returns the (version, candles) stored.
+    """
+    for _ in range(retries):
+        if known is _UNREAD:
+            existing = table.get_item(Key={'symbol': packed_key(symbol), 'timestamp': start},
+                                      ConsistentRead=True).get('Item')
+            known = (int(existing.get('version', 0)), _item_candles(existing)) if existing else (None, None)
+        version, stored = known
+        merged = merge_candles(stored, candles) if stored is not None else candles
+
+        item = packed_items(symbol, merged)[0]
+        item['version'] = (version or 0) + 1
+        try:
+            table.put_item(Item=item, **_bucket_condition(version))
+            return item['version'], merged
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            known = _UNREAD  # Another writer got there first: re-read and merge
+    raise RuntimeError(f"Gave up writing {symbol} bucket {start} after {retries} conflicting writes")
+
+def write_candles(table, symbol, candles, merge=True):
+    """Store candles into their hour buckets; returns the number of bucket items written
+
+    With merge, each touched bucket goes through write_bucket (a consistent
+    GetItem and a conditional PutItem), so candles already stored for the
+    hour are kept. Without it, buckets are replaced in batches, which is
+    only safe for whole hours nothing else is writing.
+    """
+    buckets = split_buckets(candles)
+    if merge:
+        for start, bucket in buckets:
+            write_bucket(table, symbol, start, bucket)
+        return len(buckets)
+
+    with table.batch_writer(overwrite_by_pkeys=['symbol', 'timestamp']) as batch:
+        for start, bucket in buckets:
+            for item in packed_items(symbol, bucket):
+                batch.put_item(Item=item)
+    return len(buckets)
+
+class LiveBucketWriter:
+    """Buffers live candles in memory and writes each hour bucket once
+
+    Writing every closed candle into its bucket costs a GetItem and a
+    PutItem of the growing bucket (up to 3 WCU), more than the 1 WCU of a
+    row. Here candles wait in memory and the open hour is written every
+    flush_seconds, then once more when the hour is over (flush_due) or
+    the writer shuts down (flush). flush_seconds=0 holds each bucket until
+    its hour ends: one conditional put per symbol-hour, but readers miss
+    the current hour. The version and contents of each bucket as last written
+    are kept, so a repeat write needs no GetItem unless another writer
+    changed the bucket in between. Not thread-safe: use it from one thread.
+    """
+
+    def __init__(self, table, flush_seconds=PACKED_FLUSH_SECONDS, clock=time.time):
+        self.table = table
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.pending = {}   # (symbol, bucket start) -> [candle dicts] not yet written
+        self.written = {}   # (symbol, bucket start) -> (version, candles) last stored
+        self.last_write = {}
+        self.stats = {'puts': 0, 'candles': 0}
+
+    def add(self, symbol, candles):
+        """Buffer ascending candles of one symbol"""
+        for start, bucket in split_buckets(candles):
+            self.pending.setdefault((symbol, start), []).append(bucket)
+
+    def flush_due(self):
+        """Write buckets whose hour has ended, and open ones every flush_seconds; returns puts"""
+        now = self.clock()
+        due = [
+            key for key in self.pending
+            if now >= key[1] + BUCKET_SECONDS
+            or (self.flush_seconds and now - self.last_write.get(key, key[1]) >= self.flush_seconds)
+        ]
+        for key in due:
+            self._write(key)
+        return len(due)
+
+    def flush(self):
+        """Write everything buffered (on shutdown); returns puts"""
+        keys = list(self.pending)
+        for key in keys:
+            self._write(key)
+        return len(keys)
+
+    def _write(self, key):
+        symbol, start = key
+        candles = self.pending.pop(key)
+        candles = candles[0] if len(candles) == 1 else merge_candles(concat_candles(candles[:-1]), candles[-1])
+        # A bucket first seen by this writer is assumed new; the condition catches it if not
+        known = self.written.get(key, (None, None))
+        try:
+            self.written[key] = write_bucket(self.table, symbol, start, candles, known)
+        except Exception:
+            self.pending[key] = [candles]  # Kept for the next flush
+            raise
+        self.last_write[key] = self.clock()
+        self.stats['puts'] += 1
+        self.stats['candles'] += len(candles['timestamp'])
+
+        # Closed hours are done; a straggler for one re-reads the bucket
+        if self.clock() >= start + BUCKET_SECONDS:
+            self.written.pop(key, None)
+            self.last_write.pop(key, None)
+
+def read_recent(table, symbol, count):
+    """The latest count candles of symbol as NumPy arrays, oldest first"""
+    parts = []
+    candles = 0
+    query_args = {
+        'KeyConditionExpression': Key('symbol').eq(packed_key(symbol)),
+        'ScanIndexForward': False,
+        # A partial current hour can hold a single candle
+        'Limit': -(-count // SLOTS_PER_BUCKET) + 1
+    }
+    while candles < count:
+        response = table.query(**query_args)
+        for item in response['Items']:
+            part = _item_candles(item)
+            parts.append(part)
+            candles += len(part['timestamp'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    merged = concat_candles(parts[::-1])
+    return {field: values[-count:] for field, values in merged.items()}
+
+def read_range(table, symbol, start, end):
+    """Candles of symbol with start <= timestamp <= end as NumPy arrays, oldest first"""
+    parts = []
+    query_args = {
+        'KeyConditionExpression': Key('symbol').eq(packed_key(symbol)) & Key('timestamp').between(bucket_start(start), end)
+    }
+    while True:
+        response = table.query(**query_args)
+        parts.extend(_item_candles(item) for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    merged = concat_candles(parts)
+    keep = (merged['timestamp'] >= start) & (merged['timestamp'] <= end)
+    return {field: values[keep] for field, values in merged.items()}
+
+def candle_rows(symbol, candles):
+    """Decoded candles as the row dicts the row layout's readers expect"""
+    columns = {field: candles[field].tolist() for field in ['timestamp', *PRICE_FIELDS, 'trades']}
+    names = list(columns)
+    return [{'symbol': symbol, **dict(zip(names, row))} for row in zip(*columns.values())]
@@ -12,6 +12,10 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.patches import Rectangle
 import uuid
+from pattern_cache import lean_cache_item, to_dynamodb
+from pipeline import Pipeline, StageFailed
+from metrics import metrics
+from profiling import profiled
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -119,8 +123,8 @@ class PatternAnalyzer:
             'label': 'bullish' if sentiment_score > 0.2 else 'bearish' if sentiment_score < -0.2 else 'neutral'
         }
     
-    def generate_prediction(self, symbol, market_data, patterns, sentiment):
-        """Generate multi-modal prediction"""
+    def build_prediction(self, symbol, market_data, patterns, sentiment):
+        """Generate multi-modal prediction (not stored)"""
         try:
             # Simple prediction logic (to be enhanced with ML)
             price_trend = 1 if float(market_data[-1]['close']) > float(market_data[0]['close']) else -1
@@ -141,84 +145,123 @@ class PatternAnalyzer:
                 'ttl': int((datetime.now() + timedelta(days=30)).timestamp())
             }
             
-            # Store prediction
-            self.predictions_table.put_item(Item=prediction)
-            
             return prediction
             
         except Exception as e:
             logger.error(f"Error generating prediction: {e}")
             return None
+    
+    def store_prediction(self, prediction):
+        self.predictions_table.put_item(Item=to_dynamodb(prediction))
+    
+    def generate_prediction(self, symbol, market_data, patterns, sentiment):
+        """Generate multi-modal prediction and store it"""
+        prediction = self.build_prediction(symbol, market_data, patterns, sentiment)
+        if not prediction:
+            return None
+        
+        try:
+            self.store_prediction(prediction)
+        except Exception as e:
+            logger.error(f"Error storing prediction: {e}")
+            return None
+        return prediction
 
+@metrics.instrument('analysis')
+@profiled('pattern_analysis')
 def lambda_handler(event, context):
-    """Lambda handler for pattern analysis"""
+    """Lambda handler for pattern analysis
+    
+    Stages run as a DAG (pipeline.py): sentiment alongside the query and
+    chart, and the prediction and cache writes together.
+    """
+    start_time = datetime.now()
+    
     try:
         analyzer = PatternAnalyzer()
         
         # Get symbol from event or default
         symbol = event.get('symbol', 'BTCUSDT')
         
-        # Get recent market data from DynamoDB
-        from boto3.dynamodb.conditions import Key
-        market_data_table = dynamodb.Table(os.environ['MARKET_DATA_TABLE'])
+        def query():
+            # Query last 100 data points
+            from boto3.dynamodb.conditions import Key
+            market_data_table = dynamodb.Table(os.environ['MARKET_DATA_TABLE'])
+            response = market_data_table.query(
+                KeyConditionExpression=Key('symbol').eq(symbol),
+                ScanIndexForward=False,
+                Limit=100
+            )
+            if not response['Items']:
+                raise LookupError('No market data found')
+            return sorted(response['Items'], key=lambda x: x['timestamp'])
         
-        # Query last 100 data points
-        response = market_data_table.query(
-            KeyConditionExpression=Key('symbol').eq(symbol),
-            ScanIndexForward=False,
-            Limit=100
-        )
+        def chart(query):
+            chart_key = analyzer.generate_chart_image(query, symbol)
+            if not chart_key:
+                raise RuntimeError('Failed to generate chart')
+            return chart_key
         
-        if not response['Items']:
-            return {
-                'statusCode': 404,
-                'body': json.dumps({'error': 'No market data found'})
-            }
+        def patterns(chart):
+            return analyzer.detect_patterns(chart)
         
-        market_data = sorted(response['Items'], key=lambda x: x['timestamp'])
+        def sentiment():
+            return analyzer.analyze_sentiment(symbol)
         
-        # Generate chart image
-        chart_key = analyzer.generate_chart_image(market_data, symbol)
-        if not chart_key:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Failed to generate chart'})
-            }
+        def prediction(query, patterns, sentiment):
+            result = analyzer.build_prediction(symbol, query, patterns, sentiment)
+            if not result:
+                raise RuntimeError('Failed to generate prediction')
+            return result
         
-        # Detect patterns
-        patterns = analyzer.detect_patterns(chart_key)
+        def store_prediction(prediction):
+            analyzer.store_prediction(prediction)
         
-        # Analyze sentiment
-        sentiment = analyzer.analyze_sentiment(symbol)
+        def store_cache(chart, patterns, prediction):
+            # Cache results, referencing the stored prediction instead of copying it
+            cache_item = lean_cache_item(
+                symbol, int(datetime.now().timestamp()), f"s3://{CHARTS_BUCKET}/{chart}",
+                patterns, prediction, int((datetime.now() - start_time).total_seconds() * 1000),
+                stage_timings_ms=pipeline.snapshot_timings()
+            )
+            analyzer.pattern_cache_table.put_item(Item=cache_item)
+            return cache_item
         
-        # Generate prediction
-        prediction = analyzer.generate_prediction(symbol, market_data, patterns, sentiment)
+        pipeline = (
+            Pipeline()
+            .stage('query', query)
+            .stage('sentiment', sentiment)
+            .stage('chart', chart, deps=['query'])
+            .stage('patterns', patterns, deps=['chart'])
+            .stage('prediction', prediction, deps=['query', 'patterns', 'sentiment'])
+            .stage('store_prediction', store_prediction, deps=['prediction'])
+            .stage('store_cache', store_cache, deps=['chart', 'patterns', 'prediction'])
+        )
         
-        if not prediction:
+        try:
+            results = pipeline.run()
+        except StageFailed as e:
+            metrics.increment(f"stage_{e.stage}_errors")
+            logger.error(f"Pattern analysis failed in stage {e.stage}: {e.error}")
             return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Failed to generate prediction'})
+                'statusCode': 404 if isinstance(e.error, LookupError) else 500,
+                'body': json.dumps({'error': str(e.error), 'stage': e.stage})
             }
         
-        # Cache results
-        cache_item = {
-            'symbol': symbol,
-            'timestamp': int(datetime.now().timestamp()),
-            'chart_url': f"s3://{CHARTS_BUCKET}/{chart_key}",
-            'patterns': patterns,
-            'prediction': prediction,
-            'ttl': int((datetime.now() + timedelta(days=7)).timestamp())
-        }
-        
-        analyzer.pattern_cache_table.put_item(Item=cache_item)
+        cache_item = results['store_cache']
+        processing_time = (datetime.now() - start_time).total_seconds() * 1000
+        for stage, ms in pipeline.snapshot_timings().items():
+            metrics.record(f"stage_{stage}_ms", ms)
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'symbol': symbol,
                 'chart_url': cache_item['chart_url'],
-                'patterns': patterns,
-                'prediction': prediction,
+                'patterns': results['patterns'],
+                'prediction': results['prediction'],
+                'processing_time_ms': int(processing_time),
+                'stage_timings_ms': pipeline.snapshot_timings(),
                 'timestamp': cache_item['timestamp']
             }, default=str)
         }
@@ -228,4 +271,4 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        }
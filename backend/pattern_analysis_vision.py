@@ -8,7 +8,18 @@ import io
 import base64
 from PIL import Image, ImageDraw
 import uuid
-import onnxruntime as ort
+import hashlib
+from collections import OrderedDict
+from onnx_session import create_inference_session, session_config_from_env
+from indicators import compute_indicators, indicator_score, latest_features, ohlcv_arrays
+from streaming_indicators import load_state
+from symbol_registry import load_registry
+from packed_market_data import MARKET_DATA_LAYOUT, candle_rows, read_recent
+from pattern_cache import lean_cache_item, summarize_patterns, to_dynamodb
+from pipeline import Pipeline, StageFailed
+from preprocessing import MODEL_DTYPE, batch_buffer, preprocess_image, preprocess_images
+from metrics import metrics
+from profiling import profiled
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +34,17 @@ PATTERN_CACHE_TABLE = os.environ['PATTERN_CACHE_TABLE']
 PREDICTIONS_TABLE = os.environ['PREDICTIONS_TABLE']
 CHARTS_BUCKET = os.environ['CHARTS_BUCKET']
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+MODEL_PATH = os.environ.get('MODEL_PATH', '/var/task/models/crypto_pattern_model_v14.onnx')
+MODEL_VERSION = 'v14_onnx'
+INFERENCE_CACHE_SIZE = int(os.environ.get('INFERENCE_CACHE_SIZE', 256))
+INFERENCE_CACHE_DYNAMODB = os.environ.get('INFERENCE_CACHE_DYNAMODB', 'false').lower() == 'true'
+INFERENCE_CACHE_TTL_DAYS = 7
+SCAN_WINDOW_SIZES = [int(w) for w in os.environ.get('SCAN_WINDOW_SIZES', '50,100,200,400').split(',')]
+SCAN_STRIDE_FRACTION = float(os.environ.get('SCAN_STRIDE_FRACTION', 0.25))
+SCAN_BATCH_SIZE = int(os.environ.get('SCAN_BATCH_SIZE', 32))
+
+# Inference sessions are reused across warm invocations of the same container
+_model_sessions = {}
 
 # Pattern classes - must match training exactly
 PATTERN_CLASSES = [
@@ -38,6 +60,137 @@ PATTERN_CLASSES = [
     'breakout'
 ]
 
+BULLISH_PATTERNS = ['ascending_triangle', 'cup_and_handle', 'bullish_flag', 'breakout']
+BEARISH_PATTERNS = ['descending_triangle', 'double_top', 'head_and_shoulders', 'bearish_flag']
+
+# Signal weights and thresholds used by generate_prediction (and replayed by backtest.py)
+PATTERN_WEIGHT = 0.6
+PRICE_WEIGHT = 0.3
+SENTIMENT_WEIGHT = 0.1
+PRICE_CHANGE_SCALE = 10
+PRICE_TREND_LOOKBACK = 20
+DIRECTION_THRESHOLD = 0.2
+
+def pattern_direction(pattern_type):
+    """Directional bias of a pattern class: 'bullish', 'bearish' or 'neutral'"""
+    if pattern_type in BULLISH_PATTERNS:
+        return 'bullish'
+    if pattern_type in BEARISH_PATTERNS:
+        return 'bearish'
+    return 'neutral'
+
+def render_price_chart(prices):
+    """Draw a close-price series as the 224x224 line chart the vision model was fed"""
+    prices = np.asarray(prices, dtype=np.float64)
+    n = len(prices)
+    
+    image = Image.new('RGB', (224, 224), 'white')
+    if n < 2:
+        return image
+    
+    min_price = prices.min()
+    price_range = prices.max() - min_price
+    if price_range == 0:
+        price_range = 1
+    
+    xs = (np.arange(n) / n * 220).astype(np.int64) + 2  # 2px margin
+    ys = (220 - (prices - min_price) / price_range * 216).astype(np.int64) + 2  # Invert Y, 2px margin
+    
+    ImageDraw.Draw(image).line(list(zip(xs.tolist(), ys.tolist())), fill='blue', width=2)
+    return image
+
+def chart_cache_key(prices, model_version=MODEL_VERSION):
+    """Content hash of a close-price series as the chart renderer sees it
+
+    The chart is min/max normalized before drawing, so the key is built from
+    the normalized series: identical inputs (or a uniformly rescaled series,
+    which renders the same image) map to the same key.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    price_range = prices.max() - prices.min() if len(prices) else 0
+    normalized = (prices - prices.min()) / (price_range if price_range else 1)
+    
+    digest = hashlib.sha256()
+    digest.update(model_version.encode())
+    digest.update(normalized.astype(np.float32).tobytes())
+    return digest.hexdigest()
+
+class InferenceCache:
+    """Content-addressed LRU cache of model logits, optionally backed by pattern_cache
+    
+    DynamoDB entries live in the pattern_cache table under the partition key
+    'inference#<hash>' (timestamp 0) so they never collide with symbol rows.
+    """
+    
+    def __init__(self, max_size=INFERENCE_CACHE_SIZE, table=None):
+        self.max_size = max_size
+        self.table = table
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """Return cached logits for key, or None"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        
+        logits = self._get_from_table(key)
+        if logits is not None:
+            self._put_local(key, logits)
+            self.hits += 1
+            return logits
+        
+        self.misses += 1
+        return None
+    
+    def put(self, key, logits):
+        """Store logits for key locally and, if enabled, in DynamoDB"""
+        logits = np.asarray(logits, dtype=np.float32)
+        self._put_local(key, logits)
+        
+        if self.table is not None:
+            try:
+                self.table.put_item(Item={
+                    'symbol': f"inference#{key}",
+                    'timestamp': 0,
+                    'logits': logits.tobytes(),
+                    'model_version': MODEL_VERSION,
+                    'ttl': int((datetime.now() + timedelta(days=INFERENCE_CACHE_TTL_DAYS)).timestamp())
+                })
+            except Exception as e:
+                logger.warning(f"Failed to store inference cache entry: {e}")
+    
+    def _put_local(self, key, logits):
+        self._entries[key] = logits
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def _get_from_table(self, key):
+        if self.table is None:
+            return None
+        
+        try:
+            response = self.table.get_item(Key={'symbol': f"inference#{key}", 'timestamp': 0})
+        except Exception as e:
+            logger.warning(f"Failed to read inference cache entry: {e}")
+            return None
+        
+        item = response.get('Item')
+        if not item:
+            return None
+        
+        # boto3 returns Binary attributes wrapped; .value holds the raw bytes
+        blob = getattr(item['logits'], 'value', item['logits'])
+        return np.frombuffer(blob, dtype=np.float32)
+
+# Lives at module level so warm invocations share it
+_inference_cache = InferenceCache(
+    table=dynamodb.Table(PATTERN_CACHE_TABLE) if INFERENCE_CACHE_DYNAMODB else None
+)
+
 class VisionPatternAnalyzer:
     def __init__(self):
         self.pattern_cache_table = dynamodb.Table(PATTERN_CACHE_TABLE)
@@ -50,12 +203,18 @@ class VisionPatternAnalyzer:
     def _load_model(self):
         """Load the ONNX Vision Transformer model"""
         try:
-            model_path = "/var/task/models/crypto_pattern_model_v14.onnx"
+            model_path = MODEL_PATH
+            if model_path in _model_sessions:
+                self.model = _model_sessions[model_path]
+                return
+            
             logger.info(f"Loading ONNX model from {model_path}")
             
-            # Create inference session with CPU provider
-            providers = ['CPUExecutionProvider']
-            self.model = ort.InferenceSession(model_path, providers=providers)
+            # Create inference session with CPU provider and env-tuned SessionOptions
+            session_config = session_config_from_env()
+            logger.info(f"ONNX session config: {session_config}")
+            self.model = create_inference_session(model_path, session_config)
+            _model_sessions[model_path] = self.model
             
             # Log model info
             input_name = self.model.get_inputs()[0].name
@@ -72,78 +231,39 @@ class VisionPatternAnalyzer:
             self.model = None
     
     def preprocess_chart_for_vision(self, image_array):
-        """Preprocess chart image for Vision Transformer inference"""
+        """Preprocess chart image for Vision Transformer inference
+        
+        The result is a view of this thread's batch_buffer(1), overwritten by
+        the next preprocess on the same thread: run the model on it right
+        away, or .copy() it to keep it.
+        """
         try:
-            # Convert to PIL Image if numpy array
-            if isinstance(image_array, np.ndarray):
-                if image_array.dtype != np.uint8:
-                    image_array = (image_array * 255).astype(np.uint8)
-                image = Image.fromarray(image_array)
-            else:
-                image = image_array
-            
-            # Resize to 224x224 (Vision Transformer standard input)
-            image = image.resize((224, 224), Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Convert to numpy array and normalize
-            image_array = np.array(image).astype(np.float32)
-            image_array = image_array / 255.0
-            
-            # Apply ImageNet normalization
-            mean = np.array([0.485, 0.456, 0.406])
-            std = np.array([0.229, 0.224, 0.225])
-            
-            image_array = (image_array - mean) / std
-            
-            # Add batch dimension and transpose to NCHW
-            image_array = np.transpose(image_array, (2, 0, 1))  # HWC to CHW
-            image_array = np.expand_dims(image_array, axis=0)   # Add batch dim
-            
-            return image_array
-            
+            return preprocess_image(image_array, out=batch_buffer(1))
         except Exception as e:
             logger.error(f"Error preprocessing image: {e}")
             return None
     
-    def generate_chart_image(self, market_data, symbol):
-        """Generate simple chart image for pattern analysis"""
+    def render_chart(self, market_data):
+        """Draw the chart image (224x224 for Vision Transformer); returns (image, array) or (None, None)"""
         try:
             # Sort market data by timestamp
             sorted_data = sorted(market_data, key=lambda x: int(x['timestamp']))
             
-            # Create a simple chart image (224x224 for Vision Transformer)
-            image = Image.new('RGB', (224, 224), 'white')
-            draw = ImageDraw.Draw(image)
-            
-            # Extract prices for normalization
+            # Extract prices and draw a simple chart image
             prices = [float(d['close']) for d in sorted_data]
             if not prices:
                 return None, None
-                
-            min_price = min(prices)
-            max_price = max(prices)
-            price_range = max_price - min_price if max_price != min_price else 1
-            
-            # Draw simple price line
-            points = []
-            for i, data_point in enumerate(sorted_data):
-                x = int((i / len(sorted_data)) * 220) + 2  # 2px margin
-                price = float(data_point['close'])
-                y = int(220 - ((price - min_price) / price_range) * 216) + 2  # Invert Y, 2px margin
-                points.append((x, y))
-            
-            # Draw price line
-            if len(points) > 1:
-                draw.line(points, fill='blue', width=2)
-            
-            # Convert to numpy array
-            chart_array = np.array(image)
-            
-            # Save to buffer and upload to S3
+            
+            image = render_price_chart(prices)
+            return image, np.array(image)
+            
+        except Exception as e:
+            logger.error(f"Error rendering chart: {e}")
+            return None, None
+    
+    def upload_chart(self, image, symbol):
+        """Upload a chart image to S3 as PNG; returns its key or None"""
+        try:
             buffer = io.BytesIO()
             image.save(buffer, format='PNG')
             buffer.seek(0)
@@ -155,86 +275,205 @@ class VisionPatternAnalyzer:
                 Body=buffer.getvalue(),
                 ContentType='image/png'
             )
-            
-            return chart_key, chart_array
+            return chart_key
             
         except Exception as e:
-            logger.error(f"Error generating chart: {e}")
+            logger.error(f"Error uploading chart: {e}")
+            return None
+    
+    def generate_chart_image(self, market_data, symbol):
+        """Generate simple chart image for pattern analysis and upload it"""
+        image, chart_array = self.render_chart(market_data)
+        if image is None:
+            return None, None
+        
+        chart_key = self.upload_chart(image, symbol)
+        if not chart_key:
             return None, None
+        return chart_key, chart_array
     
-    def detect_patterns_with_vision(self, chart_array):
-        """Detect trading patterns using Vision Transformer model"""
+    def detect_patterns_with_vision(self, chart_array, cache_key=None):
+        """Detect trading patterns using Vision Transformer model
+        
+        When cache_key (see chart_cache_key) is given, cached logits for
+        identical input short-circuit preprocessing and inference.
+        """
         try:
             if self.model is None:
                 logger.error("ONNX model not loaded")
                 return []
             
-            # Preprocess image for model
-            preprocessed = self.preprocess_chart_for_vision(chart_array)
-            if preprocessed is None:
-                return []
+            predictions = _inference_cache.get(cache_key) if cache_key else None
             
-            # Run inference
-            input_name = self.model.get_inputs()[0].name
-            outputs = self.model.run(None, {input_name: preprocessed})
-            predictions = outputs[0][0]  # Remove batch dimension
-            
-            # Get predicted class and confidence
-            predicted_class_idx = np.argmax(predictions)
-            confidence = float(predictions[predicted_class_idx])
-            pattern_type = PATTERN_CLASSES[predicted_class_idx]
-            
-            # Apply softmax for better confidence scores
-            softmax_predictions = np.exp(predictions) / np.sum(np.exp(predictions))
-            confidence_softmax = float(softmax_predictions[predicted_class_idx])
-            
-            # Determine prediction direction based on pattern type
-            bullish_patterns = ['ascending_triangle', 'cup_and_handle', 'bullish_flag', 'breakout']
-            bearish_patterns = ['descending_triangle', 'double_top', 'head_and_shoulders', 'bearish_flag']
-            
-            if pattern_type in bullish_patterns:
-                prediction_direction = 'bullish'
-            elif pattern_type in bearish_patterns:
-                prediction_direction = 'bearish'
+            if predictions is not None:
+                logger.info(f"Inference cache hit for {cache_key[:12]}")
             else:
-                prediction_direction = 'neutral'
-            
-            logger.info(f"Vision model prediction: {pattern_type} (confidence: {confidence_softmax:.3f})")
+                # Preprocess image for model
+                preprocessed = self.preprocess_chart_for_vision(chart_array)
+                if preprocessed is None:
+                    return []
+                
+                # Run inference
+                input_name = self.model.get_inputs()[0].name
+                outputs = self.model.run(None, {input_name: preprocessed})
+                predictions = outputs[0][0]  # Remove batch dimension
+                
+                if cache_key:
+                    _inference_cache.put(cache_key, predictions)
             
-            # Return detected patterns with proper structure
-            patterns = [{
-                'type': pattern_type,
-                'confidence': confidence_softmax,
-                'raw_score': confidence,
-                'coordinates': {'x1': 0, 'y1': 0, 'x2': 224, 'y2': 224},
-                'prediction': prediction_direction,
-                'all_predictions': predictions.tolist(),
-                'model_version': 'v14_onnx'
-            }]
+            pattern = self._pattern_from_logits(predictions)
+            logger.info(f"Vision model prediction: {pattern['type']} (confidence: {pattern['confidence']:.3f})")
             
-            return patterns
+            return [pattern]
             
         except Exception as e:
             logger.error(f"Error in vision pattern detection: {e}")
             return []
     
-    def analyze_sentiment(self, symbol):
-        """Analyze market sentiment (placeholder - can be enhanced)"""
-        # Simple sentiment based on recent price action
-        sentiment_score = np.random.uniform(-0.3, 0.3)  # Conservative range
+    def _pattern_from_logits(self, predictions):
+        """Build a detected pattern dict from the model's class logits"""
+        # Get predicted class and confidence
+        predicted_class_idx = np.argmax(predictions)
+        confidence = float(predictions[predicted_class_idx])
+        pattern_type = PATTERN_CLASSES[predicted_class_idx]
+        
+        # Apply softmax for better confidence scores
+        softmax_predictions = np.exp(predictions) / np.sum(np.exp(predictions))
+        confidence_softmax = float(softmax_predictions[predicted_class_idx])
+        
+        # Determine prediction direction based on pattern type
+        prediction_direction = pattern_direction(pattern_type)
+        
+        # Return detected pattern with proper structure
+        return {
+            'type': pattern_type,
+            'confidence': confidence_softmax,
+            'raw_score': confidence,
+            'coordinates': {'x1': 0, 'y1': 0, 'x2': 224, 'y2': 224},
+            'prediction': prediction_direction,
+            'all_predictions': predictions.tolist(),
+            'model_version': MODEL_VERSION
+        }
+    
+    def _run_batched(self, batch):
+        """Run the model over an N x 3 x 224 x 224 batch, chunked to what the model accepts"""
+        model_input = self.model.get_inputs()[0]
+        batch_dim = model_input.shape[0]
+        chunk_size = batch_dim if isinstance(batch_dim, int) else SCAN_BATCH_SIZE
+        
+        if batch.dtype != MODEL_DTYPE:
+            raise TypeError(f"model input must be {MODEL_DTYPE.__name__}, got {batch.dtype}")
+        outputs = []
+        for start in range(0, len(batch), chunk_size):
+            chunk = batch[start:start + chunk_size]
+            outputs.append(self.model.run(None, {model_input.name: chunk})[0])
+        return np.concatenate(outputs)
+    
+    def scan_patterns_multiscale(self, market_data, window_sizes=None, stride=None):
+        """Slide windows of several lengths over the history and detect a pattern in each
+        
+        Prices are extracted once; every window is a view into that array.
+        Windows whose content is already in the inference cache skip
+        rendering and inference, the rest go through the model in batches.
+        stride defaults to SCAN_STRIDE_FRACTION of each window length, and
+        the most recent window of each size always ends on the last candle.
+        """
+        try:
+            if self.model is None:
+                logger.error("ONNX model not loaded")
+                return []
+            
+            window_sizes = window_sizes or SCAN_WINDOW_SIZES
+            sorted_data = sorted(market_data, key=lambda x: int(x['timestamp']))
+            timestamps = np.array([int(d['timestamp']) for d in sorted_data], dtype=np.int64)
+            prices = np.array([float(d['close']) for d in sorted_data], dtype=np.float64)
+            n = len(prices)
+            
+            windows = []
+            for size in sorted(set(window_sizes)):
+                if size < 2 or size > n:
+                    continue
+                step = stride or max(1, int(size * SCAN_STRIDE_FRACTION))
+                starts = list(range(0, n - size + 1, step))
+                if starts[-1] != n - size:
+                    starts.append(n - size)
+                windows.extend((start, size) for start in starts)
+            
+            if not windows:
+                logger.warning(f"No scan windows fit in {n} candles")
+                return []
+            
+            keys = [chart_cache_key(prices[start:start + size]) for start, size in windows]
+            logits = [_inference_cache.get(key) for key in keys]
+            pending = [i for i, cached in enumerate(logits) if cached is None]
+            
+            # Rendered and preprocessed a batch at a time into this thread's reused buffer
+            for chunk_start in range(0, len(pending), SCAN_BATCH_SIZE):
+                chunk = pending[chunk_start:chunk_start + SCAN_BATCH_SIZE]
+                batch = preprocess_images(
+                    [render_price_chart(prices[windows[i][0]:windows[i][0] + windows[i][1]]) for i in chunk],
+                    out=batch_buffer(len(chunk))
+                )
+                for i, window_logits in zip(chunk, self._run_batched(batch)):
+                    logits[i] = window_logits
+                    _inference_cache.put(keys[i], window_logits)
+            
+            patterns = []
+            for (start, size), window_logits in zip(windows, logits):
+                pattern = self._pattern_from_logits(window_logits)
+                pattern['window_size'] = size
+                pattern['coordinates'] = {
+                    'start_index': start,
+                    'end_index': start + size - 1,
+                    'start_timestamp': int(timestamps[start]),
+                    'end_timestamp': int(timestamps[start + size - 1])
+                }
+                patterns.append(pattern)
+            
+            logger.info(f"Scanned {len(windows)} windows ({len(pending)} inferred, "
+                        f"{len(windows) - len(pending)} cached) over {n} candles")
+            
+            return sorted(patterns, key=lambda p: p['confidence'], reverse=True)
+            
+        except Exception as e:
+            logger.error(f"Error in multi-scale pattern scan: {e}")
+            return []
+    
+    def analyze_sentiment(self, symbol, market_data=None, precomputed=None):
+        """Analyze market sentiment from technical indicators over the recent candles
+        
+        precomputed holds the latest values maintained by the ingestion path
+        (streaming_indicators); without it they are rebuilt from market_data.
+        """
+        if not market_data:
+            return {'score': 0.0, 'label': 'neutral', 'source': 'technical_indicators', 'indicators': {}}
+        
+        ohlcv = ohlcv_arrays(market_data)
+        if precomputed:
+            latest = precomputed
+        else:
+            features, _ = compute_indicators(ohlcv)
+            latest = latest_features(features)
+        sentiment_score = indicator_score(latest, ohlcv['close'][-1])
         
         return {
             'score': sentiment_score,
             'label': 'bullish' if sentiment_score > 0.1 else 'bearish' if sentiment_score < -0.1 else 'neutral',
-            'source': 'price_action'
+            'source': 'technical_indicators',
+            'indicators': latest
         }
     
-    def generate_prediction(self, symbol, market_data, patterns, sentiment):
-        """Generate multi-modal prediction with vision model results"""
+    def build_prediction(self, symbol, market_data, patterns, sentiment, prediction_id=None):
+        """Combine vision patterns, price trend and indicators into a prediction (not stored)
+        
+        prediction_id defaults to a new UUID; API-triggered runs pass their
+        run_id so coalesced requests can find the result.
+        """
         try:
             # Enhanced prediction logic using vision model
-            recent_close = float(market_data[-1]['close'])
-            older_close = float(market_data[-20]['close']) if len(market_data) >= 20 else float(market_data[0]['close'])
+            closes = ohlcv_arrays(market_data)['close']
+            recent_close = float(closes[-1])
+            older_close = float(closes[-PRICE_TREND_LOOKBACK]) if len(closes) >= PRICE_TREND_LOOKBACK else float(closes[0])
             
             price_trend = 1 if recent_close > older_close else -1
             price_change = (recent_close - older_close) / older_close
@@ -255,21 +494,21 @@ class VisionPatternAnalyzer:
             
             # Combine signals with weights favoring vision model
             final_score = (
-                (pattern_score * 0.6) +           # Vision model gets highest weight
-                (price_change * 10 * 0.3) +       # Price trend (scaled)
-                (sentiment['score'] * 0.1)         # Sentiment gets small weight
+                (pattern_score * PATTERN_WEIGHT) +                          # Vision model gets highest weight
+                (price_change * PRICE_CHANGE_SCALE * PRICE_WEIGHT) +        # Price trend (scaled)
+                (sentiment['score'] * SENTIMENT_WEIGHT)                     # Technical indicators (RSI, MACD, Bollinger)
             )
             
             # Determine direction with threshold
-            if final_score > 0.2:
+            if final_score > DIRECTION_THRESHOLD:
                 direction = 'bullish'
-            elif final_score < -0.2:
+            elif final_score < -DIRECTION_THRESHOLD:
                 direction = 'bearish'
             else:
                 direction = 'neutral'
             
             prediction = {
-                'prediction_id': str(uuid.uuid4()),
+                'prediction_id': prediction_id or str(uuid.uuid4()),
                 'symbol': symbol,
                 'prediction_score': float(np.clip(final_score, -1, 1)),
                 'confidence': float(min(abs(final_score), 1.0)),
@@ -282,9 +521,6 @@ class VisionPatternAnalyzer:
                 'ttl': int((datetime.now() + timedelta(days=30)).timestamp())
             }
             
-            # Store prediction
-            self.predictions_table.put_item(Item=prediction)
-            
             logger.info(f"Generated prediction for {symbol}: {direction} (score: {final_score:.3f})")
             
             return prediction
@@ -292,88 +528,224 @@ class VisionPatternAnalyzer:
         except Exception as e:
             logger.error(f"Error generating prediction: {e}")
             return None
+    
+    def store_prediction(self, prediction):
+        """Write a prediction; pattern logits are kept (packed) in pattern_cache only"""
+        self.predictions_table.put_item(Item={
+            **to_dynamodb(prediction), 'patterns_detected': summarize_patterns(prediction['patterns_detected'])
+        })
+    
+    def generate_prediction(self, symbol, market_data, patterns, sentiment, prediction_id=None):
+        """Generate multi-modal prediction with vision model results and store it"""
+        prediction = self.build_prediction(symbol, market_data, patterns, sentiment, prediction_id)
+        if not prediction:
+            return None
+        
+        try:
+            self.store_prediction(prediction)
+        except Exception as e:
+            logger.error(f"Error storing prediction: {e}")
+            return None
+        return prediction
 
+def analyze_batch(event, context):
+    """Run the single-symbol handler for each symbol of a scheduler batch
+    
+    Symbols share the warm container's model session, so a batch pays the
+    cold start once.
+    """
+    start_time = datetime.now()
+    results = {}
+    
+    for symbol in event['symbols']:
+        single_event = {k: v for k, v in event.items() if k != 'symbols'}
+        response = lambda_handler({**single_event, 'symbol': symbol}, context)
+        results[symbol] = response['statusCode']
+    
+    processing_time = (datetime.now() - start_time).total_seconds() * 1000
+    logger.info(f"Analyzed batch of {len(results)} symbols in {processing_time:.0f}ms")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'results': results,
+            'processing_time_ms': int(processing_time)
+        })
+    }
+
+def record_stage_timings(timings_ms):
+    """Add a pipeline run's stage timings to the stage_<name>_ms histograms"""
+    for stage, ms in timings_ms.items():
+        metrics.record(f"stage_{stage}_ms", ms)
+
+def query_market_data(table, symbol, history):
+    """The latest `history` market data points of symbol, oldest first"""
+    if MARKET_DATA_LAYOUT == 'packed':
+        # Hour buckets decode straight into arrays: ~history/60 item reads
+        items = candle_rows(symbol, read_recent(table, symbol, history))
+    else:
+        # Query the last `history` data points, following pagination
+        from boto3.dynamodb.conditions import Key
+        items = []
+        query_args = {
+            'KeyConditionExpression': Key('symbol').eq(symbol),
+            'ScanIndexForward': False,
+            'Limit': history
+        }
+        while len(items) < history:
+            response = table.query(**query_args)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            query_args['Limit'] = history - len(items)
+    
+    return sorted(items, key=lambda x: int(x['timestamp']))
+
+@metrics.instrument('analysis')
+@profiled('vision_analysis')
 def lambda_handler(event, context):
-    """Lambda handler for vision-based pattern analysis"""
+    """Lambda handler for vision-based pattern analysis
+    
+    Stages run as a DAG (pipeline.py) so independent ones overlap: the
+    indicator state loads alongside the market data query, the S3 upload
+    alongside inference, and the two DynamoDB writes together.
+    """
+    if event.get('symbols'):
+        return analyze_batch(event, context)
+    
     start_time = datetime.now()
     
     try:
         analyzer = VisionPatternAnalyzer()
         
         # Get symbol from event
-        symbol = event.get('symbol', 'BTCUSDT')
+        symbol = event.get('symbol') or load_registry(dynamodb).default_symbol()
         logger.info(f"Starting vision analysis for {symbol}")
         
-        # Get recent market data from DynamoDB
-        from boto3.dynamodb.conditions import Key
-        market_data_table = dynamodb.Table(os.environ.get('MARKET_DATA_TABLE', 'market-data'))
+        market_data_table_name = os.environ.get('MARKET_DATA_TABLE', 'market-data')
         
-        # Query last 100 data points for chart generation
-        response = market_data_table.query(
-            KeyConditionExpression=Key('symbol').eq(symbol),
-            ScanIndexForward=False,
-            Limit=100
-        )
+        # Scan mode looks at a longer history with multi-scale sliding windows
+        scan_mode = event.get('mode') == 'scan'
+        window_sizes = event.get('window_sizes') or SCAN_WINDOW_SIZES
+        history = int(event.get('history', max(window_sizes))) if scan_mode else 100
         
-        if not response['Items']:
-            return {
-                'statusCode': 404,
-                'body': json.dumps({'error': f'No market data found for {symbol}'})
-            }
+        def query():
+            items = query_market_data(dynamodb.Table(market_data_table_name), symbol, history)
+            if not items:
+                raise LookupError(f'No market data found for {symbol}')
+            logger.info(f"Retrieved {len(items)} market data points")
+            return items
         
-        market_data = sorted(response['Items'], key=lambda x: int(x['timestamp']))
-        logger.info(f"Retrieved {len(market_data)} market data points")
+        def indicator_state():
+            # Streaming state kept by ingestion; its own Table handle since it runs beside query
+            try:
+                return load_state(dynamodb.Table(market_data_table_name), symbol)
+            except Exception as e:
+                logger.warning(f"Could not load indicator state for {symbol}: {e}")
+                return None
         
-        # Generate chart image and get array for vision model
-        chart_key, chart_array = analyzer.generate_chart_image(market_data, symbol)
-        if not chart_key or chart_array is None:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Failed to generate chart'})
-            }
+        def render(query):
+            # The uploaded chart and the prediction use the latest 100 points
+            image, chart_array = analyzer.render_chart(query[-100:])
+            if image is None:
+                raise RuntimeError('Failed to generate chart')
+            return image, chart_array
         
-        # Detect patterns using vision model
-        patterns = analyzer.detect_patterns_with_vision(chart_array)
-        if not patterns:
-            logger.warning("No patterns detected by vision model")
-            patterns = [{'type': 'no_pattern', 'confidence': 0.0, 'prediction': 'neutral'}]
+        def upload(render):
+            chart_key = analyzer.upload_chart(render[0], symbol)
+            if not chart_key:
+                raise RuntimeError('Failed to generate chart')
+            return chart_key
         
-        # Analyze sentiment
-        sentiment = analyzer.analyze_sentiment(symbol)
+        def inference(query, render=None):
+            # Detect patterns using vision model (cached by chart content)
+            if scan_mode:
+                patterns = analyzer.scan_patterns_multiscale(
+                    query, window_sizes, stride=event.get('stride')
+                )[:int(event.get('top_k', 5))]
+            else:
+                cache_key = chart_cache_key([float(d['close']) for d in query[-100:]])
+                patterns = analyzer.detect_patterns_with_vision(render[1], cache_key=cache_key)
+            if not patterns:
+                logger.warning("No patterns detected by vision model")
+                patterns = [{'type': 'no_pattern', 'confidence': 0.0, 'prediction': 'neutral'}]
+            return patterns
         
-        # Generate final prediction
-        prediction = analyzer.generate_prediction(symbol, market_data, patterns, sentiment)
+        def sentiment(query, indicator_state):
+            # Use the streaming state when it is current, otherwise rebuild from history
+            precomputed = None
+            if indicator_state and indicator_state.last_timestamp >= int(query[-1]['timestamp']):
+                precomputed = indicator_state.features()
+            return analyzer.analyze_sentiment(symbol, query, precomputed)
         
-        if not prediction:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Failed to generate prediction'})
-            }
+        def prediction(query, inference, sentiment):
+            result = analyzer.build_prediction(
+                symbol, query[-100:], inference, sentiment, prediction_id=event.get('run_id')
+            )
+            if not result:
+                raise RuntimeError('Failed to generate prediction')
+            return result
         
-        # Cache results
-        cache_item = {
-            'symbol': symbol,
-            'timestamp': int(datetime.now().timestamp()),
-            'chart_url': f"s3://{CHARTS_BUCKET}/{chart_key}",
-            'patterns': patterns,
-            'prediction': prediction,
-            'processing_time_ms': int((datetime.now() - start_time).total_seconds() * 1000),
-            'ttl': int((datetime.now() + timedelta(days=7)).timestamp())
-        }
+        def store_prediction(prediction):
+            analyzer.store_prediction(prediction)
         
-        analyzer.pattern_cache_table.put_item(Item=cache_item)
+        def store_cache(upload, inference, prediction):
+            # Cache results, referencing the stored prediction instead of copying it
+            cache_item = lean_cache_item(
+                symbol, int(datetime.now().timestamp()), f"s3://{CHARTS_BUCKET}/{upload}",
+                inference, prediction, int((datetime.now() - start_time).total_seconds() * 1000),
+                model_version=MODEL_VERSION, stage_timings_ms=pipeline.snapshot_timings()
+            )
+            analyzer.pattern_cache_table.put_item(Item=cache_item)
+            return cache_item
+        
+        pipeline = (
+            Pipeline()
+            .stage('query', query)
+            .stage('indicator_state', indicator_state)
+            .stage('render', render, deps=['query'])
+            .stage('upload', upload, deps=['render'])
+            # Scan mode renders its own windows, so it doesn't wait for the chart
+            .stage('inference', inference, deps=['query'] if scan_mode else ['query', 'render'])
+            .stage('sentiment', sentiment, deps=['query', 'indicator_state'])
+            .stage('prediction', prediction, deps=['query', 'inference', 'sentiment'])
+            .stage('store_prediction', store_prediction, deps=['prediction'])
+            .stage('store_cache', store_cache, deps=['upload', 'inference', 'prediction'])
+        )
+        
+        try:
+            results = pipeline.run()
+        except StageFailed as e:
+            record_stage_timings(pipeline.snapshot_timings())
+            metrics.increment(f"stage_{e.stage}_errors")
+            processing_time = (datetime.now() - start_time).total_seconds() * 1000
+            logger.error(f"Vision analysis failed in stage {e.stage} after {processing_time:.0f}ms: {e.error}")
+            return {
+                'statusCode': 404 if isinstance(e.error, LookupError) else 500,
+                'body': json.dumps({
+                    'error': str(e.error),
+                    'stage': e.stage,
+                    'processing_time_ms': int(processing_time),
+                    'stage_timings_ms': pipeline.snapshot_timings()
+                })
+            }
         
+        cache_item = results['store_cache']
         processing_time = (datetime.now() - start_time).total_seconds() * 1000
-        logger.info(f"Vision analysis completed in {processing_time:.0f}ms")
+        record_stage_timings(pipeline.snapshot_timings())
+        metrics.increment('patterns_detected', len(results['inference']))
+        logger.info(f"Vision analysis completed in {processing_time:.0f}ms {pipeline.snapshot_timings()}")
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'symbol': symbol,
                 'chart_url': cache_item['chart_url'],
-                'patterns': patterns,
-                'prediction': prediction,
+                'patterns': results['inference'],
+                'prediction': results['prediction'],
                 'processing_time_ms': int(processing_time),
+                'stage_timings_ms': pipeline.snapshot_timings(),
                 'model_version': 'vision_transformer_v14',
                 'timestamp': cache_item['timestamp']
             }, default=str)
@@ -389,4 +761,4 @@ def lambda_handler(event, context):
                 'error': str(e),
                 'processing_time_ms': int(processing_time)
             })
-        }
\ No newline at end of file
+        }
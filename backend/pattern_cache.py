@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+pattern_cache item schema
+=========================
+
+Schema 1 (legacy) items embed the whole prediction, whose
+patterns_detected repeats the item's patterns, and every pattern carries
+its class logits as a list of DynamoDB numbers.
+
+Schema 2 items reference the prediction by prediction_id and keep only a
+pattern summary; the logits of all patterns are packed into one float32
+binary attribute. Readers go through expand_cache_item, which returns the
+legacy shape for both schemas so API consumers don't change.
+
+Usage:
+    python pattern_cache.py --benchmark
+"""
+
+import argparse
+import json
+import math
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+CACHE_SCHEMA_VERSION = 2
+CACHE_TTL_DAYS = 7
+PREDICTIONS_BATCH_GET_SIZE = 100  # BatchGetItem key limit
+
+# Per-pattern attributes not stored in schema 2: logits are packed separately,
+# model_version is stored once per item and full-chart coordinates are implied
+_DROPPED_PATTERN_FIELDS = ('all_predictions', 'model_version')
+FULL_CHART_COORDINATES = {'x1': 0, 'y1': 0, 'x2': 224, 'y2': 224}
+
+def to_dynamodb(value):
+    """Recursively convert floats (including NumPy scalars) to Decimal for boto3"""
+    if isinstance(value, dict):
+        return {k: to_dynamodb(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamodb(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return Decimal(str(float(value)))
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def from_dynamodb(value):
+    """Inverse of to_dynamodb: Decimals back to int or float, recursively"""
+    if isinstance(value, dict):
+        return {k: from_dynamodb(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [from_dynamodb(v) for v in value]
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+def pack_logits(patterns):
+    """float32 bytes of the patterns' logits, one row per pattern (None if none have them)"""
+    rows = [p['all_predictions'] for p in patterns if 'all_predictions' in p]
+    if len(rows) != len(patterns) or not rows:
+        return None
+    return np.asarray(rows, dtype='<f4').tobytes()
+
+def unpack_logits(blob, n_patterns):
+    """Inverse of pack_logits: an n_patterns x classes float32 array"""
+    # boto3 returns Binary attributes wrapped; .value holds the raw bytes
+    blob = bytes(getattr(blob, 'value', blob))
+    return np.frombuffer(blob, dtype='<f4').reshape(n_patterns, -1)
+
+def summarize_patterns(patterns):
+    """Patterns without their logits and per-pattern model version, ready for DynamoDB"""
+    summary = []
+    for pattern in patterns:
+        pattern = {k: v for k, v in pattern.items() if k not in _DROPPED_PATTERN_FIELDS}
+        if pattern.get('coordinates') == FULL_CHART_COORDINATES:
+            del pattern['coordinates']
+        summary.append(pattern)
+    return to_dynamodb(summary)
+
+def lean_cache_item(symbol, timestamp, chart_url, patterns, prediction, processing_time_ms=None,
+                    model_version=None, stage_timings_ms=None, ttl_days=CACHE_TTL_DAYS):
+    """Schema 2 pattern_cache item for one analysis"""
+    item = {
+        'symbol': symbol,
+        'timestamp': timestamp,
+        'schema_version': CACHE_SCHEMA_VERSION,
+        'chart_url': chart_url,
+        'prediction_id': prediction['prediction_id'],
+        'direction': prediction['direction'],
+        'patterns': summarize_patterns(patterns),
+        'ttl': int((datetime.now() + timedelta(days=ttl_days)).timestamp())
+    }
+    if processing_time_ms is not None:
+        item['processing_time_ms'] = processing_time_ms
+    if stage_timings_ms:
+        item['stage_timings_ms'] = stage_timings_ms
+    model_version = model_version or next((p['model_version'] for p in patterns if 'model_version' in p), None)
+    if model_version:
+        item['model_version'] = model_version
+    logits = pack_logits(patterns)
+    if logits is not None:
+        item['logits'] = logits
+    return item
+
+def expand_cache_item(item, predictions=None):
+    """Legacy-shaped view of a pattern_cache item of either schema
+
+    predictions maps prediction_id to prediction items; a schema 2 item
+    whose prediction isn't in it gets a {'prediction_id': ...} stub.
+    """
+    if int(item.get('schema_version', 1)) < 2:
+        return item
+
+    patterns = [dict(p) for p in item.get('patterns', [])]
+    logits = unpack_logits(item['logits'], len(patterns)) if 'logits' in item else None
+    for i, pattern in enumerate(patterns):
+        pattern.setdefault('coordinates', FULL_CHART_COORDINATES)
+        if 'model_version' in item:
+            pattern['model_version'] = item['model_version']
+        if logits is not None:
+            pattern['all_predictions'] = logits[i].tolist()
+
+    expanded = {k: v for k, v in item.items() if k not in ('logits', 'prediction_id', 'direction', 'patterns')}
+    expanded['patterns'] = patterns
+    prediction_id = item['prediction_id']
+    expanded['prediction'] = (predictions or {}).get(
+        prediction_id, {'prediction_id': prediction_id, 'direction': item.get('direction')}
+    )
+    return expanded
+
+def fetch_predictions(dynamodb, table_name, prediction_ids):
+    """prediction_id -> prediction item via BatchGetItem, 100 keys per request"""
+    ids = sorted(set(prediction_ids))
+    found = {}
+    for start in range(0, len(ids), PREDICTIONS_BATCH_GET_SIZE):
+        request = {table_name: {'Keys': [{'prediction_id': i} for i in ids[start:start + PREDICTIONS_BATCH_GET_SIZE]]}}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for prediction in response.get('Responses', {}).get(table_name, []):
+                found[prediction['prediction_id']] = prediction
+            request = response.get('UnprocessedKeys') or None
+    return found
+
+def _sample_analysis(n_patterns, n_classes=10, seed=3):
+    """A representative analysis result shaped like pattern_analysis_vision's output"""
+    rng = np.random.default_rng(seed)
+    patterns = []
+    for i in range(n_patterns):
+        logits = rng.normal(0, 2, n_classes).astype(np.float32)
+        softmax = np.exp(logits) / np.exp(logits).sum()
+        pattern = {
+            'type': 'bullish_flag',
+            'confidence': float(softmax.max()),
+            'raw_score': float(logits.max()),
+            'coordinates': FULL_CHART_COORDINATES,
+            'prediction': 'bullish',
+            'all_predictions': logits.tolist(),
+            'model_version': 'v14_onnx'
+        }
+        if n_patterns > 1:
+            pattern['window_size'] = 100
+            pattern['coordinates'] = {'start_index': i * 25, 'end_index': i * 25 + 99,
+                                      'start_timestamp': 1_700_000_000 + i * 1500,
+                                      'end_timestamp': 1_700_000_000 + i * 1500 + 5940}
+        patterns.append(pattern)
+
+    prediction = {
+        'prediction_id': '3f0c8e4e-5b7a-4d7e-9a51-0c4f1a2b3c4d',
+        'symbol': 'BTCUSDT',
+        'prediction_score': 0.41234567,
+        'confidence': 0.41234567,
+        'direction': 'bullish',
+        'patterns_detected': patterns,
+        'sentiment': {'score': 0.2345, 'label': 'bullish', 'rsi': 61.234, 'macd': 12.3456,
+                      'bollinger_position': 0.71234, 'volatility': 0.012345},
+        'price_change_24h': 0.01234,
+        'model_version': 'vision_transformer_v14',
+        'created_at': 1_700_000_000,
+        'ttl': 1_702_592_000
+    }
+    return patterns, prediction
+
+def run_benchmark():
+    """Item sizes and write units of schema 1 vs schema 2 for single and scan analyses"""
+    from local_aws import item_size
+
+    results = {}
+    for mode, n_patterns in [('single', 1), ('scan_top5', 5)]:
+        patterns, prediction = _sample_analysis(n_patterns)
+        chart_url = 's3://cryptoai-analytics-charts-dev/charts/BTCUSDT/20231114_221320.png'
+
+        legacy = to_dynamodb({
+            'symbol': 'BTCUSDT', 'timestamp': 1_700_000_000, 'chart_url': chart_url,
+            'patterns': patterns, 'prediction': prediction, 'processing_time_ms': 812, 'ttl': 1_700_604_800
+        })
+        lean = lean_cache_item('BTCUSDT', 1_700_000_000, chart_url, patterns, prediction, 812)
+        legacy_prediction = to_dynamodb(prediction)
+        lean_prediction = {**to_dynamodb(prediction), 'patterns_detected': summarize_patterns(patterns)}
+
+        row = {}
+        for name, cache, stored_prediction in [('schema_1', legacy, legacy_prediction),
+                                               ('schema_2', lean, lean_prediction)]:
+            cache_bytes = item_size(cache)
+            prediction_bytes = item_size(stored_prediction)
+            row[name] = {
+                'pattern_cache_bytes': cache_bytes,
+                'prediction_bytes': prediction_bytes,
+                'write_units': math.ceil(cache_bytes / 1024) + math.ceil(prediction_bytes / 1024),
+            }
+        results[mode] = row
+
+        print(f"  {mode:<10} pattern_cache {row['schema_1']['pattern_cache_bytes']:>6,} -> "
+              f"{row['schema_2']['pattern_cache_bytes']:>5,} bytes | predictions "
+              f"{row['schema_1']['prediction_bytes']:>6,} -> {row['schema_2']['prediction_bytes']:>5,} bytes | "
+              f"WCU per analysis {row['schema_1']['write_units']} -> {row['schema_2']['write_units']}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='pattern_cache schema utilities')
+    parser.add_argument('--benchmark', action='store_true', help='Compare item sizes and write units per schema')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    print("🗃️  pattern_cache Schema")
+    print("=" * 60)
+    if not args.benchmark:
+        parser.error("nothing to do (use --benchmark)")
+
+    report = run_benchmark()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 4))
+
+# Shared across warm invocations so threads are not respawned per request
+_executor = None
+_executor_lock = threading.Lock()
+
+def shared_executor(workers=PIPELINE_WORKERS):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline')
+        return _executor
+
+class StageFailed(Exception):
+    """A pipeline stage raised; .stage names it and .error is the original exception"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+class Pipeline:
+    """A small DAG of named stages run on a thread pool
+
+    Each stage is a callable taking the results of its dependencies as
+    keyword arguments (named after the stages). A stage starts as soon as
+    all its dependencies have finished, so independent stages overlap.
+    The first failure stops new stages from starting and is raised as
+    StageFailed once the running ones have finished.
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.stages = {}
+        self.timings_ms = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, fn, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def _timed(self, name, fn, kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            with self._lock:
+                self.timings_ms[name] = int((time.perf_counter() - start) * 1000)
+
+    def snapshot_timings(self):
+        """Milliseconds spent in each finished stage so far"""
+        with self._lock:
+            return dict(self.timings_ms)
+
+    def run(self, **inputs):
+        """Run every stage; returns {stage: result} (inputs are available as results too)"""
+        executor = self.executor or shared_executor()
+        results = dict(inputs)
+        pending = dict(self.stages)
+        running = {}
+        failure = None
+
+        while pending or running:
+            if failure is None:
+                ready = [name for name, (_, deps) in pending.items() if all(d in results for d in deps)]
+                for name in ready:
+                    fn, deps = pending.pop(name)
+                    running[executor.submit(self._timed, name, fn, {d: results[d] for d in deps})] = name
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    if failure is None:
+                        failure = StageFailed(name, e)
+
+        if failure is not None:
+            raise failure
+        return results
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Chart preprocessing for the vision model
+========================================
+
+Turns chart images into the N x 3 x 224 x 224 float32 batch the ONNX
+model takes. The ImageNet mean/std are folded at import into one float32
+scale and offset per channel, so normalizing is a multiply from the uint8
+pixels straight into the output followed by an in-place add: no float64
+intermediates and no cast afterwards. Callers that preprocess repeatedly
+pass batch_buffer(n), a per-thread array reused across calls.
+
+Usage:
+    python preprocessing.py --benchmark
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = 224
+MODEL_DTYPE = np.float32
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=MODEL_DTYPE)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=MODEL_DTYPE)
+# (pixel / 255 - mean) / std == pixel * SCALE + OFFSET, per channel, in CHW layout
+SCALE = (1 / (255 * IMAGENET_STD)).astype(MODEL_DTYPE).reshape(3, 1, 1)
+OFFSET = (-IMAGENET_MEAN / IMAGENET_STD).astype(MODEL_DTYPE).reshape(3, 1, 1)
+
+# Pipeline stages run on pool threads, so each thread gets its own buffer
+_buffers = threading.local()
+
+def batch_buffer(n):
+    """This thread's reusable n x 3 x 224 x 224 float32 array, grown on demand
+
+    The contents are overwritten by the next call on the same thread, so
+    run the model on a batch before preprocessing the next one.
+    """
+    buffer = getattr(_buffers, 'array', None)
+    if buffer is None or len(buffer) < n:
+        buffer = np.empty((n, 3, IMAGE_SIZE, IMAGE_SIZE), dtype=MODEL_DTYPE)
+        _buffers.array = buffer
+    return buffer[:n]
+
+def to_rgb_pixels(image):
+    """A chart (PIL image, or uint8 or 0-1 float array) as a 224 x 224 x 3 uint8 array"""
+    if isinstance(image, np.ndarray):
+        if image.dtype != np.uint8:
+            image = (image * 255).astype(np.uint8)
+        image = Image.fromarray(image)
+
+    # Rendered charts are already 224x224; resize would only copy them
+    if image.size != (IMAGE_SIZE, IMAGE_SIZE):
+        image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+def preprocess_images(images, out=None):
+    """ImageNet-normalize charts into an N x 3 x 224 x 224 float32 batch
+
+    Writes into out (e.g. batch_buffer(len(images))) when given, else
+    allocates a new array. Raises TypeError for a non-float32 out and
+    ValueError for one of the wrong shape.
+    """
+    if out is None:
+        out = np.empty((len(images), 3, IMAGE_SIZE, IMAGE_SIZE), dtype=MODEL_DTYPE)
+    if out.dtype != MODEL_DTYPE:
+        raise TypeError(f"preprocess output must be float32, got {out.dtype}")
+    if out.shape != (len(images), 3, IMAGE_SIZE, IMAGE_SIZE):
+        raise ValueError(f"preprocess output must be {len(images)} x 3 x {IMAGE_SIZE} x {IMAGE_SIZE}, got {out.shape}")
+
+    for i, image in enumerate(images):
+        # uint8 HWC viewed as CHW, scaled straight into the float32 slot
+        np.multiply(to_rgb_pixels(image).transpose(2, 0, 1), SCALE, out=out[i])
+    out += OFFSET
+    return out
+
+def preprocess_image(image, out=None):
+    """One chart as a 1 x 3 x 224 x 224 float32 batch"""
+    return preprocess_images([image], out)
+
+def _legacy_preprocess(image_array):
+    """The per-call float64 normalization this module replaced, kept for --benchmark"""
+    if isinstance(image_array, np.ndarray):
+        if image_array.dtype != np.uint8:
+            image_array = (image_array * 255).astype(np.uint8)
+        image = Image.fromarray(image_array)
+    else:
+        image = image_array
+    image = image.resize((224, 224), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image_array = np.array(image).astype(np.float32) / 255.0
+    image_array = (image_array - np.array([0.485, 0.456, 0.406])) / np.array([0.229, 0.224, 0.225])
+    return np.expand_dims(np.transpose(image_array, (2, 0, 1)), axis=0)
+
+def _sample_charts(n, seed=7):
+    """Rendered 224x224 line charts of random walks, like the scan windows"""
+    from PIL import ImageDraw
+
+    rng = np.random.default_rng(seed)
+    charts = []
+    for _ in range(n):
+        prices = np.cumsum(rng.normal(0, 1, 100))
+        xs = np.arange(100) * 2.2 + 2
+        ys = 218 - (prices - prices.min()) / (np.ptp(prices) or 1) * 216
+        image = Image.new('RGB', (IMAGE_SIZE, IMAGE_SIZE), 'white')
+        ImageDraw.Draw(image).line(list(zip(xs.tolist(), ys.tolist())), fill='blue', width=2)
+        charts.append(image)
+    return charts
+
+def _best_ms(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def run_benchmark(batch_sizes=(1, 8, 32), repeats=20):
+    """Per-image time and output dtype of the float64 path vs the fused float32 path"""
+    results = {}
+    for n in batch_sizes:
+        charts = _sample_charts(n)
+        # The old path needed a concatenate and a cast to reach the model's dtype
+        legacy_ms = _best_ms(lambda: np.concatenate([_legacy_preprocess(c) for c in charts]).astype(np.float32), repeats)
+        fused_ms = _best_ms(lambda: preprocess_images(charts, out=batch_buffer(n)), repeats)
+
+        legacy = np.concatenate([_legacy_preprocess(c) for c in charts])
+        fused = preprocess_images(charts)
+        max_diff = float(np.abs(legacy - fused).max())
+        results[f"batch_{n}"] = {
+            'legacy_ms_per_image': round(legacy_ms / n, 4),
+            'fused_ms_per_image': round(fused_ms / n, 4),
+            'speedup': round(legacy_ms / fused_ms, 2),
+            'legacy_dtype': str(legacy.dtype),
+            'fused_dtype': str(fused.dtype),
+            'max_abs_diff': max_diff,
+        }
+        print(f"  batch {n:>3}: {legacy_ms / n:.3f} -> {fused_ms / n:.3f} ms/image "
+              f"({legacy_ms / fused_ms:.1f}x), {legacy.dtype} -> {fused.dtype}, max diff {max_diff:.1e}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Vision model preprocessing')
+    parser.add_argument('--benchmark', action='store_true', help='Compare against the float64 per-call normalization')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    print("🖼️  Chart Preprocessing")
+    print("=" * 60)
+    if not args.benchmark:
+        parser.error("nothing to do (use --benchmark)")
+
+    report = run_benchmark()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import marshal
+import threading
+import functools
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# '' (off), 'sampling' or 'cprofile'; an invocation can also opt in with event['profile']
+PROFILE_MODE = os.environ.get('PROFILE_MODE', '')
+CHARTS_BUCKET = os.environ.get('CHARTS_BUCKET')
+PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT') or (
+    f"s3://{CHARTS_BUCKET}/profiles" if CHARTS_BUCKET
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 15))
+
+PROFILE_MODES = ('sampling', 'cprofile')
+# Set while an invocation is being profiled (Lambda runs one at a time)
+_active = False
+# Leaf frames of threads that are blocked waiting: pool workers between
+# tasks, and the handler waiting on pipeline futures
+IDLE_FRAMES = ('python:wait:', 'python:_worker:')
+
+def requested_mode(event):
+    """Profiling mode for an invocation: event['profile'] (True or a mode name), else PROFILE_MODE"""
+    flag = event.get('profile') if isinstance(event, dict) else None
+    if flag is True or flag == 'true':
+        return 'sampling'
+    if flag in PROFILE_MODES:
+        return flag
+    return PROFILE_MODE if PROFILE_MODE in PROFILE_MODES else None
+
+def library_of(filename):
+    """Library a source file belongs to: the site-packages package, 'python' for the stdlib or the module name"""
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/'):
+        if marker in path:
+            return path.split(marker, 1)[1].split('/', 1)[0].split('.', 1)[0]
+    if path == '~':
+        return 'builtins'  # cProfile's label for C functions
+    if path.startswith('<'):
+        return 'python'
+    if path.startswith(os.path.dirname(os.__file__).replace('\\', '/')):
+        return 'python'
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _frame_label(code):
+    return f"{library_of(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every interval_ms from a background thread
+
+    Pipeline stages run on pool threads, so sampling every thread (rather
+    than profiling the handler's thread) is what attributes their time.
+    Overhead is one sys._current_frames() walk per interval.
+    """
+
+    def __init__(self, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                # Idle threads say nothing about where time goes
+                if stack and not stack[0].startswith(IDLE_FRAMES):
+                    self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Collapsed-stack text (one 'frame;frame;frame count' line per stack) for flame graphs"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def hotspots(self, top_n=PROFILE_TOP_N):
+        """Top functions by self samples, with inclusive share, and self share per library"""
+        total = sum(self.stacks.values()) or 1
+        self_counts, inclusive, libraries = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            self_counts[frames[-1]] += count
+            libraries[frames[-1].split(':', 1)[0]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        return {
+            'functions': [
+                {'function': frame, 'self_pct': round(100 * count / total, 1),
+                 'total_pct': round(100 * inclusive[frame] / total, 1)}
+                for frame, count in self_counts.most_common(top_n)
+            ],
+            'libraries': {lib: round(100 * count / total, 1) for lib, count in libraries.most_common(top_n)},
+            'samples': total,
+        }
+
+class CProfileProfiler:
+    """Deterministic cProfile of the handler's thread
+
+    Work on pipeline pool threads shows up only as the handler waiting;
+    use the sampling profiler to attribute stage time.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def pstats_bytes(self):
+        """The profile in the format dump_stats writes (load with pstats.Stats(path))"""
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    def hotspots(self, top_n=PROFILE_TOP_N):
+        """Top functions by self time, and self time per library"""
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)
+        total = sum(tottime for _, (_, _, tottime, _, _) in rows) or 1e-9
+        libraries = Counter()
+        for (filename, _, _), (_, _, tottime, _, _) in rows:
+            libraries[library_of(filename)] += tottime
+        return {
+            'functions': [
+                {'function': f"{library_of(filename)}:{name}:{line}", 'calls': calls,
+                 'self_ms': round(tottime * 1000, 2), 'total_ms': round(cumtime * 1000, 2)}
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in rows[:top_n]
+            ],
+            'libraries': {lib: round(100 * t / total, 1) for lib, t in libraries.most_common(top_n)},
+        }
+
+def write_output(name, body, output=None):
+    """Store a profile under output (s3:// URI or directory); returns its location"""
+    output = output or PROFILE_OUTPUT
+    if output.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = output[len('s3://'):].partition('/')
+        key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=body)
+        return f"s3://{bucket}/{key}"
+
+    path = os.path.join(output, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+def _attach_profile(response, summary):
+    """Add the summary to a Lambda proxy response with a JSON object body"""
+    if not isinstance(response, dict) or not isinstance(response.get('body'), str):
+        return response
+    try:
+        body = json.loads(response['body'])
+    except ValueError:
+        return response
+    if isinstance(body, dict):
+        body['profile'] = summary
+        response = {**response, 'body': json.dumps(body, default=str)}
+    return response
+
+def profiled(name, output=None):
+    """Decorator for Lambda handlers: opt-in profiling of an invocation
+
+    With profiling off the handler is called directly. Otherwise the
+    profile (collapsed stacks or pstats) is written under
+    <output>/<name>/ and a top-N hotspot summary is added to the
+    response body as 'profile'.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _active
+            mode = requested_mode(event)
+            # Batches call the handler per symbol; the outer profile covers them
+            if mode is None or _active:
+                return handler(event, context)
+
+            profiler = SamplingProfiler() if mode == 'sampling' else CProfileProfiler()
+            start = time.perf_counter()
+            _active = True
+            profiler.start()
+            try:
+                response = handler(event, context)
+            finally:
+                profiler.stop()
+                _active = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            stem = f"{name}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            summary = {'mode': mode, 'duration_ms': int(elapsed_ms), **profiler.hotspots()}
+            try:
+                if mode == 'sampling':
+                    summary['output'] = write_output(f"{stem}.collapsed", profiler.collapsed().encode(), output)
+                else:
+                    summary['output'] = write_output(f"{stem}.pstats", profiler.pstats_bytes(), output)
+            except Exception as e:
+                logger.warning(f"Could not store profile: {e}")
+
+            top = summary['functions'][0]['function'] if summary['functions'] else None
+            logger.info(f"Profiled {name} ({mode}) in {elapsed_ms:.0f}ms, top hotspot {top}, libraries {summary['libraries']}")
+            return _attach_profile(response, summary)
+        return wrapper
+    return decorator
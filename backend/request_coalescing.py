@@ -0,0 +1,115 @@
+import time
+import uuid
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+class DynamoDBInFlightRegistry:
+    """Single-flight markers for analysis runs, one conditional-write item per symbol
+
+    The first request for a symbol writes a marker holding a new run_id;
+    requests arriving before the marker expires fail the conditional write,
+    increment its coalesced_count and attach to the existing run_id.
+    """
+
+    def __init__(self, table, window_seconds=60, clock=time.time):
+        self.table = table
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.stats = {'started': 0, 'coalesced': 0}
+
+    def acquire(self, symbol):
+        """Return (run_id, coalesced) for an analysis request on symbol"""
+        for _ in range(2):
+            now = int(self.clock())
+            run_id = str(uuid.uuid4())
+
+            try:
+                self.table.put_item(
+                    Item={
+                        'symbol': symbol,
+                        'run_id': run_id,
+                        'started_at': now,
+                        'expires_at': now + self.window_seconds,
+                        'coalesced_count': 0,
+                        'ttl': now + self.window_seconds + 3600
+                    },
+                    ConditionExpression='attribute_not_exists(symbol) OR expires_at < :now',
+                    ExpressionAttributeValues={':now': now}
+                )
+                self.stats['started'] += 1
+                return run_id, False
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+            try:
+                response = self.table.update_item(
+                    Key={'symbol': symbol},
+                    UpdateExpression='ADD coalesced_count :one',
+                    ConditionExpression='expires_at >= :now',
+                    ExpressionAttributeValues={':one': 1, ':now': now},
+                    ReturnValues='ALL_NEW'
+                )
+                self.stats['coalesced'] += 1
+                return response['Attributes']['run_id'], True
+            except ClientError as e:
+                # Marker expired between the two writes: retry as a new run
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+        raise RuntimeError(f"Could not acquire in-flight marker for {symbol}")
+
+    def release(self, symbol, run_id):
+        """Remove the marker if it still belongs to run_id (e.g. the invoke failed)"""
+        try:
+            self.table.delete_item(
+                Key={'symbol': symbol},
+                ConditionExpression='run_id = :run_id',
+                ExpressionAttributeValues={':run_id': run_id}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+class LocalInFlightRegistry:
+    """In-process stand-in for DynamoDBInFlightRegistry
+
+    Only deduplicates requests handled by the same container; used when no
+    INFLIGHT_TABLE is configured and in local tests.
+    """
+
+    def __init__(self, window_seconds=60, clock=time.time):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.stats = {'started': 0, 'coalesced': 0}
+        self._markers = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, symbol):
+        """Return (run_id, coalesced) for an analysis request on symbol"""
+        now = self.clock()
+        with self._lock:
+            marker = self._markers.get(symbol)
+            if marker and marker['expires_at'] >= now:
+                marker['coalesced_count'] += 1
+                self.stats['coalesced'] += 1
+                return marker['run_id'], True
+
+            run_id = str(uuid.uuid4())
+            self._markers[symbol] = {
+                'run_id': run_id,
+                'expires_at': now + self.window_seconds,
+                'coalesced_count': 0
+            }
+            self.stats['started'] += 1
+            return run_id, False
+
+    def release(self, symbol, run_id):
+        """Remove the marker if it still belongs to run_id"""
+        with self._lock:
+            marker = self._markers.get(symbol)
+            if marker and marker['run_id'] == run_id:
+                del self._markers[symbol]
@@ -0,0 +1,74 @@
+import json
+import boto3
+from datetime import datetime
+import os
+import logging
+from symbol_registry import SCHEDULER_TICK_SECONDS, load_registry, partition
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# AWS clients
+dynamodb = boto3.resource('dynamodb')
+lambda_client = boto3.client('lambda')
+
+# Environment variables
+ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+INGESTION_FUNCTION = os.environ.get('INGESTION_FUNCTION', f"cryptoai-analytics-data-ingestion-{ENVIRONMENT}")
+ANALYSIS_FUNCTION = os.environ.get('ANALYSIS_FUNCTION', f"cryptoai-analytics-pattern-analysis-{ENVIRONMENT}")
+INGESTION_BATCH_SIZE = int(os.environ.get('INGESTION_BATCH_SIZE', 100))
+# Each analysis invocation runs the ViT once per symbol, so keep batches well inside the 300s timeout
+ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', 10))
+
+JOBS = {
+    'ingestion': (INGESTION_FUNCTION, INGESTION_BATCH_SIZE),
+    'analysis': (ANALYSIS_FUNCTION, ANALYSIS_BATCH_SIZE),
+}
+
+def tick_start(event):
+    """Start of the scheduler tick this event belongs to, in epoch seconds"""
+    if 'time' in event:
+        now = datetime.fromisoformat(event['time'].replace('Z', '+00:00')).timestamp()
+    else:
+        now = datetime.now().timestamp()
+    return int(now) // SCHEDULER_TICK_SECONDS * SCHEDULER_TICK_SECONDS
+
+def lambda_handler(event, context):
+    """Fan out the symbols due this tick to ingestion and analysis invocations in batches"""
+    try:
+        now = tick_start(event)
+        registry = load_registry(dynamodb)
+        summary = {}
+
+        for job, (function_name, batch_size) in JOBS.items():
+            due = registry.due(job, now)
+            batches = partition(due, batch_size)
+
+            for batch in batches:
+                lambda_client.invoke(
+                    FunctionName=function_name,
+                    InvocationType='Event',  # Asynchronous
+                    Payload=json.dumps({'symbols': batch, 'scheduled_at': now})
+                )
+
+            summary[job] = {'symbols': len(due), 'invocations': len(batches)}
+            logger.info(f"Scheduled {job} for {len(due)} symbols in {len(batches)} invocations")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'tick': now,
+                'registry_size': len(registry.entries),
+                'jobs': summary
+            })
+        }
+
+    except Exception as e:
+        logger.error(f"Scheduler error: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e)
+            })
+        }
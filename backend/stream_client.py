@@ -0,0 +1,156 @@
+import os
+import json
+import random
+import asyncio
+import logging
+import websockets
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+logger = logging.getLogger(__name__)
+
+BINANCE_STREAM_URL = os.environ.get('BINANCE_STREAM_URL', 'wss://stream.binance.com:9443')
+# Binance allows up to 1024 streams per connection; smaller shards limit the blast radius of a drop
+STREAMS_PER_CONNECTION = int(os.environ.get('STREAMS_PER_CONNECTION', 200))
+RECONNECT_BASE_DELAY = float(os.environ.get('RECONNECT_BASE_DELAY', 1.0))
+RECONNECT_MAX_DELAY = float(os.environ.get('RECONNECT_MAX_DELAY', 60.0))
+WEBSOCKET_TRACE = os.environ.get('WEBSOCKET_TRACE', 'false').lower() == 'true'
+
+KLINE_INTERVALS = {'1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600}
+
+def shard_streams(streams, per_connection=STREAMS_PER_CONNECTION):
+    """Split stream names into groups of at most per_connection"""
+    return [streams[i:i + per_connection] for i in range(0, len(streams), per_connection)]
+
+def combined_stream_url(base_url, streams):
+    """Combined-stream endpoint; every message arrives as {'stream': ..., 'data': ...}"""
+    return f"{base_url.rstrip('/')}/stream?streams={'/'.join(streams)}"
+
+def backoff_delay(attempt, base=RECONNECT_BASE_DELAY, cap=RECONNECT_MAX_DELAY):
+    """Full-jitter exponential backoff, so shards dropped together don't reconnect in lockstep"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class KlineGapDetector:
+    """Tracks the last closed kline per symbol and reports missing candles
+
+    A closed kline whose open time is more than one interval after the
+    previous one means candles were missed (typically while reconnecting);
+    the missing range [first_missing, last_missing] in seconds is returned.
+    """
+
+    def __init__(self, interval_seconds=60):
+        self.interval = interval_seconds
+        self.last_open_time = {}
+
+    def observe(self, symbol, open_time):
+        """Record a closed kline; returns (first_missing, last_missing) or None"""
+        previous = self.last_open_time.get(symbol)
+        if previous is not None and open_time <= previous:
+            return None  # Duplicate or replayed candle
+        self.last_open_time[symbol] = open_time
+
+        if previous is not None and open_time - previous > self.interval:
+            return previous + self.interval, open_time - self.interval
+        return None
+
+class CombinedStreamClient:
+    """asyncio client for Binance combined streams, sharded across connections
+
+    Symbols are spread over ceil(len / per_connection) sockets, each with
+    its own reconnect loop. on_payload receives each message's 'data'
+    dict on the event loop, which every shard shares: it must only hand
+    the payload off (e.g. put it on a queue), never wait on I/O. For
+    kline streams, closed candles go through a gap detector and
+    on_gap(symbol, first_missing, last_missing) runs in the default
+    executor, so a backfill doesn't stall the receive loop.
+    """
+
+    def __init__(self, symbols, on_payload, stream='kline_1m', on_gap=None,
+                 base_url=BINANCE_STREAM_URL, per_connection=STREAMS_PER_CONNECTION,
+                 base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.streams = [f"{symbol.lower()}@{stream}" for symbol in symbols]
+        self.on_payload = on_payload
+        self.on_gap = on_gap
+        self.base_url = base_url
+        self.per_connection = per_connection
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.running = False
+        self.gap_detector = None
+        if stream.startswith('kline_'):
+            self.gap_detector = KlineGapDetector(KLINE_INTERVALS[stream.split('_', 1)[1]])
+        self.stats = {'messages': 0, 'connects': 0, 'reconnects': 0, 'gaps': 0}
+        self._sockets = set()
+        self._gap_tasks = set()
+
+        if WEBSOCKET_TRACE:
+            logging.getLogger('websockets').setLevel(logging.DEBUG)
+
+    async def run(self):
+        """Run every shard until stop() is called"""
+        self.running = True
+        shards = shard_streams(self.streams, self.per_connection)
+        logger.info(f"Streaming {len(self.streams)} streams over {len(shards)} connections")
+        await asyncio.gather(*(self._run_shard(i, streams) for i, streams in enumerate(shards)))
+        if self._gap_tasks:
+            await asyncio.gather(*self._gap_tasks, return_exceptions=True)
+
+    async def stop(self):
+        self.running = False
+        for ws in list(self._sockets):
+            await ws.close()
+
+    async def _run_shard(self, shard_id, streams):
+        url = combined_stream_url(self.base_url, streams)
+        attempt = 0
+
+        while self.running:
+            try:
+                async with websockets.connect(url, ping_interval=20, ping_timeout=20, max_queue=1024) as ws:
+                    self._sockets.add(ws)
+                    self.stats['connects'] += 1
+                    logger.info(f"Shard {shard_id} connected ({len(streams)} streams)")
+                    try:
+                        async for message in ws:
+                            attempt = 0  # Healthy connection: reset the backoff
+                            self._handle_message(message)
+                    finally:
+                        self._sockets.discard(ws)
+            except (ConnectionClosed, InvalidHandshake, OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Shard {shard_id} connection lost: {e}")
+
+            if not self.running:
+                break
+
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            attempt += 1
+            self.stats['reconnects'] += 1
+            logger.info(f"Shard {shard_id} reconnecting in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    def _handle_message(self, message):
+        try:
+            payload = json.loads(message).get('data')
+            if not payload:
+                return
+            self.stats['messages'] += 1
+
+            kline = payload.get('k')
+            if kline and kline.get('x') and self.gap_detector:
+                gap = self.gap_detector.observe(kline['s'], int(kline['t']) // 1000)
+                if gap:
+                    self._report_gap(kline['s'], *gap)
+
+            # Enqueue only: anything slower here stalls every shard
+            self.on_payload(payload)
+
+        except Exception as e:
+            logger.error(f"Error handling stream message: {e}")
+
+    def _report_gap(self, symbol, first_missing, last_missing):
+        self.stats['gaps'] += 1
+        logger.warning(f"Gap in {symbol} klines: {first_missing} to {last_missing}")
+        if self.on_gap is None:
+            return
+        task = asyncio.get_running_loop().run_in_executor(None, self.on_gap, symbol, first_missing, last_missing)
+        self._gap_tasks.add(task)
+        task.add_done_callback(self._gap_tasks.discard)
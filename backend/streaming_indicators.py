@@ -0,0 +1,245 @@
+import math
+import struct
+import logging
+import numpy as np
+
+from indicators import DEFAULT_PARAMS, compute_indicators
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT_VERSION = 1
+STATE_SORT_KEY = 0  # market_data range key for the '<symbol>#features' item
+
+# Scalar state packed after the header, in this order
+_SCALAR_FIELDS = [
+    'last_timestamp', 'count',
+    'ema_fast', 'ema_slow', 'macd_signal',
+    'prev_close', 'avg_gain', 'avg_loss', 'atr',
+    'vwap_pv', 'vwap_volume',
+]
+_PARAM_FIELDS = ['ema_fast', 'ema_slow', 'macd_signal', 'rsi_period', 'atr_period',
+                 'bollinger_period', 'volatility_window']
+_HEADER = struct.Struct('<H7H d')  # version, integer params, bollinger_std
+
+class RollingWindow:
+    """Fixed-size ring buffer with running sum and sum of squares
+
+    Sums are resynchronized from the buffer once per full rotation so
+    floating-point drift stays bounded while updates remain O(1) amortized.
+    """
+
+    def __init__(self, size, values=()):
+        self.size = size
+        self.buffer = [0.0] * size
+        self.pos = 0
+        self.count = 0
+        self.sum = self.sum_sq = 0.0
+        for value in values:
+            self.push(float(value))
+        self._resync()
+
+    def push(self, value):
+        if self.count == self.size:
+            old = self.buffer[self.pos]
+            self.sum -= old
+            self.sum_sq -= old * old
+        else:
+            self.count += 1
+
+        self.buffer[self.pos] = value
+        self.sum += value
+        self.sum_sq += value * value
+        self.pos = (self.pos + 1) % self.size
+
+        if self.pos == 0:
+            self._resync()
+
+    def _resync(self):
+        values = self.values()
+        self.sum = math.fsum(values)
+        self.sum_sq = math.fsum(v * v for v in values)
+
+    def values(self):
+        """Contents in insertion order (oldest first)"""
+        if self.count < self.size:
+            return self.buffer[:self.count]
+        return self.buffer[self.pos:] + self.buffer[:self.pos]
+
+    def mean_std(self):
+        """Mean and population std of the current contents"""
+        if self.count == 0:
+            return 0.0, 0.0
+        mean = self.sum / self.count
+        var = max(self.sum_sq / self.count - mean * mean, 0.0)
+        return mean, math.sqrt(var)
+
+class StreamingIndicatorState:
+    """Per-symbol indicator state updated in O(1) per closed candle
+
+    Produces the same values as indicators.compute_indicators over the full
+    series. Bootstrap from history with from_ohlcv, then call update for each
+    new candle.
+    """
+
+    def __init__(self, symbol, params=None):
+        self.symbol = symbol
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.last_timestamp = 0
+        self.count = 0
+        self.ema_fast = self.ema_slow = self.macd_signal = 0.0
+        self.prev_close = self.avg_gain = self.avg_loss = self.atr = 0.0
+        self.vwap_pv = self.vwap_volume = 0.0
+        self.closes = RollingWindow(self.params['bollinger_period'])
+        self.log_returns = RollingWindow(self.params['volatility_window'])
+
+    @classmethod
+    def from_ohlcv(cls, symbol, ohlcv, params=None):
+        """Bootstrap state from historical OHLCV arrays with the vectorized engine"""
+        state = cls(symbol, params)
+        if len(ohlcv['close']) == 0:
+            return state
+
+        _, engine_state = compute_indicators(ohlcv, state.params)
+        close = np.asarray(ohlcv['close'], dtype=np.float64)
+
+        state.last_timestamp = int(ohlcv['timestamp'][-1])
+        state.count = len(close)
+        state.ema_fast = float(engine_state['ema_fast'])
+        state.ema_slow = float(engine_state['ema_slow'])
+        state.macd_signal = float(engine_state['macd_signal'])
+        state.prev_close = float(close[-1])
+        state.avg_gain = float(engine_state['rsi']['avg_gain'])
+        state.avg_loss = float(engine_state['rsi']['avg_loss'])
+        state.atr = float(engine_state['atr']['atr'])
+        state.vwap_pv = float(engine_state['vwap']['pv'])
+        state.vwap_volume = float(engine_state['vwap']['volume'])
+
+        window = state.params['volatility_window']
+        log_returns = np.diff(np.log(close), prepend=np.log(close[0]))
+        state.closes = RollingWindow(state.params['bollinger_period'], close[-state.params['bollinger_period']:])
+        state.log_returns = RollingWindow(window, log_returns[-window:])
+        return state
+
+    def update(self, timestamp, open_, high, low, close, volume):
+        """Fold one closed candle into the state; returns False for stale/duplicate candles"""
+        if self.count and timestamp <= self.last_timestamp:
+            return False
+
+        p = self.params
+        first = self.count == 0
+
+        if first:
+            self.ema_fast = self.ema_slow = close
+            self.macd_signal = 0.0
+            self.avg_gain = self.avg_loss = 0.0
+            self.atr = high - low
+            self.log_returns.push(0.0)
+        else:
+            a_fast = 2.0 / (p['ema_fast'] + 1)
+            a_slow = 2.0 / (p['ema_slow'] + 1)
+            a_signal = 2.0 / (p['macd_signal'] + 1)
+            self.ema_fast += a_fast * (close - self.ema_fast)
+            self.ema_slow += a_slow * (close - self.ema_slow)
+            self.macd_signal += a_signal * ((self.ema_fast - self.ema_slow) - self.macd_signal)
+
+            delta = close - self.prev_close
+            self.avg_gain += (max(delta, 0.0) - self.avg_gain) / p['rsi_period']
+            self.avg_loss += (max(-delta, 0.0) - self.avg_loss) / p['rsi_period']
+
+            true_range = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            self.atr += (true_range - self.atr) / p['atr_period']
+
+            self.log_returns.push(math.log(close) - math.log(self.prev_close))
+
+        self.vwap_pv += (high + low + close) / 3.0 * volume
+        self.vwap_volume += volume
+        self.closes.push(close)
+        self.prev_close = close
+        self.last_timestamp = timestamp
+        self.count += 1
+        return True
+
+    def features(self):
+        """Latest indicator values, keyed like indicators.latest_features"""
+        macd_line = self.ema_fast - self.ema_slow
+
+        if self.avg_loss == 0:
+            rsi_value = 50.0 if self.avg_gain == 0 else 100.0
+        else:
+            rsi_value = 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+
+        middle, std = self.closes.mean_std()
+        band = self.params['bollinger_std'] * std
+        _, volatility = self.log_returns.mean_std()
+
+        return {
+            'ema_fast': self.ema_fast,
+            'ema_slow': self.ema_slow,
+            'rsi': rsi_value,
+            'macd': macd_line,
+            'macd_signal': self.macd_signal,
+            'macd_hist': macd_line - self.macd_signal,
+            'atr': self.atr,
+            'bb_middle': middle,
+            'bb_upper': middle + band,
+            'bb_lower': middle - band,
+            'vwap': self.vwap_pv / self.vwap_volume if self.vwap_volume > 0 else self.prev_close,
+            'volatility': volatility,
+        }
+
+    def to_bytes(self):
+        """Pack params, scalars and ring buffers into a compact little-endian blob"""
+        p = self.params
+        header = _HEADER.pack(STATE_FORMAT_VERSION, *(p[name] for name in _PARAM_FIELDS), p['bollinger_std'])
+        scalars = [getattr(self, name) for name in _SCALAR_FIELDS]
+        windows = [
+            self.closes.count, *self.closes.values(),
+            self.log_returns.count, *self.log_returns.values(),
+        ]
+        return header + np.array(scalars + windows, dtype='<f8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, symbol, blob):
+        """Inverse of to_bytes"""
+        version, *int_params, bollinger_std = _HEADER.unpack_from(blob)
+        if version != STATE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported indicator state version: {version}")
+
+        params = dict(zip(_PARAM_FIELDS, int_params), bollinger_std=bollinger_std)
+        state = cls(symbol, params)
+        values = np.frombuffer(blob, dtype='<f8', offset=_HEADER.size).tolist()
+
+        for i, name in enumerate(_SCALAR_FIELDS):
+            setattr(state, name, values[i])
+        state.last_timestamp = int(state.last_timestamp)
+        state.count = int(state.count)
+
+        pos = len(_SCALAR_FIELDS)
+        n_closes = int(values[pos])
+        state.closes = RollingWindow(params['bollinger_period'], values[pos + 1:pos + 1 + n_closes])
+        pos += 1 + n_closes
+        n_returns = int(values[pos])
+        state.log_returns = RollingWindow(params['volatility_window'], values[pos + 1:pos + 1 + n_returns])
+        return state
+
+def state_key(symbol):
+    """market_data key of the packed indicator state item for symbol"""
+    return {'symbol': f"{symbol}#features", 'timestamp': STATE_SORT_KEY}
+
+def load_state(table, symbol):
+    """Read a symbol's indicator state from market_data, or None"""
+    response = table.get_item(Key=state_key(symbol))
+    item = response.get('Item')
+    if not item:
+        return None
+    # boto3 returns Binary attributes wrapped; .value holds the raw bytes
+    blob = getattr(item['state'], 'value', item['state'])
+    return StreamingIndicatorState.from_bytes(symbol, bytes(blob))
+
+def save_state(table, state):
+    """Persist a symbol's indicator state as one small binary item"""
+    table.put_item(Item={
+        **state_key(state.symbol),
+        'state': state.to_bytes(),
+        'last_timestamp': state.last_timestamp,
+    })
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SYMBOLS_FILE = os.environ.get('SYMBOLS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symbols.json'))
+SYMBOLS_TABLE = os.environ.get('SYMBOLS_TABLE')
+# Warm containers reload the registry this often, so enabling or disabling a
+# symbol in SYMBOLS_TABLE takes effect within this many seconds (the ingestion
+# stream subscribes to the symbols loaded when it starts)
+SYMBOLS_REFRESH_SECONDS = int(os.environ.get('SYMBOLS_REFRESH_SECONDS', 300))
+SCHEDULER_TICK_SECONDS = 60  # EventBridge rate of the scheduler Lambda
+
+# Default cadence per tier, in seconds, for each scheduled job
+TIER_CADENCE = {
+    'hot': {'ingestion': 60, 'analysis': 300},
+    'warm': {'ingestion': 300, 'analysis': 900},
+    'cold': {'ingestion': 3600, 'analysis': 3600},
+}
+
+# Registry is reused across warm invocations until SYMBOLS_REFRESH_SECONDS old
+_registry = None
+_registry_loaded_at = None
+
+class SymbolRegistry:
+    """Tracked symbols with their CoinGecko id, tier and per-job cadence
+
+    Entries are dicts with 'symbol', 'coingecko_id', 'tier' and optionally
+    'enabled' (default true) and per-job cadence overrides such as
+    {'cadence': {'analysis': 600}}.
+    """
+
+    def __init__(self, entries):
+        self.entries = {}
+        for entry in entries:
+            if not entry.get('enabled', True):
+                continue
+            tier = entry.get('tier', 'cold')
+            if tier not in TIER_CADENCE:
+                raise ValueError(f"Unknown tier {tier!r} for {entry['symbol']}")
+            self.entries[entry['symbol']] = {**entry, 'tier': tier}
+
+    @classmethod
+    def from_file(cls, path=SYMBOLS_FILE):
+        with open(path) as f:
+            return cls(json.load(f)['symbols'])
+
+    @classmethod
+    def from_table(cls, table):
+        """Load entries from a DynamoDB table keyed by symbol"""
+        items = []
+        kwargs = {}
+        while True:
+            response = table.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return cls(items)
+
+    def symbols(self, tier=None):
+        """Enabled symbols, hottest tier first, optionally restricted to one tier"""
+        order = list(TIER_CADENCE)
+        entries = sorted(self.entries.values(), key=lambda e: (order.index(e['tier']), e['symbol']))
+        return [e['symbol'] for e in entries if tier is None or e['tier'] == tier]
+
+    def get(self, symbol):
+        return self.entries.get(symbol)
+
+    def default_symbol(self):
+        symbols = self.symbols()
+        return symbols[0] if symbols else 'BTCUSDT'
+
+    def coingecko_ids(self, symbols=None):
+        """symbol -> CoinGecko id for the given (default: all) symbols that have one"""
+        symbols = symbols if symbols is not None else self.symbols()
+        return {s: self.entries[s]['coingecko_id'] for s in symbols
+                if s in self.entries and self.entries[s].get('coingecko_id')}
+
+    def cadence(self, symbol, job):
+        """Seconds between runs of job ('ingestion' or 'analysis') for symbol"""
+        entry = self.entries[symbol]
+        return int(entry.get('cadence', {}).get(job, TIER_CADENCE[entry['tier']][job]))
+
+    def due(self, job, now, tick=SCHEDULER_TICK_SECONDS):
+        """Symbols whose job should run in the scheduler tick starting at now
+
+        Each symbol runs once per cadence, in a slot offset by a stable hash
+        of its name, so long-tail symbols spread over the hour instead of
+        all firing at minute 0. Stateless: no last-run bookkeeping needed.
+        """
+        due = []
+        for symbol in self.symbols():
+            cadence = self.cadence(symbol, job)
+            if cadence <= tick:
+                due.append(symbol)
+                continue
+            offset = (zlib.crc32(f"{symbol}:{job}".encode()) % (cadence // tick)) * tick
+            if (int(now) - offset) % cadence < tick:
+                due.append(symbol)
+        return due
+
+def partition(symbols, batch_size):
+    """Split symbols into invocation batches of at most batch_size"""
+    return [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+
+def load_registry(dynamodb=None, clock=time.time):
+    """Registry from SYMBOLS_TABLE when set (needs a boto3 DynamoDB resource), else SYMBOLS_FILE
+
+    Cached per container and reloaded once older than SYMBOLS_REFRESH_SECONDS;
+    if a reload fails the previous registry stays in use.
+    """
+    global _registry, _registry_loaded_at
+    now = clock()
+    if _registry is not None and now - _registry_loaded_at < SYMBOLS_REFRESH_SECONDS:
+        return _registry
+
+    try:
+        if SYMBOLS_TABLE and dynamodb is not None:
+            registry = SymbolRegistry.from_table(dynamodb.Table(SYMBOLS_TABLE))
+        else:
+            registry = SymbolRegistry.from_file()
+    except Exception as e:
+        if _registry is None:
+            raise
+        logger.error(f"Error reloading symbol registry, keeping the previous one: {e}")
+        registry = _registry
+    else:
+        logger.info(f"Loaded {len(registry.entries)} symbols")
+    _registry, _registry_loaded_at = registry, now
+    return _registry
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+HTTP fetch layer tests against a local HTTP server stand-in
+
+The server mimics CoinGecko's simple/price endpoint and can be told to
+answer 429 with Retry-After, fail with 503, or stall past the read timeout.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import http_fetch
+from http_fetch import HTTPFetcher, LatencyHistogram, fetch_coingecko_prices
+
+class StandInState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.client_ports = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = {}  # path -> list of statuses to return before succeeding
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        state = self.state
+        url = urlparse(self.path)
+        with state.lock:
+            state.requests += 1
+            state.client_ports.add(self.client_address[1])
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            pending = state.failures.get(url.path, [])
+            status = pending.pop(0) if pending else 200
+
+        try:
+            if url.path == '/slow':
+                time.sleep(0.5)
+                try:
+                    self._send(200, {})
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client already gave up on the read timeout
+            elif status == 429:
+                self._send(429, {'error': 'rate limited'}, {'Retry-After': '0'})
+            elif status != 200:
+                self._send(status, {'error': 'unavailable'})
+            else:
+                time.sleep(0.05)  # Make overlap between parallel chunks observable
+                ids = parse_qs(url.query)['ids'][0].split(',')
+                self._send(200, {coin_id: {'usd': float(len(coin_id))} for coin_id in ids})
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+def start_server():
+    state = StandInState()
+    handler = type('Handler', (StandInHandler,), {'state': state})
+    server = ThreadingHTTPServer(('localhost', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://localhost:{server.server_address[1]}"
+
+def test_latency_histogram():
+    """Percentiles resolve to bucket upper bounds"""
+    histogram = LatencyHistogram()
+    for ms in [1, 2, 3, 40, 40, 40, 40, 40, 40, 900]:
+        histogram.record(ms)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 10
+    assert snapshot['p50_ms'] == 50
+    assert snapshot['p99_ms'] == 1000
+
+def test_chunked_parallel_fetch_with_keepalive():
+    """Ids are chunked into parallel requests over a small pool of reused connections"""
+    server, state, base_url = start_server()
+    original_url = http_fetch.COINGECKO_PRICE_URL
+    try:
+        http_fetch.COINGECKO_PRICE_URL = f"{base_url}/simple/price"
+        fetcher = HTTPFetcher(pool_size=4)
+        coin_ids = [f"coin-{i}" for i in range(950)]
+
+        for _ in range(2):
+            prices, errors = fetch_coingecko_prices(fetcher, coin_ids, chunk_size=100, workers=4)
+
+        assert not errors
+        assert len(prices) == 950 and prices['coin-7'] == {'usd': 6.0}
+        assert state.requests == 20
+        assert state.max_in_flight > 1
+        assert len(state.client_ports) <= 4, state.client_ports
+        assert fetcher.latency.snapshot()['count'] == 20
+        print(f"✅ {state.requests} requests over {len(state.client_ports)} connections, "
+              f"max {state.max_in_flight} in flight")
+    finally:
+        http_fetch.COINGECKO_PRICE_URL = original_url
+        server.shutdown()
+
+def test_retry_on_429_and_5xx():
+    """429 (honouring Retry-After) and 503 are retried; other chunks are unaffected"""
+    server, state, base_url = start_server()
+    try:
+        state.failures['/simple/price'] = [429, 503]
+        delays = []
+        fetcher = HTTPFetcher(max_retries=3, backoff_base=0.01, sleep=delays.append)
+
+        result = fetcher.get_json(f"{base_url}/simple/price", {'ids': 'bitcoin'})
+
+        assert result == {'bitcoin': {'usd': 7.0}}
+        assert fetcher.stats == {'requests': 3, 'retries': 2, 'failures': 0}
+        assert delays[0] == 0.0  # Retry-After: 0
+
+        state.failures['/simple/price'] = [503] * 4
+        try:
+            fetcher.get_json(f"{base_url}/simple/price", {'ids': 'bitcoin'})
+            assert False, 'expected HTTPError after exhausting retries'
+        except requests.HTTPError as e:
+            assert e.response.status_code == 503
+        assert fetcher.stats['failures'] == 1
+    finally:
+        server.shutdown()
+
+def test_retry_after_header_forms():
+    """Retry-After as seconds or an HTTP date is honoured; a malformed one falls back to the backoff"""
+    fetcher = HTTPFetcher(backoff_base=0.5, backoff_max=30)
+    response = requests.Response()
+
+    response.headers['Retry-After'] = '2.5'
+    assert fetcher._retry_delay(0, response) == 2.5
+    response.headers['Retry-After'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+    assert fetcher._retry_delay(0, response) == 0.0  # In the past
+    response.headers['Retry-After'] = time.strftime('%a, %d %b %Y %H:%M:%S -0000', time.gmtime(time.time() + 3600))
+    assert fetcher._retry_delay(0, response) == 30  # Capped at backoff_max
+    for malformed in ('soon', 'Fri, 99 Foo 2024', ' '):
+        response.headers['Retry-After'] = malformed
+        assert 0 <= fetcher._retry_delay(1, response) <= 1.0
+
+def test_read_timeout():
+    """A stalled response fails after the read timeout instead of hanging"""
+    server, state, base_url = start_server()
+    try:
+        fetcher = HTTPFetcher(read_timeout=0.1, max_retries=1, backoff_base=0.01)
+        start = time.perf_counter()
+        try:
+            fetcher.get_json(f"{base_url}/slow")
+            assert False, 'expected a timeout'
+        except requests.Timeout:
+            pass
+        assert time.perf_counter() - start < 0.5 * 2
+        assert fetcher.stats['requests'] == 2 and fetcher.stats['failures'] == 1
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_latency_histogram()
+    test_chunked_parallel_fetch_with_keepalive()
+    test_retry_on_429_and_5xx()
+    test_retry_after_header_forms()
+    test_read_timeout()
+    print("🎉 HTTP fetch tests passed")
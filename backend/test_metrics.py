@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Metrics tests against a list sink
+
+Documents are checked for the CloudWatch Embedded Metric Format shape:
+every metric named under _aws.CloudWatchMetrics is a top-level key, and
+every dimension is a top-level string.
+"""
+
+import json
+import threading
+
+from metrics import EMF_MAX_VALUES, Metrics
+
+def emf_metric_names(doc):
+    """Metric names declared by an EMF document, after checking its structure"""
+    directive = doc['_aws']['CloudWatchMetrics'][0]
+    for dimension_set in directive['Dimensions']:
+        for dimension in dimension_set:
+            assert isinstance(doc[dimension], str)
+    names = [metric['Name'] for metric in directive['Metrics']]
+    for name in names:
+        assert name in doc
+    json.dumps(doc)  # Must serialize as one log line
+    return names
+
+def test_counters_timers_and_histograms():
+    """Counters sum, timers and histograms become Values/Counts"""
+    docs = []
+    metrics = Metrics(sink=docs.append, dimensions={'Function': 'test'})
+    metrics.increment('items_stored')
+    metrics.increment('items_stored', 4)
+    with metrics.timer('write_ms'):
+        pass
+    for value in [12, 12, 12.4, 250]:
+        metrics.record('fetch_ms', value)
+    metrics.flush()
+
+    assert len(docs) == 1
+    doc = docs[0]
+    assert sorted(emf_metric_names(doc)) == ['fetch_ms', 'items_stored', 'write_ms']
+    assert doc['items_stored'] == 5
+    assert doc['fetch_ms'] == {'Values': [12.0, 250.0], 'Counts': [3.0, 1.0]}
+    assert sum(doc['write_ms']['Counts']) == 1
+    assert doc['Function'] == 'test'
+
+    # Flushing resets; nothing recorded means nothing emitted
+    assert metrics.flush() == []
+    assert len(docs) == 1
+
+def test_sampling_weights_counts():
+    """Unsampled calls skip timing; sampled ones count 1/rate"""
+    draws = iter([0.5, 0.05, 0.5, 0.5, 0.01] * 20)
+    metrics = Metrics(sink=lambda doc: None, dimensions={}, rng=lambda: next(draws))
+    timed = 0
+    for _ in range(100):
+        with metrics.timer('payload_ms', sample_rate=0.1):
+            timed += 1
+    doc = metrics.flush()[0]
+    assert timed == 100
+    assert sum(doc['payload_ms']['Counts']) == 40 * 10
+
+def test_long_histograms_span_documents():
+    """No metric carries more than 100 values in one document; counters go in the first"""
+    docs = []
+    metrics = Metrics(sink=docs.append, dimensions={'Function': 'test'})
+    metrics.increment('runs')
+    for value in range(1, 10_000, 37):
+        metrics.record('latency_ms', value)
+    metrics.flush()
+
+    assert len(docs) > 1
+    assert all(len(doc['latency_ms']['Values']) <= EMF_MAX_VALUES for doc in docs)
+    assert docs[0]['runs'] == 1 and all('runs' not in doc for doc in docs[1:])
+    for doc in docs:
+        emf_metric_names(doc)
+
+def test_instrumented_handler():
+    """instrument times the handler, counts 5xx responses and exceptions, and flushes"""
+    docs = []
+    metrics = Metrics(sink=docs.append, dimensions={})
+
+    @metrics.instrument('api')
+    def handler(event, context):
+        if event.get('raise'):
+            raise ValueError('boom')
+        metrics.set_dimension('Route', event['route'])
+        return {'statusCode': event['status']}
+
+    handler({'route': 'GET /predictions', 'status': 200}, None)
+    handler({'route': 'GET /patterns', 'status': 503}, None)
+    try:
+        handler({'raise': True}, None)
+        assert False, 'expected the handler exception to propagate'
+    except ValueError:
+        pass
+
+    assert [doc['api_errors'] for doc in docs] == [0, 1, 1]
+    assert docs[0]['Route'] == 'GET /predictions' and docs[1]['Route'] == 'GET /patterns'
+    assert 'Route' not in docs[2]  # Dimensions reset after each flush
+    assert all(sum(doc['api_ms']['Counts']) == 1 for doc in docs)
+
+def test_thread_safety():
+    """Concurrent increments from pipeline threads are not lost"""
+    metrics = Metrics(sink=lambda doc: None, dimensions={})
+
+    def work():
+        for _ in range(1000):
+            metrics.increment('stages')
+            metrics.record('stage_ms', 3)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    doc = metrics.flush()[0]
+    assert doc['stages'] == 8000
+    assert doc['stage_ms'] == {'Values': [3.0], 'Counts': [8000.0]}
+
+if __name__ == "__main__":
+    test_counters_timers_and_histograms()
+    test_sampling_weights_counts()
+    test_long_histograms_span_documents()
+    test_instrumented_handler()
+    test_thread_safety()
+    print("🎉 Metrics tests passed")
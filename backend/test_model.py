@@ -11,6 +11,9 @@ import numpy as np
 import os
 from PIL import Image
 
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
 # Pattern class mapping (same as training)
 PATTERN_CLASSES = {
     0: 'head_and_shoulders',
@@ -35,7 +38,9 @@ def test_onnx_model():
         return False
     
     # Check if model file exists
-    model_path = "/Users/bryannakache/portfolio/cryptoIA-1/backend/models/crypto_pattern_model_v14.onnx"
+    model_path = os.environ.get(
+        'MODEL_PATH', os.path.join(BACKEND_DIR, 'models', 'crypto_pattern_model_v14.onnx')
+    )
     # Note: Model files are 327MB each and excluded from git (see .gitignore)
     # Download from: Google Colab training session or regenerate using training/train_vision_transformer.py
     if not os.path.exists(model_path):
@@ -75,16 +80,8 @@ def test_onnx_model():
         print(f"📊 Confidence: {confidence:.3f}")
         print(f"📊 All predictions: {predictions}")
         
-        # Test multiple inputs (one at a time since model expects batch size 1)
-        print("\n🔄 Testing batch inference...")
-        try:
-            for i in range(3):
-                single_input = np.random.randn(1, 3, 224, 224).astype(np.float32)
-                batch_output = ort_session.run(None, {input_info.name: single_input})
-                print(f"  ✅ Sample {i+1} inference: {batch_output[0].shape}")
-            print("✅ Sequential batch inference successful")
-        except Exception as e:
-            print(f"❌ Batch inference error: {e}")
+        # Latency and throughput are measured by benchmark_model.py
+        print(f"\n⏱️  For latency/throughput run: python benchmark_model.py {model_path}")
         
         return True
         
@@ -110,10 +107,10 @@ def check_training_files():
     print("\n📁 Training Files Check:")
     
     files_to_check = [
-        "/Users/bryannakache/portfolio/cryptoIA-1/training/train_vision_transformer.py",
-        "/Users/bryannakache/portfolio/cryptoIA-1/training/CryptoAI_Vision_Training.ipynb",
-        "/Users/bryannakache/portfolio/cryptoIA-1/training/requirements.txt",
-        "/Users/bryannakache/portfolio/cryptoIA-1/training/README.md"
+        os.path.join(REPO_DIR, "training", "train_vision_transformer.py"),
+        os.path.join(REPO_DIR, "training", "CryptoAI_Vision_Training.ipynb"),
+        os.path.join(REPO_DIR, "training", "requirements.txt"),
+        os.path.join(REPO_DIR, "training", "README.md")
     ]
     
     all_present = True
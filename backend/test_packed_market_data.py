@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Packed market data write tests against the in-memory table
+
+local_aws.InMemoryTable evaluates the version conditions, so concurrent
+writers conflict and retry the same way they do against DynamoDB.
+"""
+
+import threading
+
+import numpy as np
+
+from backfill import BackfillCheckpoint, ParallelBatchWriter, SyntheticSource, backfill_symbol
+from local_aws import InMemoryDynamoDB
+from packed_market_data import (BUCKET_SECONDS, PACKED_TTL_DAYS, LiveBucketWriter, bucket_start, read_range,
+                                write_bucket, write_candles)
+
+HOUR = 1_700_002_800  # A bucket start
+
+def candles(start, count, close=100.0):
+    """count consecutive 1m candles from start, all closing at close"""
+    timestamps = start + np.arange(count, dtype=np.int64) * 60
+    values = np.full(count, close)
+    return {'timestamp': timestamps, 'open': values, 'high': values, 'low': values,
+            'close': values, 'volume': values, 'trades': np.ones(count, dtype=np.int64)}
+
+def market_table():
+    return InMemoryDynamoDB().Table('market_data')
+
+def test_concurrent_writers_keep_every_candle():
+    """Writers racing on one bucket retry on the version check instead of dropping candles"""
+    table = market_table()
+    barrier = threading.Barrier(6)
+
+    def write(minute):
+        barrier.wait()
+        write_candles(table, 'BTCUSDT', candles(HOUR + minute * 60, 1))
+
+    threads = [threading.Thread(target=write, args=(minute,)) for minute in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stored = read_range(table, 'BTCUSDT', HOUR, HOUR + BUCKET_SECONDS - 1)
+    assert stored['timestamp'].tolist() == [HOUR + minute * 60 for minute in range(6)]
+
+def test_stale_version_rereads():
+    """A write based on an outdated version merges with what another writer stored"""
+    table = market_table()
+    known = write_bucket(table, 'BTCUSDT', HOUR, candles(HOUR, 2))
+    write_bucket(table, 'BTCUSDT', HOUR, candles(HOUR + 120, 1))
+    version, merged = write_bucket(table, 'BTCUSDT', HOUR, candles(HOUR + 180, 1), known)
+    assert version == 3
+    assert len(merged['timestamp']) == 4
+    assert len(read_range(table, 'BTCUSDT', HOUR, HOUR + BUCKET_SECONDS - 1)['timestamp']) == 4
+
+def test_live_writer_flushes_closed_hours_once():
+    """Candles wait in memory until their hour ends: one put per symbol-hour"""
+    table = market_table()
+    now = [HOUR]
+    writer = LiveBucketWriter(table, flush_seconds=0, clock=lambda: now[0])
+    for minute in range(60):
+        now[0] = HOUR + (minute + 1) * 60
+        for symbol in ('BTCUSDT', 'ETHUSDT'):
+            writer.add(symbol, candles(HOUR + minute * 60, 1))
+        assert writer.flush_due() == (2 if minute == 59 else 0)
+
+    assert table.request_count == 2
+    writer.add('BTCUSDT', candles(HOUR + BUCKET_SECONDS, 1))
+    assert writer.flush() == 1
+    assert len(read_range(table, 'BTCUSDT', HOUR, HOUR + 2 * BUCKET_SECONDS)['timestamp']) == 61
+
+def test_live_writer_flushes_open_hour_periodically():
+    """The open hour is written every flush_seconds, reusing the version it wrote last"""
+    table = market_table()
+    now = [HOUR]
+    writer = LiveBucketWriter(table, flush_seconds=300, clock=lambda: now[0])
+    for minute in range(12):
+        now[0] = HOUR + (minute + 1) * 60
+        writer.add('BTCUSDT', candles(HOUR + minute * 60, 1))
+        writer.flush_due()
+
+    assert writer.stats['puts'] == 2 and table.request_count == 2  # At 5 and 10 minutes, no reads
+    stored = read_range(table, 'BTCUSDT', HOUR, HOUR + BUCKET_SECONDS - 1)
+    assert len(stored['timestamp']) == 10
+
+def test_backfill_merges_open_hour():
+    """Backfill replaces complete hours but merges into the hour the stream is still writing"""
+    table = market_table()
+    source = SyntheticSource(180)
+    first = int(next(source.iter_chunks('BTCUSDT'))['timestamp'][0])
+    # The source's last 26 minutes fall into the open hour
+    open_hour = bucket_start(first) + 3 * BUCKET_SECONDS
+    # The stream already stored a minute of the open hour that the source lacks
+    live = candles(open_hour + BUCKET_SECONDS - 60, 1, close=1.0)
+    write_candles(table, 'BTCUSDT', live)
+
+    writer = ParallelBatchWriter(lambda: table, 2)
+    try:
+        written = backfill_symbol(source, 'BTCUSDT', writer, BackfillCheckpoint(None),
+                                  layout='packed', now=open_hour + 30 * 60)
+    finally:
+        writer.close()
+
+    assert written == 180
+    stored = read_range(table, 'BTCUSDT', bucket_start(first), open_hour + BUCKET_SECONDS)
+    assert len(stored['timestamp']) == 181
+    assert stored['close'][-1] == 1.0
+
+def test_backfill_keeps_history_without_ttl():
+    """Without --ttl-days packed backfill items carry no ttl, like rows; live writes still expire"""
+    table = market_table()
+    writer = ParallelBatchWriter(lambda: table, 2)
+    try:
+        backfill_symbol(SyntheticSource(180), 'BTCUSDT', writer, BackfillCheckpoint(None), layout='packed')
+        backfill_symbol(SyntheticSource(180), 'ETHUSDT', writer, BackfillCheckpoint(None), ttl=1_900_000_000,
+                        layout='packed')
+    finally:
+        writer.close()
+
+    items = list(table.items.values())
+    assert all('ttl' not in item for item in items if item['symbol'] == 'BTCUSDT#packed')
+    assert all(item['ttl'] == 1_900_000_000 for item in items if item['symbol'] == 'ETHUSDT#packed')
+
+    write_candles(table, 'SOLUSDT', candles(HOUR, 1))
+    live = table.get_item(Key={'symbol': 'SOLUSDT#packed', 'timestamp': HOUR})['Item']
+    assert live['ttl'] == HOUR + BUCKET_SECONDS + PACKED_TTL_DAYS * 86400
+
+if __name__ == "__main__":
+    test_concurrent_writers_keep_every_candle()
+    test_stale_version_rereads()
+    test_live_writer_flushes_closed_hours_once()
+    test_live_writer_flushes_open_hour_periodically()
+    test_backfill_merges_open_hour()
+    test_backfill_keeps_history_without_ttl()
+    print("🎉 Packed market data tests passed")
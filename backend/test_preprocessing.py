@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Preprocessing tests on rendered charts
+
+The fused float32 path is checked against the plain ImageNet formula in
+float64; the model only ever sees float32 batches.
+"""
+
+import threading
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import IMAGE_SIZE, batch_buffer, preprocess_image, preprocess_images, _sample_charts
+
+def reference(image):
+    """(pixel / 255 - mean) / std in float64, 1 x 3 x 224 x 224"""
+    pixels = np.asarray(image.convert('RGB').resize((IMAGE_SIZE, IMAGE_SIZE), Image.Resampling.LANCZOS), dtype=np.float64)
+    normalized = (pixels / 255 - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]
+    return normalized.transpose(2, 0, 1)[np.newaxis]
+
+def test_matches_imagenet_normalization():
+    """Batches are float32 NCHW and match the float64 formula to float32 precision"""
+    charts = _sample_charts(3)
+    batch = preprocess_images(charts)
+    assert batch.dtype == np.float32 and batch.shape == (3, 3, IMAGE_SIZE, IMAGE_SIZE)
+    assert batch.flags.c_contiguous
+    for i, chart in enumerate(charts):
+        assert np.abs(batch[i:i + 1] - reference(chart)).max() < 1e-5
+
+def test_accepts_arrays_and_other_sizes():
+    """uint8 and 0-1 float arrays give the same result; other sizes are resized"""
+    chart = _sample_charts(1)[0]
+    pixels = np.asarray(chart)
+    from_image = preprocess_image(chart)
+    assert np.array_equal(preprocess_image(pixels), from_image)
+    assert np.array_equal(preprocess_image(pixels / 255.0), from_image)
+
+    large = chart.resize((448, 448))
+    assert preprocess_image(large).shape == (1, 3, IMAGE_SIZE, IMAGE_SIZE)
+    assert np.abs(preprocess_image(large) - reference(large)).max() < 1e-5
+
+def test_buffer_is_reused_per_thread():
+    """batch_buffer hands back the same memory on a thread and separate memory across threads"""
+    charts = _sample_charts(4)
+    first = preprocess_images(charts, out=batch_buffer(4))
+    second = preprocess_images(charts[:2], out=batch_buffer(2))
+    assert np.shares_memory(first, second)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(batch_buffer(2)))
+    thread.start()
+    thread.join()
+    assert not np.shares_memory(other[0], second)
+
+def test_rejects_wrong_dtype():
+    """A float64 output buffer fails loudly instead of upcasting the model input"""
+    try:
+        preprocess_images(_sample_charts(1), out=np.empty((1, 3, IMAGE_SIZE, IMAGE_SIZE)))
+        assert False, 'expected a TypeError'
+    except TypeError as e:
+        assert 'float32' in str(e)
+
+def test_rejects_wrong_shape():
+    """An output buffer sized for another batch is refused, even under python -O"""
+    try:
+        preprocess_images(_sample_charts(2), out=batch_buffer(3))
+        assert False, 'expected a ValueError'
+    except ValueError as e:
+        assert '2 x 3' in str(e)
+
+if __name__ == "__main__":
+    test_matches_imagenet_normalization()
+    test_accepts_arrays_and_other_sizes()
+    test_buffer_is_reused_per_thread()
+    test_rejects_wrong_dtype()
+    test_rejects_wrong_shape()
+    print("🎉 Preprocessing tests passed")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Profiling hook tests writing to a temporary directory
+
+A handler runs a CPU-bound pipeline stage so the sampling profiler has
+something to find on a pool thread.
+"""
+
+import json
+import os
+import pstats
+import tempfile
+
+import profiling
+from pipeline import Pipeline
+from profiling import library_of, profiled, requested_mode
+
+def busy(**kwargs):
+    total = 0
+    for i in range(2_000_000):
+        total += i * i
+    return total
+
+def make_handler(output):
+    calls = []
+
+    @profiled('test', output=output)
+    def handler(event, context):
+        calls.append(event)
+        result = Pipeline().stage('busy', busy).run()
+        return {'statusCode': 200, 'body': json.dumps({'result': result['busy']})}
+
+    return handler, calls
+
+def test_requested_mode():
+    """The event flag wins over the env default; unknown modes are off"""
+    assert requested_mode({'profile': True}) == 'sampling'
+    assert requested_mode({'profile': 'cprofile'}) == 'cprofile'
+    assert requested_mode({'profile': 'flamegraph'}) is None
+    assert requested_mode({}) is None
+    assert library_of('/usr/lib/python3/site-packages/matplotlib/lines.py') == 'matplotlib'
+    assert library_of('~') == 'builtins'
+
+def test_disabled_profiling_passes_through():
+    """Without the flag the response is untouched and nothing is written"""
+    with tempfile.TemporaryDirectory() as output:
+        handler, _ = make_handler(output)
+        response = handler({}, None)
+        assert 'profile' not in json.loads(response['body'])
+        assert os.listdir(output) == []
+
+def test_sampling_profile_sees_pool_threads():
+    """Collapsed stacks are written and the pipeline stage is the top hotspot"""
+    with tempfile.TemporaryDirectory() as output:
+        handler, _ = make_handler(output)
+        body = json.loads(handler({'profile': True}, None)['body'])
+        profile = body['profile']
+
+        assert body['result'] > 0
+        assert profile['mode'] == 'sampling' and profile['samples'] > 0
+        assert profile['functions'][0]['function'].endswith(f":busy:{busy.__code__.co_firstlineno}")
+        assert profile['output'].endswith('.collapsed') and os.path.dirname(profile['output']).endswith('test')
+        with open(profile['output']) as f:
+            line = f.readline()
+        stack, count = line.rsplit(' ', 1)
+        assert 'pipeline:_timed' in stack and int(count) > 0
+        print(f"✅ {profile['samples']} samples, top {profile['functions'][0]}")
+
+def test_cprofile_writes_pstats():
+    """cProfile output loads with pstats; nested profiled calls don't restart the profiler"""
+    with tempfile.TemporaryDirectory() as output:
+        handler, calls = make_handler(output)
+
+        @profiled('outer', output=output)
+        def batch(event, context):
+            return handler(event, context)
+
+        body = json.loads(batch({'profile': 'cprofile'}, None)['body'])
+        profile = body['profile']
+        assert len(calls) == 1 and not profiling._active
+        assert profile['mode'] == 'cprofile' and profile['functions']
+        assert os.listdir(output) == ['outer']
+        assert pstats.Stats(profile['output']).total_calls > 0
+
+if __name__ == "__main__":
+    test_requested_mode()
+    test_disabled_profiling_passes_through()
+    test_sampling_profile_sees_pool_threads()
+    test_cprofile_writes_pstats()
+    print("🎉 Profiling tests passed")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Single-flight registry tests with a fake clock
+
+The DynamoDB registry runs against local_aws.InMemoryTable, which
+evaluates the conditional writes, so marker expiry and run_id checks go
+through the same expressions as in production.
+"""
+
+import os
+
+for _name in ('PATTERN_CACHE_TABLE', 'MARKET_DATA_TABLE', 'PREDICTIONS_TABLE'):
+    os.environ.setdefault(_name, f"test-{_name.lower()}")
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from local_aws import InMemoryDynamoDB, InMemoryLambda
+from request_coalescing import DynamoDBInFlightRegistry, LocalInFlightRegistry
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def registries(clock):
+    """Both implementations over the same 60 second window"""
+    table = InMemoryDynamoDB(key_schemas={'inflight': ('symbol', None)}).Table('inflight')
+    return [LocalInFlightRegistry(60, clock=clock), DynamoDBInFlightRegistry(table, 60, clock=clock)]
+
+def test_acquire_and_coalesce():
+    """The first request starts a run; requests inside the window attach to it"""
+    clock = FakeClock()
+    for registry in registries(clock):
+        run_id, coalesced = registry.acquire('BTCUSDT')
+        assert not coalesced
+        clock.now += 30
+        assert registry.acquire('BTCUSDT') == (run_id, True)
+        assert registry.acquire('BTCUSDT') == (run_id, True)
+        # Other symbols are independent
+        other, coalesced = registry.acquire('ETHUSDT')
+        assert other != run_id and not coalesced
+        assert registry.stats == {'started': 2, 'coalesced': 2}
+
+def test_dynamodb_marker_counts_coalesced_requests():
+    """Coalesced requests are counted on the marker item itself"""
+    clock = FakeClock()
+    _, registry = registries(clock)
+    run_id, _ = registry.acquire('BTCUSDT')
+    registry.acquire('BTCUSDT')
+    registry.acquire('BTCUSDT')
+    marker = registry.table.get_item(Key={'symbol': 'BTCUSDT'})['Item']
+    assert marker['run_id'] == run_id and marker['coalesced_count'] == 2
+    assert marker['expires_at'] == clock.now + 60
+
+def test_expired_marker_starts_new_run():
+    """Once the window has passed, the next request starts a fresh run"""
+    clock = FakeClock()
+    for registry in registries(clock):
+        first, _ = registry.acquire('BTCUSDT')
+        clock.now += 60
+        assert registry.acquire('BTCUSDT') == (first, True)  # Window is inclusive
+        clock.now += 1
+        second, coalesced = registry.acquire('BTCUSDT')
+        assert second != first and not coalesced
+
+def test_release_only_removes_own_marker():
+    """release frees the symbol for its own run_id and ignores stale ones"""
+    clock = FakeClock()
+    for registry in registries(clock):
+        first, _ = registry.acquire('BTCUSDT')
+        registry.release('BTCUSDT', 'some-other-run')
+        assert registry.acquire('BTCUSDT') == (first, True)
+
+        registry.release('BTCUSDT', first)
+        second, coalesced = registry.acquire('BTCUSDT')
+        assert second != first and not coalesced
+
+def test_release_on_invoke_failure():
+    """A failed Lambda invoke releases the marker so the next request starts a new run"""
+    import api_handler
+
+    clock = FakeClock()
+    for registry in registries(clock):
+        handler = api_handler.APIHandler()
+        handler.inflight_registry = registry
+        api_handler.lambda_client = InMemoryLambda({})  # No analysis function: invoke raises
+        try:
+            result = handler.create_prediction_request('BTCUSDT')
+            assert 'error' in result
+
+            analysis_calls = []
+            function_name = f"cryptoai-analytics-pattern-analysis-{api_handler.ENVIRONMENT}"
+            api_handler.lambda_client = InMemoryLambda({function_name: lambda event, context: analysis_calls.append(event)})
+            result = handler.create_prediction_request('BTCUSDT')
+            assert result['coalesced'] is False, result
+            api_handler.lambda_client.drain()
+            assert analysis_calls == [{'symbol': 'BTCUSDT', 'run_id': result['request_id']}]
+
+            assert handler.create_prediction_request('BTCUSDT')['coalesced'] is True
+        finally:
+            api_handler.lambda_client = None
+
+if __name__ == "__main__":
+    test_acquire_and_coalesce()
+    test_dynamodb_marker_counts_coalesced_requests()
+    test_expired_marker_starts_new_run()
+    test_release_only_removes_own_marker()
+    test_release_on_invoke_failure()
+    print("🎉 Request coalescing tests passed")
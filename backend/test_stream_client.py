@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Combined-stream client tests against a local WebSocket server stand-in
+
+The server plays Binance: it parses the combined-stream URL, sends one
+closed 1m kline per subscribed symbol, skips three candles for one symbol
+and drops every connection once so the client has to reconnect.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+from stream_client import CombinedStreamClient, KlineGapDetector, shard_streams
+
+SYMBOLS = [f"SYM{i}USDT" for i in range(7)]
+BASE_OPEN_TIME = 1_700_000_040  # Aligned to a minute
+
+def kline_message(stream, symbol, open_time):
+    return json.dumps({
+        'stream': stream,
+        'data': {
+            'e': 'kline',
+            's': symbol,
+            'k': {'s': symbol, 't': open_time * 1000, 'o': '1', 'h': '2', 'l': '0.5', 'c': '1.5',
+                  'v': '10', 'n': 3, 'x': True}
+        }
+    })
+
+class LocalStreamServer:
+    """Minimal Binance combined-stream stand-in"""
+
+    def __init__(self):
+        self.connections = 0
+        self.paths = []
+
+    async def handler(self, ws, path=None):
+        path = path or (ws.request.path if hasattr(ws, 'request') else ws.path)
+        self.paths.append(path)
+        self.connections += 1
+        first_connection = self.connections <= 3
+        streams = parse_qs(urlparse(path).query)['streams'][0].split('/')
+
+        # First connection: candles 0-1; after reconnecting: candle 2 for all
+        # symbols except SYM0USDT, which jumps to candle 5 (3 missing)
+        minutes = [0, 1] if first_connection else [2]
+        for minute in minutes:
+            for stream in streams:
+                symbol = stream.split('@')[0].upper()
+                offset = 5 if (symbol == 'SYM0USDT' and not first_connection) else minute
+                await ws.send(kline_message(stream, symbol, BASE_OPEN_TIME + offset * 60))
+
+        if first_connection:
+            await ws.close()  # Drop the connection to force a reconnect
+        else:
+            await ws.wait_closed()  # Stay open until the client stops
+
+async def run_client_against_server():
+    server_state = LocalStreamServer()
+    server = await websockets.serve(server_state.handler, 'localhost', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    received = []
+    gaps = []
+    client = CombinedStreamClient(
+        SYMBOLS, received.append, on_gap=lambda *gap: gaps.append(gap),
+        base_url=f"ws://localhost:{port}", per_connection=3, base_delay=0.01, max_delay=0.05
+    )
+
+    task = asyncio.create_task(client.run())
+    for _ in range(200):
+        if len(received) >= len(SYMBOLS) * 3:
+            break
+        await asyncio.sleep(0.02)
+    await client.stop()
+    await asyncio.wait_for(task, timeout=5)
+
+    server.close()
+    await server.wait_closed()
+    return server_state, client, received, gaps
+
+def test_shard_streams():
+    """Streams are split into connections of at most per_connection"""
+    shards = shard_streams([f"s{i}" for i in range(450)], per_connection=200)
+    assert [len(s) for s in shards] == [200, 200, 50]
+
+def test_gap_detector():
+    """Missing candles are reported as an inclusive range; duplicates are ignored"""
+    detector = KlineGapDetector(interval_seconds=60)
+    assert detector.observe('BTCUSDT', 600) is None
+    assert detector.observe('BTCUSDT', 660) is None
+    assert detector.observe('BTCUSDT', 660) is None
+    assert detector.observe('BTCUSDT', 900) == (720, 840)
+
+def test_stream_client_reconnect_and_gaps():
+    """Sharded connections, reconnect after drops, and gap callbacks from a local server"""
+    server, client, received, gaps = asyncio.run(run_client_against_server())
+
+    assert len(shard_streams(SYMBOLS, 3)) == 3
+    assert all('/stream?streams=' in path for path in server.paths)
+    assert client.stats['reconnects'] >= 3, client.stats
+    assert len(received) == len(SYMBOLS) * 3, len(received)
+    assert gaps == [('SYM0USDT', BASE_OPEN_TIME + 120, BASE_OPEN_TIME + 240)], gaps
+    print(f"✅ {client.stats['connects']} connections, {client.stats['reconnects']} reconnects, "
+          f"{len(received)} messages, gaps: {gaps}")
+
+if __name__ == "__main__":
+    test_shard_streams()
+    test_gap_detector()
+    test_stream_client_reconnect_and_gaps()
+    print("🎉 Stream client tests passed")
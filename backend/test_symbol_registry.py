@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Symbol registry and scheduler fan-out tests
+
+Scheduling is a pure function of the registry and the tick time, so an
+hour of scheduler ticks is simulated directly; the scheduler Lambda
+invokes an InMemoryLambda.
+"""
+
+import json
+import os
+from collections import Counter
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import symbol_registry
+from local_aws import InMemoryDynamoDB, InMemoryLambda
+from symbol_registry import SCHEDULER_TICK_SECONDS, SymbolRegistry, load_registry, partition
+
+HOUR_START = 1_700_002_800  # On an hour boundary
+
+def hour_of_ticks(start=HOUR_START):
+    return range(start, start + 3600, SCHEDULER_TICK_SECONDS)
+
+def due_ticks(registry, job, ticks):
+    """symbol -> ticks at which job was due"""
+    runs = {symbol: [] for symbol in registry.symbols()}
+    for now in ticks:
+        for symbol in registry.due(job, now):
+            runs[symbol].append(now)
+    return runs
+
+def test_due_once_per_cadence_window():
+    """Every symbol runs exactly 3600 / cadence times an hour, evenly spaced"""
+    registry = SymbolRegistry.from_file()
+    for job in ('ingestion', 'analysis'):
+        for symbol, ticks in due_ticks(registry, job, hour_of_ticks()).items():
+            cadence = registry.cadence(symbol, job)
+            assert len(ticks) == 3600 // cadence, (symbol, job, ticks)
+            assert all(b - a == cadence for a, b in zip(ticks, ticks[1:])), (symbol, job, ticks)
+
+def test_cadence_not_a_multiple_of_the_tick():
+    """A 90s or 150s cadence runs once in each cadence-long window, never twice"""
+    for cadence in (90, 150, 420):
+        registry = SymbolRegistry([{'symbol': 'ODDUSDT', 'tier': 'cold', 'cadence': {'ingestion': cadence}}])
+        ticks = due_ticks(registry, 'ingestion', hour_of_ticks())['ODDUSDT']
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        assert all(cadence - SCHEDULER_TICK_SECONDS < gap < cadence + SCHEDULER_TICK_SECONDS for gap in gaps), \
+            (cadence, gaps)
+        assert abs(len(ticks) - 3600 / cadence) <= 1
+
+def test_tier_overrides_and_disabled_symbols():
+    """Per-symbol cadence overrides the tier default; disabled symbols are never scheduled"""
+    registry = SymbolRegistry([
+        {'symbol': 'AAAUSDT', 'tier': 'hot', 'cadence': {'analysis': 600}},
+        {'symbol': 'BBBUSDT', 'tier': 'warm', 'enabled': False},
+        {'symbol': 'CCCUSDT'},
+    ])
+    assert registry.cadence('AAAUSDT', 'analysis') == 600
+    assert registry.cadence('AAAUSDT', 'ingestion') == 60
+    assert registry.get('CCCUSDT')['tier'] == 'cold'
+    assert registry.symbols() == ['AAAUSDT', 'CCCUSDT']
+    assert len(due_ticks(registry, 'analysis', hour_of_ticks())['AAAUSDT']) == 6
+
+    try:
+        SymbolRegistry([{'symbol': 'DDDUSDT', 'tier': 'lukewarm'}])
+        assert False, 'expected a ValueError for an unknown tier'
+    except ValueError:
+        pass
+
+def test_cold_symbols_spread_across_minutes():
+    """Hourly symbols land in different minutes instead of all at minute 0"""
+    registry = SymbolRegistry([{'symbol': f"C{i:03d}USDT", 'tier': 'cold'} for i in range(120)])
+    runs = due_ticks(registry, 'ingestion', hour_of_ticks())
+    minutes = Counter((ticks[0] - HOUR_START) // 60 for ticks in runs.values())
+    assert len(minutes) >= 40, minutes
+    assert max(minutes.values()) <= 8, minutes
+
+def test_partition_respects_batch_size():
+    symbols = [f"S{i}" for i in range(23)]
+    batches = partition(symbols, 10)
+    assert [len(batch) for batch in batches] == [10, 10, 3]
+    assert sum(batches, []) == symbols
+    assert partition([], 10) == []
+
+def test_scheduler_fans_out_due_symbols_in_batches():
+    """One tick invokes each job once per batch with every due symbol exactly once"""
+    import scheduler
+
+    invocations = []
+    functions = {
+        name: (lambda event, context, name=name: invocations.append((name, event)))
+        for name in (scheduler.INGESTION_FUNCTION, scheduler.ANALYSIS_FUNCTION)
+    }
+    original_client, original_jobs = scheduler.lambda_client, scheduler.JOBS
+    scheduler.lambda_client = InMemoryLambda(functions)
+    scheduler.JOBS = {'ingestion': (scheduler.INGESTION_FUNCTION, 3),
+                      'analysis': (scheduler.ANALYSIS_FUNCTION, 2)}
+    try:
+        response = scheduler.lambda_handler({'time': '2023-11-14T23:00:20Z'}, None)
+        scheduler.lambda_client.drain()
+    finally:
+        scheduler.lambda_client, scheduler.JOBS = original_client, original_jobs
+
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200 and body['tick'] == HOUR_START
+    registry = load_registry()
+    for job, (function_name, batch_size) in [('ingestion', (scheduler.INGESTION_FUNCTION, 3)),
+                                             ('analysis', (scheduler.ANALYSIS_FUNCTION, 2))]:
+        events = [event for name, event in invocations if name == function_name]
+        scheduled = [symbol for event in events for symbol in event['symbols']]
+        assert sorted(scheduled) == sorted(registry.due(job, HOUR_START))
+        assert all(len(event['symbols']) <= batch_size and event['scheduled_at'] == HOUR_START for event in events)
+        assert body['jobs'][job] == {'symbols': len(scheduled), 'invocations': len(events)}
+
+def test_table_registry_refreshes():
+    """Changes in SYMBOLS_TABLE show up once the cached registry is SYMBOLS_REFRESH_SECONDS old"""
+    db = InMemoryDynamoDB(key_schemas={'symbols': ('symbol', None)})
+    table = db.Table('symbols')
+    table.put_item(Item={'symbol': 'BTCUSDT', 'coingecko_id': 'bitcoin', 'tier': 'hot'})
+    original = (symbol_registry.SYMBOLS_TABLE, symbol_registry._registry, symbol_registry._registry_loaded_at)
+    symbol_registry.SYMBOLS_TABLE, symbol_registry._registry = 'symbols', None
+    now = [HOUR_START]
+    try:
+        assert load_registry(db, clock=lambda: now[0]).symbols() == ['BTCUSDT']
+        table.put_item(Item={'symbol': 'ETHUSDT', 'coingecko_id': 'ethereum', 'tier': 'hot'})
+        now[0] += symbol_registry.SYMBOLS_REFRESH_SECONDS - 1
+        assert load_registry(db, clock=lambda: now[0]).symbols() == ['BTCUSDT']
+        now[0] += 1
+        assert load_registry(db, clock=lambda: now[0]).symbols() == ['BTCUSDT', 'ETHUSDT']
+    finally:
+        symbol_registry.SYMBOLS_TABLE, symbol_registry._registry, symbol_registry._registry_loaded_at = original
+
+if __name__ == "__main__":
+    test_due_once_per_cadence_window()
+    test_cadence_not_a_multiple_of_the_tick()
+    test_tier_overrides_and_disabled_symbols()
+    test_cold_symbols_spread_across_minutes()
+    test_partition_respects_batch_size()
+    test_scheduler_fans_out_due_symbols_in_batches()
+    test_table_registry_refreshes()
+    print("🎉 Symbol registry tests passed")
@@ -82,4 +82,23 @@ resource "aws_dynamodb_table" "predictions" {
   }
 
   tags = local.common_tags
-}
\ No newline at end of file
+}
+
+# DynamoDB table for in-flight analysis markers (request coalescing)
+resource "aws_dynamodb_table" "analysis_inflight" {
+  name         = "${var.project_name}-analysis-inflight-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "symbol"
+
+  attribute {
+    name = "symbol"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = local.common_tags
+}
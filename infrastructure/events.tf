@@ -1,23 +1,47 @@
-# CloudWatch Events rule for data ingestion
-resource "aws_cloudwatch_event_rule" "data_ingestion_schedule" {
-  name                = "${var.project_name}-data-ingestion-schedule-${var.environment}"
-  description         = "Trigger data ingestion Lambda every 5 minutes"
-  schedule_expression = "rate(5 minutes)"
+# CloudWatch Events rule for the symbol scheduler
+# Runs every minute; per-symbol cadence (symbols.json tiers) decides which
+# symbols are ingested and analyzed on each tick
+resource "aws_cloudwatch_event_rule" "scheduler_tick" {
+  name                = "${var.project_name}-scheduler-tick-${var.environment}"
+  description         = "Trigger the symbol scheduler Lambda every minute"
+  schedule_expression = "rate(1 minute)"
   tags                = local.common_tags
 }
 
-# CloudWatch Events target for data ingestion Lambda
-resource "aws_cloudwatch_event_target" "data_ingestion_target" {
-  rule      = aws_cloudwatch_event_rule.data_ingestion_schedule.name
-  target_id = "DataIngestionLambdaTarget"
-  arn       = aws_lambda_function.data_ingestion.arn
+# CloudWatch Events target for the scheduler Lambda
+resource "aws_cloudwatch_event_target" "scheduler_target" {
+  rule      = aws_cloudwatch_event_rule.scheduler_tick.name
+  target_id = "SchedulerLambdaTarget"
+  arn       = aws_lambda_function.scheduler.arn
 }
 
 # Permission for CloudWatch Events to invoke Lambda
-resource "aws_lambda_permission" "allow_cloudwatch_data_ingestion" {
+resource "aws_lambda_permission" "allow_cloudwatch_scheduler" {
   statement_id  = "AllowExecutionFromCloudWatch"
   action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.data_ingestion.function_name
+  function_name = aws_lambda_function.scheduler.function_name
   principal     = "events.amazonaws.com"
-  source_arn    = aws_cloudwatch_event_rule.data_ingestion_schedule.arn
-}
\ No newline at end of file
+  source_arn    = aws_cloudwatch_event_rule.scheduler_tick.arn
+}
+
+# Daily archive compaction, once the previous UTC day is complete
+resource "aws_cloudwatch_event_rule" "archive_daily" {
+  name                = "${var.project_name}-archive-daily-${var.environment}"
+  description         = "Compact expiring market data and predictions into Parquet daily"
+  schedule_expression = "cron(30 0 * * ? *)"
+  tags                = local.common_tags
+}
+
+resource "aws_cloudwatch_event_target" "archive_target" {
+  rule      = aws_cloudwatch_event_rule.archive_daily.name
+  target_id = "ArchiveLambdaTarget"
+  arn       = aws_lambda_function.archive.arn
+}
+
+resource "aws_lambda_permission" "allow_cloudwatch_archive" {
+  statement_id  = "AllowExecutionFromCloudWatch"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.archive.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.archive_daily.arn
+}
@@ -39,13 +39,16 @@ resource "aws_iam_policy" "lambda_policy" {
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
-          "dynamodb:Scan"
+          "dynamodb:Scan",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:BatchGetItem"
         ]
         Resource = [
           aws_dynamodb_table.pattern_cache.arn,
           aws_dynamodb_table.market_data.arn,
           aws_dynamodb_table.predictions.arn,
-          "${aws_dynamodb_table.predictions.arn}/index/*"
+          "${aws_dynamodb_table.predictions.arn}/index/*",
+          aws_dynamodb_table.analysis_inflight.arn
         ]
       },
       {
@@ -70,6 +73,16 @@ resource "aws_iam_policy" "lambda_policy" {
           aws_s3_bucket.lambda_artifacts.arn
         ]
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = [
+          aws_lambda_function.data_ingestion.arn,
+          aws_lambda_function.pattern_analysis.arn
+        ]
+      },
       {
         Effect = "Allow"
         Action = [
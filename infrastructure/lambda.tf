@@ -37,6 +37,10 @@ resource "aws_lambda_function" "pattern_analysis" {
       CHARTS_BUCKET       = aws_s3_bucket.charts.bucket
       MARKET_DATA_TABLE   = aws_dynamodb_table.market_data.name
       ENVIRONMENT         = var.environment
+      # 3008 MB gets 2 vCPUs; the ViT graph is a linear chain so inter-op stays at 1
+      ONNX_INTRA_OP_THREADS         = "2"
+      ONNX_INTER_OP_THREADS         = "1"
+      ONNX_GRAPH_OPTIMIZATION_LEVEL = "all"
     }
   }
 
@@ -64,6 +68,7 @@ resource "aws_lambda_function" "api_handler" {
       PREDICTIONS_TABLE   = aws_dynamodb_table.predictions.name
       CHARTS_BUCKET       = aws_s3_bucket.charts.bucket
       ENVIRONMENT         = var.environment
+      INFLIGHT_TABLE      = aws_dynamodb_table.analysis_inflight.name
     }
   }
 
@@ -71,6 +76,53 @@ resource "aws_lambda_function" "api_handler" {
   tags       = local.common_tags
 }
 
+# Lambda function fanning out due symbols to ingestion and analysis every minute
+resource "aws_lambda_function" "scheduler" {
+  filename      = "../backend/dist/scheduler.zip"
+  function_name = "${var.project_name}-scheduler-${var.environment}"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "index.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = 60
+  memory_size   = 256
+
+  environment {
+    variables = {
+      ENVIRONMENT          = var.environment
+      INGESTION_FUNCTION   = aws_lambda_function.data_ingestion.function_name
+      ANALYSIS_FUNCTION    = aws_lambda_function.pattern_analysis.function_name
+      INGESTION_BATCH_SIZE = "100"
+      ANALYSIS_BATCH_SIZE  = "10"
+    }
+  }
+
+  depends_on = [aws_cloudwatch_log_group.scheduler]
+  tags       = local.common_tags
+}
+
+# Lambda function compacting expiring DynamoDB rows into the Parquet archive daily
+resource "aws_lambda_function" "archive" {
+  filename      = "../backend/dist/archive.zip"
+  function_name = "${var.project_name}-archive-${var.environment}"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "index.lambda_handler"
+  runtime       = "python3.11"
+  timeout       = 900
+  memory_size   = 1024
+
+  environment {
+    variables = {
+      MARKET_DATA_TABLE = aws_dynamodb_table.market_data.name
+      PREDICTIONS_TABLE = aws_dynamodb_table.predictions.name
+      CHARTS_BUCKET     = aws_s3_bucket.charts.bucket
+      ENVIRONMENT       = var.environment
+    }
+  }
+
+  depends_on = [aws_cloudwatch_log_group.archive]
+  tags       = local.common_tags
+}
+
 # CloudWatch Log Groups
 resource "aws_cloudwatch_log_group" "data_ingestion" {
   name              = "/aws/lambda/${var.project_name}-data-ingestion-${var.environment}"
@@ -88,4 +140,16 @@ resource "aws_cloudwatch_log_group" "api_handler" {
   name              = "/aws/lambda/${var.project_name}-api-handler-${var.environment}"
   retention_in_days = 14
   tags              = local.common_tags
-}
\ No newline at end of file
+}
+
+resource "aws_cloudwatch_log_group" "scheduler" {
+  name              = "/aws/lambda/${var.project_name}-scheduler-${var.environment}"
+  retention_in_days = 14
+  tags              = local.common_tags
+}
+
+resource "aws_cloudwatch_log_group" "archive" {
+  name              = "/aws/lambda/${var.project_name}-archive-${var.environment}"
+  retention_in_days = 14
+  tags              = local.common_tags
+}
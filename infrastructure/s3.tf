@@ -28,7 +28,10 @@ resource "aws_s3_bucket_lifecycle_configuration" "charts" {
     id     = "cleanup_old_charts"
     status = "Enabled"
 
-    filter {}
+    # Only chart images expire; the archive/ prefix is kept
+    filter {
+      prefix = "charts/"
+    }
 
     expiration {
       days = 30
@@ -38,6 +41,24 @@ resource "aws_s3_bucket_lifecycle_configuration" "charts" {
       noncurrent_days = 7
     }
   }
+
+  rule {
+    id     = "cleanup_old_profiles"
+    status = "Enabled"
+
+    # Opt-in profiler output (profiling.py) is only useful for a short while
+    filter {
+      prefix = "profiles/"
+    }
+
+    expiration {
+      days = 14
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
 }
 
 resource "aws_s3_bucket_public_access_block" "charts" {